@@ -0,0 +1,52 @@
+"""
+Кэш прав администраторов для проверки доступа к командам бота
+"""
+
+from types import MappingProxyType
+
+from cache_versions import VersionedCache
+from config import config
+from database import Admin, session_scope
+
+ADMINS_CACHE = 'admins'
+
+
+class AdminSnapshot:
+    """Неизменяемый снимок активных администраторов: telegram_id -> роль"""
+
+    def __init__(self, roles):
+        self.roles = MappingProxyType(dict(roles))
+
+    def is_admin(self, telegram_id):
+        return telegram_id in self.roles
+
+    def role(self, telegram_id):
+        return self.roles.get(telegram_id)
+
+
+def _load_admins():
+    with session_scope() as session:
+        rows = session.query(Admin.telegram_id, Admin.role).filter_by(is_active=True).all()
+    return AdminSnapshot(rows)
+
+
+_cache = VersionedCache(
+    ADMINS_CACHE,
+    _load_admins,
+    check_interval=config.CACHE_VERSION_CHECK_INTERVAL,
+    ttl=config.ADMIN_CACHE_TTL
+)
+
+
+def get_admins():
+    """Текущий снимок администраторов"""
+    return _cache.get()
+
+
+def invalidate_admins_cache():
+    """Сброс кэша после добавления, деактивации или удаления администратора.
+
+    В транзакции изменения нужно также вызвать bump_version(session, ADMINS_CACHE),
+    чтобы кэш сбросили остальные воркеры.
+    """
+    _cache.invalidate()
@@ -1,55 +1,138 @@
-from flask import Flask, request, jsonify, render_template, render_template_string
+from flask import Flask, Response, g, request, jsonify, render_template, render_template_string, stream_with_context
 from telegram import Update, Bot, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import Dispatcher, CommandHandler, MessageHandler, Filters, CallbackContext, ConversationHandler
+from telegram.utils.request import Request
 import logging
 import os
 import json
+import atexit
 from datetime import datetime, timedelta
 from functools import wraps
 import threading
 import time
-# from sqlalchemy import ForeignKey
-# from sqlalchemy.orm import relationship
+from sqlalchemy import text
+from sqlalchemy.orm import joinedload
 
 from config import config
-from database import init_db, get_session, Registration, Admin, Event, session_scope
+import database
+from database import (
+    init_db, get_read_session, Registration, Admin, Event, session_scope, read_session_scope
+)
+from db_pool import db_threads_per_worker
+import query_counter
+from query_counter import track_queries, check_budget
+from update_queue import UpdateQueue
+from chat_dispatch import ChatOrderedExecutor, get_update_key
+from persistence import create_persistence
+from delivery import DeliveryEngine
+from outbox import OutboxRelay, enqueue_message
+from cache_versions import bump_version
+from events_cache import EVENTS_CACHE, get_active_events, invalidate_events_cache
+from admin_cache import ADMINS_CACHE, get_admins, invalidate_admins_cache
+from registration_queries import QueryParamError, fetch_page, user_registrations_query
+from export import EXPORT_FORMATS, build_export_query, stream_export
+from stats import get_status_counts, count_by, count_by_event, record_status_change
+from registration_search import search_registrations
+from registration_service import bulk_change_status, change_status, parse_bulk_request
+from health_prober import HealthProber
+from profiling import MemoryTracker, Profiler
+from metrics import (
+    HTTP_REQUEST_DURATION, UPDATES_TOTAL, InstrumentedBot, instrument_handler,
+    register_gauge, register_pool_gauges, render_metrics
+)
+from change_feed import fetch_changes, record_tombstones
+from cleanup_jobs import CLEANUP_TYPES, CleanupRunner, get_job, preview_counts
 
 # ===== Инициализация приложения =====
+# Импорт модуля не обращается ни к БД, ни к Telegram: БД и бот
+# инициализируются в фоне из create_app() или при первом обращении
 app = Flask(__name__)
 app.secret_key = config.SECRET_KEY
 
 # Автоматически определяем папку с шаблонами
 app.template_folder = 'templates'  # Явно указываем папку templates
-print(f"✅ Шаблоны из папки: {app.template_folder}")
-
-# Инициализация БД
-try:
-    init_db()
-    print("✅ База данных инициализирована")
-except Exception as e:
-    print(f"❌ Ошибка инициализации БД: {e}")
-
-# Логирование
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=getattr(logging, config.LOG_LEVEL)
-)
+
 logger = logging.getLogger(__name__)
 
 # ===== Глобальные переменные для бота =====
 bot_instance = None
 dp_instance = None
 
+_db_ready = False
+_db_lock = threading.Lock()
+_dispatcher_lock = threading.Lock()
+
+def ensure_db():
+    """Инициализация БД при первом обращении (один раз на процесс)"""
+    global _db_ready
+    if not _db_ready:
+        with _db_lock:
+            if not _db_ready:
+                init_db()
+                _db_ready = True
+
+def bot_request():
+    """HTTP-пул бота: по умолчанию у PTB одно соединение, а к Bot API
+    одновременно обращаются пул отправки и все потоки воркера, работающие
+    с БД (потоки gunicorn, диспетчер, очередь вебхука, фоновые задачи)"""
+    return Request(con_pool_size=db_threads_per_worker() + config.DELIVERY_WORKERS)
+
 def get_bot():
     global bot_instance
     if bot_instance is None:
         try:
-            bot_instance = Bot(token=config.TELEGRAM_TOKEN)
+            bot_instance = InstrumentedBot(token=config.TELEGRAM_TOKEN, request=bot_request())
             logger.info(f"✅ Бот инициализирован: {bot_instance.get_me().first_name}")
         except Exception as e:
             logger.error(f"❌ Ошибка инициализации бота: {e}")
     return bot_instance
 
+delivery_engine = None
+
+def get_delivery():
+    """Пул отправки исходящих сообщений с учетом лимитов Telegram"""
+    global delivery_engine
+    if delivery_engine is None:
+        delivery_engine = DeliveryEngine(
+            get_bot,
+            workers=config.DELIVERY_WORKERS,
+            global_rate=config.DELIVERY_GLOBAL_RATE,
+            chat_rate=config.DELIVERY_CHAT_RATE,
+            max_retries=config.DELIVERY_MAX_RETRIES
+        )
+        atexit.register(delivery_engine.stop)
+    return delivery_engine
+
+outbox_relay = None
+
+def get_outbox_relay():
+    """Фоновая отправка уведомлений, записанных в outbox"""
+    global outbox_relay
+    if outbox_relay is None:
+        outbox_relay = OutboxRelay(
+            lambda chat_id, text: get_delivery().send_message(chat_id, text),
+            batch_size=config.OUTBOX_BATCH_SIZE,
+            poll_interval=config.OUTBOX_POLL_INTERVAL,
+            max_attempts=config.OUTBOX_MAX_ATTEMPTS,
+            sent_retention_hours=config.OUTBOX_SENT_RETENTION_HOURS,
+            failed_retention_hours=config.OUTBOX_FAILED_RETENTION_HOURS
+        )
+        outbox_relay.start()
+        atexit.register(outbox_relay.stop)
+    return outbox_relay
+
+cleanup_runner = None
+
+def get_cleanup_runner():
+    """Фоновые задачи очистки заявок"""
+    global cleanup_runner
+    if cleanup_runner is None:
+        cleanup_runner = CleanupRunner(
+            chunk_size=config.CLEANUP_CHUNK_SIZE,
+            pause=config.CLEANUP_CHUNK_PAUSE
+        )
+    return cleanup_runner
+
 # ===== Вспомогательные функции для шаблонов =====
 @app.template_filter('datetimeformat')
 def datetimeformat(value, format='%d.%m.%Y %H:%M'):
@@ -93,11 +176,9 @@ def admin_required(func):
     @wraps(func)
     def wrapper(update: Update, context: CallbackContext):
         user_id = update.message.from_user.id
-        with session_scope() as session:
-            admin = session.query(Admin).filter_by(telegram_id=user_id, is_active=True).first()
-            if not admin:
-                update.message.reply_text("❌ У вас нет прав администратора.")
-                return
+        if not get_admins().is_admin(user_id):
+            update.message.reply_text("❌ У вас нет прав администратора.")
+            return
         return func(update, context)
     return wrapper
 
@@ -105,7 +186,7 @@ def super_admin_required(func):
     @wraps(func)
     def wrapper(update: Update, context: CallbackContext):
         user_id = update.message.from_user.id
-        if user_id not in config.get_admin_ids():
+        if user_id not in config.get_admin_id_set():
             update.message.reply_text("❌ Только супер-админы могут использовать эту команду.")
             return
         return func(update, context)
@@ -251,62 +332,39 @@ def get_phone(update: Update, context: CallbackContext) -> int:
 
 def get_event(update: Update, context: CallbackContext) -> int:
     """Выбор события/соревнования"""
-    with session_scope() as session:
-        # Получаем активные события (будущие)
-        events = session.query(Event).filter(
-            Event.is_active == True,
-            Event.event_date >= datetime.now().date()
-        ).order_by(Event.event_date).all()
-        
-        if not events:
-            update.message.reply_text(
-                "❌ В данный момент нет доступных соревнований для регистрации.\n"
-                "Попробуйте позже или обратитесь к организаторам."
-            )
-            return ConversationHandler.END
-        
-        # Создаем клавиатуру с событиями
-        kb = [[f"{e.name} ({e.event_date.strftime('%d.%m.%Y')})"] for e in events]
-        rm = ReplyKeyboardMarkup(kb, one_time_keyboard=True, resize_keyboard=True)
-        
-        event_list = "\n".join([f"{i+1}. {e.name} - {e.event_date.strftime('%d.%m.%Y')}" 
-                               for i, e in enumerate(events)])
-        
+    # Активные события (будущие) из кэша, без запроса к БД
+    events = get_active_events()
+    
+    if not events.events:
         update.message.reply_text(
-            f"📅 *Выберите соревнование:*\n\n{event_list}\n\n"
-            "Нажмите на нужное соревнование в клавиатуре ниже:",
-            parse_mode='Markdown',
-            reply_markup=rm
+            "❌ В данный момент нет доступных соревнований для регистрации.\n"
+            "Попробуйте позже или обратитесь к организаторам."
         )
-        return EVENT
+        return ConversationHandler.END
+    
+    update.message.reply_text(
+        f"📅 *Выберите соревнование:*\n\n{events.event_list}\n\n"
+        "Нажмите на нужное соревнование в клавиатуре ниже:",
+        parse_mode='Markdown',
+        reply_markup=events.keyboard
+    )
+    return EVENT
 
 def select_event(update: Update, context: CallbackContext) -> int:
     """Обработка выбора события"""
     event_choice = update.message.text
     
-    with session_scope() as session:
-        # Пытаемся найти событие по названию и дате
-        events = session.query(Event).filter(
-            Event.is_active == True,
-            Event.event_date >= datetime.now().date()
-        ).all()
-        
-        selected_event = None
-        for event in events:
-            event_str = f"{event.name} ({event.event_date.strftime('%d.%m.%Y')})"
-            if event_choice == event_str:
-                selected_event = event
-                break
-        
-        if not selected_event:
-            update.message.reply_text(
-                "❌ Пожалуйста, выберите соревнование из списка ниже.",
-                reply_markup=None
-            )
-            return get_event(update, context)
-        
-        context.user_data['event_id'] = selected_event.id
-        context.user_data['event_name'] = selected_event.name
+    # Ищем событие по подписи кнопки (название и дата)
+    selected_event = get_active_events().find(event_choice)
+    
+    if not selected_event:
+        update.message.reply_text(
+            "❌ Пожалуйста, выберите соревнование из списка ниже.",
+            reply_markup=None
+        )
+        return get_event(update, context)
+    
+    context.user_data['event_id'], context.user_data['event_name'] = selected_event
     
     update.message.reply_text(
         "Опишите ваш опыт, достижения, разряды и стаж занятий:\n\n"
@@ -356,6 +414,7 @@ def confirm_registration(update: Update, context: CallbackContext) -> int:
         return NAME
 
     data = context.user_data
+    admin_ids = config.get_admin_ids()
     
     with session_scope() as session:
         reg = Registration(
@@ -371,14 +430,12 @@ def confirm_registration(update: Update, context: CallbackContext) -> int:
             event_id=data.get('event_id')
         )
         session.add(reg)
-        session.commit()  # Явный коммит для получения ID
-    
-    # Уведомляем администраторов - ПРОСТОЙ ТЕКСТ БЕЗ РАЗМЕТКИ
-    admin_ids = config.get_admin_ids()
-    bot = get_bot()
-    if admin_ids and bot:
-        # Простой текст без Markdown
-        notification = f"""📥 Новая заявка на регистрацию
+        record_status_change(session, None, 'pending')
+        
+        # Уведомляем администраторов - ПРОСТОЙ ТЕКСТ БЕЗ РАЗМЕТКИ
+        if admin_ids:
+            # Простой текст без Markdown
+            notification = f"""📥 Новая заявка на регистрацию
 
 ФИО: {data['full_name']}
 Оружие: {data['weapon_type']}
@@ -386,12 +443,13 @@ def confirm_registration(update: Update, context: CallbackContext) -> int:
 Соревнование: {data.get('event_name', 'Не указано')}
 
 Для просмотра заявок используйте команду /admin_stats"""
-        
-        for admin_id in admin_ids:
-            try:
-                bot.send_message(admin_id, notification)  # Без parse_mode вообще
-            except Exception as e:
-                logger.error(f"Не удалось уведомить админа {admin_id}: {e}")
+            
+            # Уведомления уходят из outbox в фоне после коммита заявки
+            for admin_id in admin_ids:
+                enqueue_message(session, admin_id, notification)
+    
+    if admin_ids:
+        get_outbox_relay().notify()
     
     update.message.reply_text(
         "✅ *Заявка успешно отправлена!*\n\n"
@@ -417,10 +475,8 @@ def cancel(update: Update, context: CallbackContext) -> int:
 
 def view_registrations(update: Update, context: CallbackContext):
     """Просмотр заявок пользователя"""
-    with session_scope() as session:
-        regs = session.query(Registration).filter_by(
-            telegram_id=update.message.from_user.id
-        ).order_by(Registration.created_at.desc()).all()
+    with read_session_scope() as session:
+        regs = user_registrations_query(session, update.message.from_user.id).all()
         
         if not regs:
             update.message.reply_text("📭 У вас пока нет заявок.\nИспользуйте /start для регистрации.")
@@ -471,20 +527,16 @@ def help_command(update: Update, context: CallbackContext):
 @admin_required
 def admin_stats(update: Update, context: CallbackContext):
     """Статистика для администраторов"""
-    with session_scope() as session:
-        regs = session.query(Registration).all()
-        total = len(regs)
-        pending = len([r for r in regs if r.status == 'pending'])
-        confirmed = len([r for r in regs if r.status == 'confirmed'])
-        rejected = len([r for r in regs if r.status == 'rejected'])
+    with read_session_scope() as session:
+        counts = get_status_counts(session)
 
         stats = f"""
 📊 *Статистика:*
 
-• Всего заявок: {total}
-• Ожидают: {pending}
-• Подтверждены: {confirmed}
-• Отклонены: {rejected}
+• Всего заявок: {counts['total']}
+• Ожидают: {counts['pending']}
+• Подтверждены: {counts['confirmed']}
+• Отклонены: {counts['rejected']}
         """
         update.message.reply_text(stats, parse_mode='Markdown')
 
@@ -512,6 +564,8 @@ def admin_add(update: Update, context: CallbackContext):
                 created_by=update.message.from_user.id
             )
             session.add(new_admin)
+            bump_version(session, ADMINS_CACHE)
+        invalidate_admins_cache()
         update.message.reply_text(f"✅ Админ {tid} добавлен как {role}")
     except ValueError:
         update.message.reply_text("❌ Неверный ID")
@@ -535,35 +589,180 @@ def setup_dispatcher():
         logger.error("❌ Не удалось инициализировать бота для диспетчера")
         return None
     
+    persistence = create_persistence()
+    if persistence:
+        atexit.register(persistence.flush)
+    
     conv_handler = ConversationHandler(
-        entry_points=[CommandHandler('start', start)],
+        entry_points=[CommandHandler('start', instrument_handler(start))],
         states={
-            NAME: [MessageHandler(Filters.text & ~Filters.command, get_name)],
-            WEAPON: [MessageHandler(Filters.text & ~Filters.command, get_weapon)],
-            CATEGORY: [MessageHandler(Filters.text & ~Filters.command, get_category)],
-            AGE: [MessageHandler(Filters.text & ~Filters.command, get_age)],
-            PHONE: [MessageHandler(Filters.text | Filters.contact, get_phone)],
-            EVENT: [MessageHandler(Filters.text & ~Filters.command, select_event)],
-            EXPERIENCE: [MessageHandler(Filters.text & ~Filters.command, get_experience)],
-            CONFIRM: [MessageHandler(Filters.text & ~Filters.command, confirm_registration)],
+            NAME: [MessageHandler(Filters.text & ~Filters.command, instrument_handler(get_name, 'NAME'))],
+            WEAPON: [MessageHandler(Filters.text & ~Filters.command, instrument_handler(get_weapon, 'WEAPON'))],
+            CATEGORY: [MessageHandler(Filters.text & ~Filters.command, instrument_handler(get_category, 'CATEGORY'))],
+            AGE: [MessageHandler(Filters.text & ~Filters.command, instrument_handler(get_age, 'AGE'))],
+            PHONE: [MessageHandler(Filters.text | Filters.contact, instrument_handler(get_phone, 'PHONE'))],
+            EVENT: [MessageHandler(Filters.text & ~Filters.command, instrument_handler(select_event, 'EVENT'))],
+            EXPERIENCE: [MessageHandler(Filters.text & ~Filters.command, instrument_handler(get_experience, 'EXPERIENCE'))],
+            CONFIRM: [MessageHandler(Filters.text & ~Filters.command, instrument_handler(confirm_registration, 'CONFIRM'))],
         },
-        fallbacks=[CommandHandler('cancel', cancel), CommandHandler('start', start)],
-        allow_reentry=True
+        fallbacks=[CommandHandler('cancel', instrument_handler(cancel)), CommandHandler('start', instrument_handler(start))],
+        allow_reentry=True,
+        name='registration',
+        persistent=persistence is not None
     )
 
-    dp = Dispatcher(bot, None, workers=1, use_context=True)
+    dp = Dispatcher(bot, None, workers=1, use_context=True, persistence=persistence)
     dp.add_handler(conv_handler)
-    dp.add_handler(CommandHandler('example', send_example))
-    dp.add_handler(CommandHandler('help', help_command))
-    dp.add_handler(CommandHandler('myregistrations', view_registrations))
-    dp.add_handler(CommandHandler('admin_stats', admin_stats))
-    dp.add_handler(CommandHandler('admin_add', admin_add))
-    dp.add_handler(CommandHandler('admin_list', admin_list))
+    dp.add_handler(CommandHandler('example', instrument_handler(send_example)))
+    dp.add_handler(CommandHandler('help', instrument_handler(help_command)))
+    dp.add_handler(CommandHandler('myregistrations', instrument_handler(view_registrations)))
+    dp.add_handler(CommandHandler('admin_stats', instrument_handler(admin_stats)))
+    dp.add_handler(CommandHandler('admin_add', instrument_handler(admin_add)))
+    dp.add_handler(CommandHandler('admin_list', instrument_handler(admin_list)))
     
     return dp
 
-# Инициализируем диспетчер
-dp_instance = setup_dispatcher()
+def get_dispatcher():
+    """Диспетчер Telegram, создается при первом обновлении или при прогреве"""
+    global dp_instance
+    if dp_instance is None:
+        with _dispatcher_lock:
+            if dp_instance is None:
+                ensure_db()
+                dp_instance = setup_dispatcher()
+    return dp_instance
+
+# Маршруты, которые отвечают без инициализации БД: главная, проверки
+# состояния (из кэша) и прием вебхука в режиме очереди (обновление
+# разбирает фоновый поток)
+LAZY_ENDPOINTS = {
+    'home', 'webhook', 'livez', 'readyz', 'health', 'metrics_endpoint', 'static',
+    'profiling_slow_api', 'memory_snapshot_api', 'memory_diff_api', 'memory_stop_api'
+}
+
+@app.before_request
+def ensure_initialized():
+    if request.endpoint not in LAZY_ENDPOINTS:
+        ensure_db()
+
+# ===== Подсчет SQL-запросов на HTTP-запрос =====
+@app.before_request
+def start_query_counter():
+    g.query_counter = query_counter.start(f"{request.method} {request.path}")
+
+@app.after_request
+def finish_query_counter(response):
+    counter = g.pop('query_counter', None)
+    if counter:
+        query_counter.stop(counter)
+        response.headers['X-SQL-Queries'] = str(counter.count)
+        logger.debug(f"{counter.label}: {counter.count} SQL-запросов")
+        check_budget(counter, config.SQL_QUERY_BUDGET, config.SQL_QUERY_BUDGET_STRICT)
+    return response
+
+@app.teardown_request
+def drop_query_counter(exc):
+    counter = g.pop('query_counter', None)
+    if counter:
+        query_counter.stop(counter)
+
+# ===== Метрики =====
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def observe_request_duration(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, request.method, route, response.status_code)
+    return response
+
+# ===== Профилирование =====
+profiler = Profiler(
+    sample_rate=config.PROFILE_SAMPLE_RATE,
+    slow_ms=config.PROFILE_SLOW_MS,
+    ring_size=config.PROFILE_RING_SIZE
+)
+memory_tracker = MemoryTracker(frames=config.TRACEMALLOC_FRAMES)
+
+@app.before_request
+def start_request_profile():
+    g.profile_run = profiler.start('request', f"{request.method} {request.path}")
+
+@app.teardown_request
+def finish_request_profile(exc):
+    run = g.pop('profile_run', None)
+    if run is not None:
+        run.handler = run.handler or request.endpoint
+        profiler.finish(run)
+
+@app.route('/api/profiling/slow')
+def profiling_slow_api():
+    """Медленные прогоны из выборки профилировщика (?full=1 - с профилем)"""
+    token = request.args.get('token')
+    if not token or token != config.SECRET_KEY:
+        return jsonify({'error': 'Invalid token'}), 403
+    
+    return jsonify({
+        'stats': profiler.stats(),
+        'slow': profiler.slow_runs(with_profile=request.args.get('full') == '1')
+    })
+
+@app.route('/api/profiling/memory/snapshot', methods=['POST'])
+def memory_snapshot_api():
+    """Базовый снимок tracemalloc (включает трассировку при первом вызове)"""
+    token = request.args.get('token')
+    if not token or token != config.SECRET_KEY:
+        return jsonify({'error': 'Invalid token'}), 403
+    
+    return jsonify(memory_tracker.snapshot())
+
+@app.route('/api/profiling/memory/diff')
+def memory_diff_api():
+    """Рост памяти с момента базового снимка"""
+    token = request.args.get('token')
+    if not token or token != config.SECRET_KEY:
+        return jsonify({'error': 'Invalid token'}), 403
+    
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    group_by = request.args.get('group_by', 'lineno')
+    if group_by not in ('lineno', 'filename', 'traceback'):
+        return jsonify({'error': 'Invalid group_by'}), 400
+    
+    diff = memory_tracker.diff(limit=limit, group_by=group_by)
+    if diff is None:
+        return jsonify({'error': 'No baseline snapshot, POST /api/profiling/memory/snapshot first'}), 409
+    return jsonify(diff)
+
+@app.route('/api/profiling/memory/stop', methods=['POST'])
+def memory_stop_api():
+    """Выключение tracemalloc"""
+    token = request.args.get('token')
+    if not token or token != config.SECRET_KEY:
+        return jsonify({'error': 'Invalid token'}), 403
+    
+    memory_tracker.stop()
+    return jsonify({'success': True})
+
+register_pool_gauges(lambda: database.engine)
+register_gauge('webhook_queue_depth', 'Обновления в очереди вебхука',
+               lambda: update_queue.depth if update_queue else None)
+register_gauge('dispatch_pending_updates', 'Обновления, ожидающие обработки в пуле по чатам',
+               lambda: chat_executor.stats()['pending'] if chat_executor else None)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Метрики в формате Prometheus"""
+    if config.METRICS_TOKEN:
+        token = request.args.get('token') or request.headers.get('Authorization', '').replace('Bearer ', '', 1)
+        if token != config.METRICS_TOKEN:
+            return jsonify({'error': 'Invalid token'}), 403
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
 
 # ===== Веб-маршруты Flask =====
 @app.route('/')
@@ -590,13 +789,16 @@ def admin_page():
     token = request.args.get('token')
     
     try:
-        with session_scope() as session:
-            total = session.query(Registration).count()
-            pending = session.query(Registration).filter_by(status='pending').count()
+        with read_session_scope() as session:
+            counts = get_status_counts(session)
+            total = counts['total']
+            pending = counts['pending']
             
             # Если запрошена простая версия, показываем только данные без API
             if simple_mode:
-                regs = session.query(Registration).order_by(Registration.created_at.desc()).limit(50).all()
+                regs = session.query(Registration).options(
+                    joinedload(Registration.event)
+                ).order_by(Registration.created_at.desc()).limit(50).all()
                 return render_template_string("""
                 <!DOCTYPE html>
                 <html>
@@ -675,40 +877,132 @@ def admin_page():
 
 @app.route('/api/registrations')
 def get_registrations_api():
-    """API для получения заявок"""
+    """API для получения заявок.
+
+    Параметры: limit, cursor (из next_cursor предыдущей страницы), фильтры
+    status, event_id, weapon_type, category, age_group, date_from, date_to
+    и список полей fields=id,full_name,...
+    """
     token = request.args.get('token')
     if not token or token != config.SECRET_KEY:
         return jsonify({'error': 'Invalid token'}), 403
     
     try:
-        status = request.args.get('status')
-        with session_scope() as session:
-            query = session.query(Registration)
-            if status:
-                query = query.filter_by(status=status)
-            regs = query.order_by(Registration.created_at.desc()).all()
-            
-            result = []
-            for r in regs:
-                result.append({
-                    'id': r.id,
-                    'full_name': r.full_name,
-                    'weapon_type': r.weapon_type,
-                    'category': r.category,
-                    'age_group': r.age_group,
-                    'phone': r.phone,
-                    'experience': r.experience,
-                    'status': r.status,
-                    'event_id': r.event_id,
-                    'event_name': r.event.name if r.event else None,
-                    'created_at': r.created_at.isoformat() if r.created_at else None
-                })
-            
-            return jsonify({'registrations': result, 'count': len(result)})
+        with read_session_scope() as session:
+            result, next_cursor = fetch_page(
+                session,
+                request.args,
+                default_limit=config.ITEMS_PER_PAGE,
+                max_limit=config.API_MAX_PAGE_SIZE
+            )
+            return jsonify({'registrations': result, 'count': len(result), 'next_cursor': next_cursor})
+    except QueryParamError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"API error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/registrations/search')
+def search_registrations_api():
+    """Поиск заявок: q (от 3 символов), limit, offset, fields и фильтры как у /api/registrations"""
+    token = request.args.get('token')
+    if not token or token != config.SECRET_KEY:
+        return jsonify({'error': 'Invalid token'}), 403
+    
+    try:
+        with read_session_scope() as session:
+            result, next_offset, mode = search_registrations(
+                session,
+                request.args,
+                default_limit=config.ITEMS_PER_PAGE,
+                max_limit=config.API_MAX_PAGE_SIZE
+            )
+            return jsonify({'registrations': result, 'count': len(result),
+                            'next_offset': next_offset, 'mode': mode})
+    except QueryParamError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Search API error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/registrations/export')
+def export_registrations_api():
+    """Потоковая выгрузка заявок (format=csv|ndjson) с фильтрами как у /api/registrations"""
+    token = request.args.get('token')
+    if not token or token != config.SECRET_KEY:
+        return jsonify({'error': 'Invalid token'}), 403
+    
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': 'Format must be csv or ndjson'}), 400
+    
+    session = get_read_session()
+    try:
+        query, fields = build_export_query(session, request.args)
+    except QueryParamError as e:
+        session.close()
+        return jsonify({'error': str(e)}), 400
+    
+    filename = f"registrations_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+    return Response(
+        stream_with_context(stream_export(session, query, fields, export_format)),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+@app.route('/api/stats')
+def get_stats_api():
+    """API статистики заявок по статусам, соревнованиям, оружию и категориям"""
+    token = request.args.get('token')
+    if not token or token != config.SECRET_KEY:
+        return jsonify({'error': 'Invalid token'}), 403
+    
+    try:
+        with read_session_scope() as session:
+            result = {'statuses': get_status_counts(session)}
+            if request.args.get('breakdown'):
+                result['by_event'] = [dict(counts, event_id=event_id)
+                                      for event_id, counts in count_by_event(session).items()]
+                result['by_weapon'] = count_by(session, Registration.weapon_type)
+                result['by_category'] = count_by(session, Registration.category)
+            return jsonify(result)
+    except Exception as e:
+        logger.error(f"Stats API error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def change_status_api(reg_id, new_status):
+    """Условная смена статуса заявки: ?expected=<статус>&version=<версия>"""
+    expected_version = request.args.get('version')
+    if expected_version is not None:
+        try:
+            expected_version = int(expected_version)
+        except ValueError:
+            return jsonify({'error': 'Invalid version'}), 400
+    
+    with session_scope() as session:
+        changed = change_status(
+            session, reg_id, new_status,
+            expected_status=request.args.get('expected') or None,
+            expected_version=expected_version
+        )
+        if not changed:
+            current = session.query(Registration.status, Registration.version).filter(Registration.id == reg_id).first()
+    
+    if changed:
+        get_outbox_relay().notify()
+        return jsonify({'success': True, 'changed': True, **changed})
+    
+    if not current:
+        return jsonify({'error': 'Registration not found'}), 404
+    if current.status == new_status:
+        # Повторный запрос (например, двойной клик): уведомление уже отправлено
+        return jsonify({'success': True, 'changed': False, 'status': current.status, 'version': current.version})
+    return jsonify({
+        'error': 'Registration was changed by someone else',
+        'status': current.status,
+        'version': current.version
+    }), 409
+
 @app.route('/api/registrations/<int:reg_id>/confirm')
 def confirm_registration_api(reg_id):
     """API для подтверждения заявки"""
@@ -717,34 +1011,7 @@ def confirm_registration_api(reg_id):
         return jsonify({'error': 'Invalid token'}), 403
     
     try:
-        with session_scope() as session:
-            reg = session.query(Registration).get(reg_id)
-            if not reg:
-                return jsonify({'error': 'Registration not found'}), 404
-            
-            reg.status = 'confirmed'
-            reg.updated_at = datetime.utcnow()
-            session.add(reg)
-            
-            bot = get_bot()
-            if bot:
-                try:
-                    # Простое уведомление без разметки
-                    bot.send_message(
-                        reg.telegram_id,
-                        f"✅ Ваша заявка #{reg.id} подтверждена!\n\n"
-                        f"Рады сообщить, что ваша заявка на участие в соревнованиях по фехтованию подтверждена.\n"
-                        f"Ждем вас на соревнованиях!\n\n"
-                        f"Детали заявки:\n"
-                        f"ФИО: {reg.full_name}\n"
-                        f"Оружие: {reg.weapon_type}\n"
-                        f"Категория: {reg.category}\n"
-                        f"Соревнование: {reg.event.name if reg.event else 'Не указано'}"
-                    )
-                except Exception as e:
-                    logger.error(f"Не удалось отправить уведомление пользователю {reg.telegram_id}: {e}")
-        
-        return jsonify({'success': True, 'status': 'confirmed'})
+        return change_status_api(reg_id, 'confirmed')
     except Exception as e:
         logger.error(f"Confirm API error: {e}")
         return jsonify({'error': str(e)}), 500
@@ -757,31 +1024,53 @@ def reject_registration_api(reg_id):
         return jsonify({'error': 'Invalid token'}), 403
     
     try:
+        return change_status_api(reg_id, 'rejected')
+    except Exception as e:
+        logger.error(f"Reject API error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/registrations/bulk-status', methods=['POST'])
+def bulk_status_api():
+    """API для массового подтверждения/отклонения заявок"""
+    token = request.args.get('token')
+    if not token or token != config.SECRET_KEY:
+        return jsonify({'error': 'Invalid token'}), 403
+    
+    try:
+        new_status, ids, filters = parse_bulk_request(request.get_json(silent=True))
         with session_scope() as session:
-            reg = session.query(Registration).get(reg_id)
-            if not reg:
-                return jsonify({'error': 'Registration not found'}), 404
-            
-            reg.status = 'rejected'
-            reg.updated_at = datetime.utcnow()
-            session.add(reg)
-            
-            bot = get_bot()
-            if bot:
-                try:
-                    # Простое уведомление без разметки
-                    bot.send_message(
-                        reg.telegram_id,
-                        f"❌ Ваша заявка #{reg.id} отклонена\n\n"
-                        f"К сожалению, ваша заявка на участие в соревнованиях была отклонена.\n"
-                        f"По вопросам обращайтесь к организаторам."
-                    )
-                except Exception as e:
-                    logger.error(f"Не удалось отправить уведомление пользователю {reg.telegram_id}: {e}")
+            changed = bulk_change_status(session, new_status, ids=ids, filters=filters)
         
-        return jsonify({'success': True, 'status': 'rejected'})
+        if changed:
+            get_outbox_relay().notify()
+        
+        result = {'success': True, 'status': new_status, 'changed': changed, 'changed_count': len(changed)}
+        if ids is not None:
+            # Заявки не найдены или уже не в статусе pending
+            changed_set = set(changed)
+            result['skipped'] = [reg_id for reg_id in ids if reg_id not in changed_set]
+        return jsonify(result)
+    except QueryParamError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        logger.error(f"Reject API error: {e}")
+        logger.error(f"Bulk status API error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/changes')
+def changes_api():
+    """Лента изменений заявок и событий после cursor (без cursor - закладка для полной загрузки)"""
+    token = request.args.get('token')
+    if not token or token != config.SECRET_KEY:
+        return jsonify({'error': 'Invalid token'}), 403
+    
+    try:
+        # Основная БД: отставание реплики могло бы пропустить изменения
+        with session_scope() as session:
+            return jsonify(fetch_changes(session, request.args))
+    except QueryParamError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Changes API error: {e}")
         return jsonify({'error': str(e)}), 500
 
 # ===== API для управления событиями =====
@@ -793,7 +1082,7 @@ def get_events_api():
         return jsonify({'error': 'Invalid token'}), 403
     
     try:
-        with session_scope() as session:
+        with read_session_scope() as session:
             events = session.query(Event).order_by(Event.event_date).all()
             result = [{
                 'id': e.id,
@@ -828,7 +1117,9 @@ def create_event_api():
                 is_active=True
             )
             session.add(event)
+            bump_version(session, EVENTS_CACHE)
         
+        invalidate_events_cache()
         return jsonify({'success': True, 'event': {
             'id': event.id,
             'name': event.name,
@@ -854,7 +1145,9 @@ def toggle_event_api(event_id):
             
             event.is_active = not event.is_active
             event.updated_at = datetime.utcnow()
+            bump_version(session, EVENTS_CACHE)
         
+        invalidate_events_cache()
         return jsonify({'success': True, 'is_active': event.is_active})
     except Exception as e:
         logger.error(f"Toggle event API error: {e}")
@@ -882,7 +1175,10 @@ def delete_event_api(event_id):
                 reg.event_id = None
             
             session.delete(event)
+            record_tombstones(session, 'event', [event_id])
+            bump_version(session, EVENTS_CACHE)
         
+        invalidate_events_cache()
         return jsonify({'success': True})
     except Exception as e:
         logger.error(f"Delete event API error: {e}")
@@ -897,94 +1193,122 @@ def preview_cleanup_api():
         return jsonify({'error': 'Invalid token'}), 403
     
     cleanup_type = request.args.get('type', 'past_events')
+    if cleanup_type not in CLEANUP_TYPES:
+        return jsonify({'error': 'Unknown cleanup type'}), 400
     
     try:
         with session_scope() as session:
-            count = 0
-            
-            if cleanup_type == 'past_events':
-                # Заявки на прошедшие события
-                count = session.query(Registration).join(Event).filter(
-                    Event.event_date < datetime.now().date()
-                ).count()
-            
-            elif cleanup_type == 'all_rejected':
-                # Все отклоненные заявки
-                count = session.query(Registration).filter_by(status='rejected').count()
-            
-            elif cleanup_type == 'all_old':
-                # Все заявки старше 30 дней
-                cutoff_date = datetime.utcnow() - timedelta(days=30)
-                count = session.query(Registration).filter(
-                    Registration.created_at < cutoff_date
-                ).count()
+            counts = preview_counts(session)
         
-        return jsonify({'count': count})
+        return jsonify({'count': counts[cleanup_type], 'counts': counts})
     except Exception as e:
         logger.error(f"Cleanup preview API error: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/cleanup/execute', methods=['POST'])
 def execute_cleanup_api():
-    """API для выполнения очистки"""
+    """API для запуска фоновой очистки"""
     token = request.args.get('token')
     if not token or token != config.SECRET_KEY:
         return jsonify({'error': 'Invalid token'}), 403
     
     cleanup_type = request.args.get('type', 'past_events')
+    if cleanup_type not in CLEANUP_TYPES:
+        return jsonify({'error': 'Unknown cleanup type'}), 400
+    
+    try:
+        job = get_cleanup_runner().start(cleanup_type)
+        return jsonify({'success': True, 'job_id': job['id'], 'job': job}), 202
+    except Exception as e:
+        logger.error(f"Cleanup execute API error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/cleanup/jobs/<job_id>')
+def cleanup_job_api(job_id):
+    """API для прогресса фоновой очистки"""
+    token = request.args.get('token')
+    if not token or token != config.SECRET_KEY:
+        return jsonify({'error': 'Invalid token'}), 403
     
     try:
         with session_scope() as session:
-            deleted_count = 0
-            
-            if cleanup_type == 'past_events':
-                # Удаляем заявки на прошедшие события
-                registrations = session.query(Registration).join(Event).filter(
-                    Event.event_date < datetime.now().date()
-                ).all()
-                
-                for reg in registrations:
-                    session.delete(reg)
-                    deleted_count += 1
-            
-            elif cleanup_type == 'all_rejected':
-                # Удаляем все отклоненные заявки
-                registrations = session.query(Registration).filter_by(status='rejected').all()
-                
-                for reg in registrations:
-                    session.delete(reg)
-                    deleted_count += 1
-            
-            elif cleanup_type == 'all_old':
-                # Удаляем все заявки старше 30 дней
-                cutoff_date = datetime.utcnow() - timedelta(days=30)
-                registrations = session.query(Registration).filter(
-                    Registration.created_at < cutoff_date
-                ).all()
-                
-                for reg in registrations:
-                    session.delete(reg)
-                    deleted_count += 1
-            
-            session.commit()
+            job = get_job(session, job_id)
         
-        return jsonify({'success': True, 'deleted_count': deleted_count})
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(job)
     except Exception as e:
-        logger.error(f"Cleanup execute API error: {e}")
+        logger.error(f"Cleanup job API error: {e}")
         return jsonify({'error': str(e)}), 500
 
+def dispatch_update(update):
+    """Обработка обновления диспетчером"""
+    dp = get_dispatcher()
+    if not dp:
+        logger.error("❌ Диспетчер не инициализирован")
+        return
+    UPDATES_TOTAL.inc()
+    with profiler.profile('update', f"update {update.update_id}"), \
+            track_queries(f"update {update.update_id}", config.SQL_QUERY_BUDGET, config.SQL_QUERY_BUDGET_STRICT):
+        dp.process_update(update)
+
+# Пул параллельной обработки с сохранением порядка внутри чата и очередь
+# входящих обновлений; создаются в start_update_workers()
+chat_executor = None
+update_queue = None
+
+def process_update_payload(payload, timeout=None):
+    """Разбор JSON обновления Telegram и передача его на обработку.
+
+    Возвращает False, если пул обработки переполнен.
+    """
+    update = Update.de_json(payload, get_bot())
+    if chat_executor:
+        return chat_executor.submit(get_update_key(update), update, timeout=timeout)
+    dispatch_update(update)
+    return True
+
+def start_update_workers():
+    """Запуск пула обработки и очереди обновлений (если включены)"""
+    global chat_executor, update_queue
+    if config.DISPATCH_WORKERS > 0 and chat_executor is None:
+        chat_executor = ChatOrderedExecutor(
+            dispatch_update,
+            workers=config.DISPATCH_WORKERS,
+            max_pending=config.DISPATCH_MAX_PENDING
+        )
+        atexit.register(chat_executor.stop)
+
+    if config.WEBHOOK_QUEUE_ENABLED and update_queue is None:
+        update_queue = UpdateQueue(
+            process_update_payload,
+            maxsize=config.WEBHOOK_QUEUE_SIZE,
+            # С пулом по чатам очередь только раздает обновления, и один поток
+            # сохраняет порядок их поступления
+            workers=1 if chat_executor else config.WEBHOOK_QUEUE_WORKERS,
+            overflow=config.WEBHOOK_QUEUE_OVERFLOW,
+            put_timeout=config.WEBHOOK_QUEUE_PUT_TIMEOUT
+        )
+        update_queue.start()
+        atexit.register(update_queue.stop)
+
 @app.route('/webhook', methods=['POST'])
 def webhook():
     """Endpoint для вебхука Telegram"""
-    if request.method == "POST":
-        try:
-            update = Update.de_json(request.get_json(force=True), get_bot())
-            if dp_instance:
-                dp_instance.process_update(update)
-            else:
-                logger.error("❌ Диспетчер не инициализирован")
-        except Exception as e:
-            logger.error(f"❌ Ошибка обработки webhook: {e}")
+    if update_queue:
+        payload = request.get_json(force=True, silent=True)
+        if not isinstance(payload, dict) or 'update_id' not in payload:
+            logger.error("❌ Некорректное обновление в webhook")
+            return 'bad request', 400
+        if not update_queue.put(payload):
+            return 'queue is full', 503
+        return 'ok'
+
+    try:
+        if not process_update_payload(request.get_json(force=True), timeout=config.DISPATCH_SUBMIT_TIMEOUT):
+            return 'dispatcher is busy', 503
+    except Exception as e:
+        logger.error(f"❌ Ошибка обработки webhook: {e}")
     return 'ok'
 
 @app.route('/set_webhook', methods=['GET'])
@@ -1013,29 +1337,70 @@ def set_webhook():
     except Exception as e:
         return f"❌ Ошибка установки webhook: {str(e)}", 500
 
+# ===== Проверки состояния =====
+def check_database():
+    ensure_db()
+    with session_scope() as session:
+        session.execute(text('SELECT 1'))
+    return 'connected'
+
+def check_bot():
+    if not get_bot():
+        raise RuntimeError('bot is not initialized')
+    return 'initialized'
+
+def check_webhook():
+    return bool(get_bot().get_webhook_info().url)
+
+health_prober = HealthProber(
+    {'database': check_database, 'bot': check_bot, 'webhook': check_webhook},
+    interval=config.HEALTH_PROBE_INTERVAL,
+    required=('database', 'bot')
+)
+
+@app.route('/livez')
+def livez():
+    """Процесс жив (без обращений к БД и Telegram)"""
+    return 'ok'
+
+@app.route('/readyz')
+def readyz():
+    """Готовность по последней фоновой проверке зависимостей"""
+    ready = health_prober.is_ready()
+    return jsonify({'ready': ready, 'checks': health_prober.results()}), (200 if ready else 503)
+
 @app.route('/health')
 def health():
-    """Проверка состояния сервиса"""
-    try:
-        with session_scope() as session:
-            session.execute('SELECT 1')
-            db_status = 'connected'
-    except Exception as e:
-        db_status = f'disconnected: {str(e)}'
+    """Проверка состояния сервиса (из кэша фоновых проверок)"""
+    checks = health_prober.results()
+    db_check = checks.get('database')
+    bot = checks.get('bot')
+    webhook = checks.get('webhook')
     
-    bot_status = 'initialized' if get_bot() else 'failed'
+    if not db_check:
+        db_status = 'initializing'
+    else:
+        db_status = db_check['value'] if db_check['ok'] else f"disconnected: {db_check['error']}"
     
     return jsonify({
         'status': 'healthy',
         'service': 'Tolyatti Fencing Bot',
         'database': db_status,
-        'bot': bot_status,
-        'webhook_set': bool(get_bot() and get_bot().get_webhook_info().url if get_bot() else False),
+        'bot': ('initialized' if bot['ok'] else 'failed') if bot else 'initializing',
+        'webhook_set': bool(webhook and webhook['ok'] and webhook['value']),
+        'ready': health_prober.is_ready(),
+        'checks': checks,
+        'webhook_queue': update_queue.stats() if update_queue else None,
+        'dispatch_pool': chat_executor.stats() if chat_executor else None,
+        'delivery': delivery_engine.stats() if delivery_engine else None,
+        'replica': database.replica_router.stats() if database.replica_router else None,
         'timestamp': datetime.utcnow().isoformat(),
         'version': '2.0.0',
         'endpoints': {
             'admin': '/admin',
             'health': '/health',
+            'livez': '/livez',
+            'readyz': '/readyz',
             'set_webhook': '/set_webhook'
         }
     })
@@ -1059,27 +1424,53 @@ def forbidden_error(error):
                          code=403, 
                          error="Доступ запрещен. У вас нет прав для просмотра этой страницы."), 403
 
-# ===== Функция для установки webhook при старте =====
-def setup_webhook_on_start():
-    """Установка вебхука при запуске приложения"""
-    def delayed_webhook_setup():
-        time.sleep(10)  # Ждем 10 секунд чтобы сервер запустился
-        try:
-            bot = get_bot()
-            if bot:
-                webhook_url = config.get_webhook_url()
-                bot.set_webhook(webhook_url)
-                logger.info(f"✅ Webhook установлен: {webhook_url}")
-        except Exception as e:
-            logger.error(f"❌ Ошибка установки webhook при старте: {e}")
-    
-    thread = threading.Thread(target=delayed_webhook_setup, daemon=True)
-    thread.start()
+# ===== Прогрев и фабрика приложения =====
+def warmup():
+    """Фоновая инициализация БД, бота, диспетчера и вебхука"""
+    started = time.monotonic()
+    try:
+        ensure_db()
+        logger.info("✅ База данных инициализирована")
+        
+        # Досылаем уведомления, оставшиеся в outbox
+        if config.OUTBOX_RELAY_ENABLED:
+            get_outbox_relay()
+        
+        if get_dispatcher():
+            webhook_url = config.get_webhook_url()
+            get_bot().set_webhook(webhook_url)
+            logger.info(f"✅ Webhook установлен: {webhook_url}")
+        
+        logger.info(f"🔥 Прогрев завершен за {time.monotonic() - started:.1f} с")
+    except Exception as e:
+        logger.error(f"❌ Ошибка прогрева: {e}")
 
-# Устанавливаем webhook при импорте модуля
-setup_webhook_on_start()
+_app_created = False
+
+def create_app():
+    """Фабрика приложения для gunicorn: app:create_app()
+
+    Возвращается сразу: порт открывается за миллисекунды, а БД, бот и
+    вебхук инициализируются в фоновом потоке.
+    """
+    global _app_created
+    if _app_created:
+        return app
+    _app_created = True
+    
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=getattr(logging, config.LOG_LEVEL)
+    )
+    config.validate()
+    
+    start_update_workers()
+    threading.Thread(target=warmup, name='warmup', daemon=True).start()
+    health_prober.start()
+    atexit.register(health_prober.stop)
+    return app
 
 # ===== Запуск приложения =====
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', config.PORT))
-    app.run(host='0.0.0.0', port=port, debug=config.DEBUG)
+    create_app().run(host='0.0.0.0', port=port, debug=config.DEBUG)
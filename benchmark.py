@@ -0,0 +1,384 @@
+#!/usr/bin/env python
+"""
+Нагрузочный тест регистрации: полные диалоги /start ... CONFIRM через /webhook
+
+Исходящие запросы бота уходят в локальную заглушку Bot API с настраиваемой
+задержкой, данные пишутся в SQLite (по умолчанию) или в указанную БД.
+
+    python benchmark.py --users 200 --threads 8 --api-latency 50
+    python benchmark.py --database-url postgresql://localhost/fencing_bench --json result.json
+
+Для Postgres используйте отдельную пустую базу: тест создает события и заявки.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+BENCH_TOKEN = '123456:benchmark'
+SECRET = 'benchmark-secret'
+ADMIN_ID = 1000
+
+# Шаги диалога: (состояние, в котором обрабатывается сообщение, текст)
+STATES = ('START', 'NAME', 'WEAPON', 'CATEGORY', 'AGE', 'PHONE', 'EVENT', 'EXPERIENCE', 'CONFIRM')
+
+
+class FakeBotAPI:
+    """Заглушка Telegram Bot API: отвечает успехом с задержкой latency"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = defaultdict(int)
+        self._lock = threading.Lock()
+        self._message_id = 0
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                method = self.path.rsplit('/', 1)[-1]
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                try:
+                    data = json.loads(body) if body else {}
+                except ValueError:
+                    data = {}
+                result = api.handle(method, data)
+                payload = json.dumps({'ok': True, 'result': result}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.port}/bot'
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='fake-bot-api', daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, method, data):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls[method] += 1
+            self._message_id += 1
+            message_id = self._message_id
+
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Benchmark', 'username': 'benchmark_bot'}
+        if method == 'getWebhookInfo':
+            return {'url': '', 'has_custom_certificate': False, 'pending_update_count': 0}
+        if method.startswith('send'):
+            return {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': int(data.get('chat_id') or 0), 'type': 'private'},
+                'text': data.get('text', '')
+            }
+        return True
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.calls)
+
+
+def percentile(values, p):
+    """Перцентиль по ближайшему рангу, мс"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index] * 1000
+
+
+def summarize(samples):
+    """samples: [(секунды, число SQL-запросов)]"""
+    latencies = [s[0] for s in samples]
+    sql = [s[1] for s in samples if s[1] is not None]
+    return {
+        'count': len(samples),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'sql_avg': round(sum(sql) / len(sql), 2) if sql else None,
+        'sql_max': max(sql) if sql else None
+    }
+
+
+def make_update(update_id, user_id, text):
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'Bench', 'username': f'bench_{user_id}'},
+        'text': text
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+def conversation(user_id, event_label, config):
+    return [
+        ('START', '/start'),
+        ('NAME', f'Участник Тестовый {user_id}'),
+        ('WEAPON', config.WEAPON_TYPES[user_id % len(config.WEAPON_TYPES)]),
+        ('CATEGORY', config.CATEGORIES[user_id % len(config.CATEGORIES)]),
+        ('AGE', config.AGE_GROUPS[user_id % len(config.AGE_GROUPS)]),
+        ('PHONE', f'+7999{user_id % 10000000:07d}'),
+        ('EVENT', event_label),
+        ('EXPERIENCE', 'КМС по фехтованию, 5 лет стажа, участник чемпионата области'),
+        ('CONFIRM', '✅ Да, всё верно'),
+    ]
+
+
+def run_registrations(app_module, users, threads, event_label, first_user_id):
+    """Прогон диалогов; пользователи распределены по потокам"""
+    samples = defaultdict(list)
+    errors = []
+    lock = threading.Lock()
+    update_ids = iter(range(1, 10 ** 9))
+    update_lock = threading.Lock()
+
+    def worker(user_ids):
+        client = app_module.app.test_client()
+        local = defaultdict(list)
+        for user_id in user_ids:
+            for state, text in conversation(user_id, event_label, app_module.config):
+                with update_lock:
+                    update_id = next(update_ids)
+                started = time.perf_counter()
+                response = client.post('/webhook', json=make_update(update_id, user_id, text))
+                elapsed = time.perf_counter() - started
+                sql = response.headers.get('X-SQL-Queries')
+                local[state].append((elapsed, int(sql) if sql else None))
+                if response.status_code != 200:
+                    with lock:
+                        errors.append(f'{state} {user_id}: HTTP {response.status_code}')
+        with lock:
+            for state, items in local.items():
+                samples[state].extend(items)
+
+    user_ids = list(range(first_user_id, first_user_id + users))
+    chunks = [user_ids[i::threads] for i in range(threads)]
+    workers = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks if chunk]
+
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return samples, elapsed, errors
+
+
+def wait_outbox(database, timeout=60):
+    """Ожидание отправки всех уведомлений из outbox"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with database.session_scope() as session:
+            pending = session.query(database.OutboxMessage).filter(
+                database.OutboxMessage.status.in_(('pending', 'sending'))
+            ).count()
+        if not pending:
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def run_admin_apis(app_module, iterations):
+    """Замеры админских API на накопленных заявках"""
+    client = app_module.app.test_client()
+    token = f'token={SECRET}'
+    results = {}
+
+    def measure(name, method, url, **kwargs):
+        items = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            response = getattr(client, method)(url, **kwargs)
+            response.get_data()  # дочитываем потоковые ответы
+            elapsed = time.perf_counter() - started
+            sql = response.headers.get('X-SQL-Queries')
+            items.append((elapsed, int(sql) if sql else None))
+            if response.status_code >= 400:
+                raise RuntimeError(f'{name}: HTTP {response.status_code} {response.get_data(as_text=True)[:200]}')
+        results[name] = summarize(items)
+
+    measure('admin page', 'get', f'/admin?{token}')
+    measure('registrations page', 'get', f'/api/registrations?{token}&limit=100')
+    measure('registrations filtered', 'get', f'/api/registrations?{token}&status=pending&weapon_type=Сабля')
+    measure('stats', 'get', f'/api/stats?{token}')
+    measure('stats breakdown', 'get', f'/api/stats?{token}&breakdown=1')
+    measure('events', 'get', f'/api/events?{token}')
+    measure('export csv', 'get', f'/api/registrations/export?{token}&format=csv')
+
+    # Смена статусов: одиночные и массовая
+    page = client.get(f'/api/registrations?{token}&status=pending&limit=500&fields=id').get_json()
+    pending_ids = [item['id'] for item in page.get('registrations', [])]
+    single, bulk = pending_ids[:iterations], pending_ids[iterations:iterations + 100]
+
+    items = []
+    for reg_id in single:
+        started = time.perf_counter()
+        response = client.get(f'/api/registrations/{reg_id}/confirm?{token}&expected=pending')
+        sql = response.headers.get('X-SQL-Queries')
+        items.append((time.perf_counter() - started, int(sql) if sql else None))
+    if items:
+        results['confirm single'] = summarize(items)
+
+    if bulk:
+        started = time.perf_counter()
+        response = client.post(f'/api/registrations/bulk-status?{token}', json={'action': 'confirm', 'ids': bulk})
+        sql = response.headers.get('X-SQL-Queries')
+        results[f'bulk confirm x{len(bulk)}'] = summarize([(time.perf_counter() - started, int(sql) if sql else None)])
+
+    return results
+
+
+def print_table(title, rows):
+    print(f"\n{title}")
+    print(f"{'':<24}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'SQL avg':>10}{'SQL max':>9}")
+    for name, s in rows.items():
+        sql_avg = '-' if s['sql_avg'] is None else s['sql_avg']
+        sql_max = '-' if s['sql_max'] is None else s['sql_max']
+        print(f"{name:<24}{s['count']:>8}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}{sql_avg:>10}{sql_max:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест регистрации через /webhook')
+    parser.add_argument('--users', type=int, default=100, help='число регистраций')
+    parser.add_argument('--threads', type=int, default=4, help='параллельных клиентов')
+    parser.add_argument('--api-latency', type=float, default=0, help='задержка заглушки Bot API, мс')
+    parser.add_argument('--database-url', default='', help='БД (по умолчанию временный SQLite)')
+    parser.add_argument('--persistence', default='', help="PERSISTENCE_BACKEND ('', database, sqlite)")
+    parser.add_argument('--admin-iterations', type=int, default=20, help='повторов каждого админского запроса')
+    parser.add_argument('--json', help='сохранить результат в JSON-файл')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='fencing-bench-')
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+    # Окружение задается до импорта config
+    os.environ.update({
+        'TELEGRAM_TOKEN': BENCH_TOKEN,
+        'WEBHOOK_URL': 'https://benchmark.invalid',
+        'DATABASE_URL': database_url,
+        'SECRET_KEY': SECRET,
+        'ADMIN_TELEGRAM_IDS': str(ADMIN_ID),
+        'WEBHOOK_QUEUE_ENABLED': 'False',
+        'DISPATCH_WORKERS': '0',
+        'PERSISTENCE_BACKEND': args.persistence,
+        'PERSISTENCE_SQLITE_PATH': os.path.join(workdir, 'state.db'),
+        'LOG_LEVEL': 'WARNING',
+        # Заглушка не ограничивает частоту: лимиты Telegram только растянули бы ожидание outbox
+        'DELIVERY_GLOBAL_RATE': '1000',
+        'DELIVERY_CHAT_RATE': '1000',
+    })
+
+    fake_api = FakeBotAPI(latency=args.api_latency / 1000)
+    fake_api.start()
+
+    import app as app_module
+    import database
+    from events_cache import event_label, invalidate_events_cache
+    from metrics import InstrumentedBot
+
+    app_module.bot_instance = InstrumentedBot(token=BENCH_TOKEN, base_url=fake_api.base_url,
+                                              request=app_module.bot_request())
+    app_module.ensure_db()
+
+    event_date = date.today() + timedelta(days=30)
+    with database.session_scope() as session:
+        event = database.Event(name='Бенчмарк-турнир', event_date=event_date, is_active=True)
+        session.add(event)
+        first_user_id = 10 ** 6 + session.query(database.Registration).count()
+    invalidate_events_cache()
+
+    app_module.get_dispatcher()
+    calls_before = fake_api.snapshot()
+
+    print(f"🤺 {args.users} регистраций, {args.threads} потоков, задержка Bot API {args.api_latency} мс")
+    print(f"   БД: {database.engine.url.render_as_string(hide_password=True)}")
+
+    samples, elapsed, errors = run_registrations(
+        app_module, args.users, args.threads, event_label('Бенчмарк-турнир', event_date), first_user_id
+    )
+    drained = wait_outbox(database)
+    calls_after = fake_api.snapshot()
+
+    with database.session_scope() as session:
+        registered = session.query(database.Registration).filter(
+            database.Registration.telegram_id >= first_user_id
+        ).count()
+
+    total_updates = sum(len(items) for items in samples.values())
+    calls = {m: calls_after.get(m, 0) - calls_before.get(m, 0) for m in calls_after}
+    total_calls = sum(calls.values())
+
+    per_state = {state: summarize(samples[state]) for state in STATES if samples.get(state)}
+    per_state['all updates'] = summarize([s for items in samples.values() for s in items])
+
+    print(f"\n✅ Зарегистрировано: {registered} из {args.users}, ошибок HTTP: {len(errors)}")
+    print(f"   Обновлений: {total_updates} за {elapsed:.2f} с - {total_updates / elapsed:.1f} обновлений/с")
+    print(f"   Запросов к Bot API: {total_calls} ({total_calls / max(registered, 1):.2f} на регистрацию): {calls}")
+    if not drained:
+        print("   ⚠️ outbox не опустел за отведенное время")
+    print_table('Задержка обработки обновления по состояниям', per_state)
+
+    admin = run_admin_apis(app_module, args.admin_iterations)
+    print_table('Админские API', admin)
+    # Уведомления о подтверждении заявок тоже должны уйти до остановки заглушки
+    wait_outbox(database)
+
+    for error in errors[:10]:
+        print(f"   ❌ {error}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'users': args.users,
+                'threads': args.threads,
+                'api_latency_ms': args.api_latency,
+                'database': database.engine.dialect.name,
+                'registered': registered,
+                'updates': total_updates,
+                'elapsed_s': round(elapsed, 3),
+                'updates_per_s': round(total_updates / elapsed, 1),
+                'bot_api_calls': calls,
+                'bot_api_calls_per_registration': round(total_calls / max(registered, 1), 2),
+                'states': per_state,
+                'admin': admin,
+                'errors': errors
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результат сохранен в {args.json}")
+
+    fake_api.stop()
+    return 0 if registered == args.users and not errors else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Версии кэшей, общие для всех воркеров
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime
+
+from database import CacheVersion, session_scope
+
+logger = logging.getLogger(__name__)
+
+
+def bump_version(session, name):
+    """Увеличение версии кэша в текущей транзакции.
+
+    Вызывается в той же транзакции, что и изменение данных, поэтому другие
+    воркеры увидят новую версию ровно тогда, когда увидят новые данные.
+    """
+    updated = session.query(CacheVersion).filter_by(name=name).update(
+        {'version': CacheVersion.version + 1, 'updated_at': datetime.utcnow()},
+        synchronize_session=False
+    )
+    if not updated:
+        session.add(CacheVersion(name=name, version=1))
+
+
+def read_version(name):
+    """Текущая версия кэша (0, если кэш еще ни разу не сбрасывался)"""
+    with session_scope() as session:
+        row = session.query(CacheVersion.version).filter_by(name=name).first()
+        return row[0] if row else 0
+
+
+class VersionedCache:
+    """Кэш в памяти процесса, проверяющий версию в БД не чаще check_interval секунд.
+
+    Между проверками значение отдается без обращений к БД. Изменения в этом
+    же воркере видны сразу после invalidate(), в других - не позже чем через
+    check_interval секунд. ttl (если задан) ограничивает возраст значения
+    независимо от версии.
+    """
+
+    def __init__(self, name, loader, check_interval=5.0, ttl=None):
+        self.name = name
+        self.loader = loader
+        self.check_interval = check_interval
+        self.ttl = ttl
+
+        self._value = None
+        self._version = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        value = self._value
+        now = time.monotonic()
+        if value is not None and now - self._checked_at < self.check_interval and not self._expired(now):
+            return value
+
+        with self._lock:
+            now = time.monotonic()
+            if self._value is not None and now - self._checked_at < self.check_interval and not self._expired(now):
+                return self._value
+
+            version = read_version(self.name)
+            self._checked_at = now
+            if self._value is None or version != self._version or self._expired(now):
+                self._value = self.loader()
+                self._version = version
+                self._loaded_at = now
+                logger.info(f"🔄 Кэш '{self.name}' обновлен (версия {version})")
+            return self._value
+
+    def _expired(self, now):
+        return self.ttl is not None and now - self._loaded_at >= self.ttl
+
+    def invalidate(self):
+        """Сброс значения в этом воркере"""
+        with self._lock:
+            self._value = None
@@ -0,0 +1,126 @@
+"""
+Лента изменений заявок и событий для админ-панели (/api/changes)
+
+Курсор - момент времени. Ответ содержит заявки и события с updated_at
+не раньше курсора и удаления (tombstones) за тот же период, поэтому
+стоимость обновления зависит от активности, а не от размера таблиц.
+
+Следующий курсор сдвигается на CHANGE_FEED_OVERLAP секунд назад:
+транзакция, записавшая updated_at до запроса, но зафиксированная после
+него, попадет в следующий ответ. Клиент применяет изменения как upsert
+по id, поэтому повторно полученные строки безвредны.
+"""
+
+import base64
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from config import config
+from database import Event, Registration, Tombstone
+from registration_queries import QueryParamError, build_query, parse_fields, row_to_dict
+
+logger = logging.getLogger(__name__)
+
+TOMBSTONE_ENTITIES = ('registration', 'event')
+
+# Старые удаления чистятся попутно с чтением ленты, не чаще раза в час на процесс
+PURGE_INTERVAL = 3600
+_last_purge = None
+_purge_lock = threading.Lock()
+
+
+def record_tombstones(session, entity, ids):
+    """Запись удалений в той же транзакции, что и DELETE"""
+    if not ids:
+        return
+    now = datetime.utcnow()
+    session.execute(insert(Tombstone), [
+        {'entity': entity, 'entity_id': entity_id, 'deleted_at': now} for entity_id in ids
+    ])
+
+
+def purge_tombstones(session):
+    """Удаление записей старше срока хранения; клиенты с более старым курсором загружают все заново"""
+    cutoff = datetime.utcnow() - timedelta(days=config.CHANGE_FEED_RETENTION_DAYS)
+    return session.query(Tombstone).filter(Tombstone.deleted_at < cutoff).delete(synchronize_session=False)
+
+
+def maybe_purge_tombstones(session):
+    """purge_tombstones, если в этом процессе она давно не выполнялась"""
+    global _last_purge
+    if session.info.get('read_only'):
+        return 0
+    with _purge_lock:
+        if _last_purge is not None and time.monotonic() - _last_purge < PURGE_INTERVAL:
+            return 0
+        _last_purge = time.monotonic()
+    deleted = purge_tombstones(session)
+    if deleted:
+        logger.info(f"🧹 Удалено устаревших записей об удалениях: {deleted}")
+    return deleted
+
+
+def encode_cursor(moment):
+    return base64.urlsafe_b64encode(moment.isoformat().encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        return datetime.fromisoformat(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode())
+    except Exception:
+        raise QueryParamError("Invalid cursor")
+
+
+def fetch_changes(session, args):
+    """Изменения после курсора args['cursor'].
+
+    Без курсора возвращается только курсор (закладка перед полной
+    загрузкой). resync=True означает, что изменений слишком много или
+    курсор старше срока хранения удалений и клиенту нужна полная загрузка.
+    """
+    fields = parse_fields(args.get('fields'))
+    maybe_purge_tombstones(session)
+    now = datetime.utcnow()
+    result = {
+        'cursor': encode_cursor(now - timedelta(seconds=config.CHANGE_FEED_OVERLAP)),
+        'resync': False,
+        'registrations': [],
+        'events': [],
+        'deleted': {'registrations': [], 'events': []}
+    }
+
+    cursor = args.get('cursor')
+    if not cursor:
+        return result
+    since = decode_cursor(cursor)
+    if since < now - timedelta(days=config.CHANGE_FEED_RETENTION_DAYS):
+        result['resync'] = True
+        return result
+
+    limit = config.CHANGE_FEED_MAX_ROWS
+
+    rows = build_query(session, {}, fields).filter(
+        Registration.updated_at >= since
+    ).order_by(Registration.updated_at, Registration.id).limit(limit + 1).all()
+
+    events = session.query(Event).filter(
+        Event.updated_at >= since
+    ).order_by(Event.updated_at, Event.id).limit(limit + 1).all()
+
+    tombstones = session.query(Tombstone.entity, Tombstone.entity_id).filter(
+        Tombstone.deleted_at >= since
+    ).order_by(Tombstone.deleted_at, Tombstone.id).limit(limit + 1).all()
+
+    if len(rows) > limit or len(events) > limit or len(tombstones) > limit:
+        result['resync'] = True
+        return result
+
+    result['registrations'] = [row_to_dict(row, fields) for row in rows]
+    result['events'] = [e.to_dict() for e in events]
+    for entity, entity_id in tombstones:
+        result['deleted'][entity + 's'].append(entity_id)
+    return result
@@ -0,0 +1,100 @@
+"""
+Параллельная обработка обновлений разных чатов с сохранением порядка внутри чата
+"""
+
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def get_update_key(update):
+    """Ключ упорядочивания: чат, иначе пользователь, иначе само обновление"""
+    if update.effective_chat:
+        return update.effective_chat.id
+    if update.effective_user:
+        return update.effective_user.id
+    return update.update_id
+
+
+class ChatOrderedExecutor:
+    """Пул потоков, в котором обновления одного чата выполняются строго по очереди.
+
+    Для каждого ключа хранится своя очередь; пока ключ есть в _pending, для
+    него уже запланирована задача-обработчик, и новые обновления только
+    добавляются в конец. Разные чаты обрабатываются параллельно.
+
+    max_pending ограничивает число принятых, но еще не обработанных
+    обновлений: submit() блокируется, пока не освободится место.
+    """
+
+    def __init__(self, process_func, workers=4, max_pending=1000):
+        self.process_func = process_func
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='chat-dispatch')
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._counters = {
+            'submitted': 0,
+            'processed': 0,
+            'failed': 0
+        }
+
+    def submit(self, key, item, timeout=None):
+        """Постановка обновления в очередь чата.
+
+        Возвращает False, если за timeout секунд не освободилось место.
+        """
+        if not self._slots.acquire(timeout=timeout):
+            return False
+
+        with self._lock:
+            self._counters['submitted'] += 1
+            items = self._pending.get(key)
+            if items is not None:
+                items.append(item)
+                return True
+            self._pending[key] = deque([item])
+
+        self._executor.submit(self._drain, key)
+        return True
+
+    def _drain(self, key):
+        while True:
+            with self._lock:
+                items = self._pending[key]
+                if not items:
+                    del self._pending[key]
+                    return
+                item = items.popleft()
+
+            try:
+                self.process_func(item)
+                counter = 'processed'
+            except Exception as e:
+                counter = 'failed'
+                logger.error(f"❌ Ошибка обработки обновления чата {key}: {e}")
+            finally:
+                self._slots.release()
+
+            with self._lock:
+                self._counters[counter] += 1
+
+    def stop(self, wait=True):
+        """Остановка пула после обработки уже принятых обновлений"""
+        self._executor.shutdown(wait=wait)
+        logger.info("🛑 Пул обработки обновлений остановлен")
+
+    def stats(self):
+        """Состояние пула для мониторинга"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['active_chats'] = len(self._pending)
+            stats['pending'] = sum(len(items) for items in self._pending.values())
+        stats['workers'] = self.workers
+        return stats
@@ -0,0 +1,169 @@
+"""
+Фоновая очистка заявок небольшими порциями
+"""
+
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, delete, func, select
+from sqlalchemy.exc import IntegrityError
+
+from database import CleanupJob, Event, Registration, session_scope
+from stats import record_deleted
+from change_feed import purge_tombstones, record_tombstones
+
+logger = logging.getLogger(__name__)
+
+CLEANUP_TYPES = ('past_events', 'all_rejected', 'all_old')
+
+# Задача без прогресса дольше этого времени считается прерванной
+STALE_JOB_SECONDS = 300
+
+
+def cleanup_condition(cleanup_type):
+    """Условие отбора заявок для типа очистки"""
+    if cleanup_type == 'past_events':
+        # Заявки на прошедшие события
+        past_events = select(Event.id).where(Event.event_date < datetime.now().date())
+        return Registration.event_id.in_(past_events)
+    if cleanup_type == 'all_rejected':
+        # Все отклоненные заявки
+        return Registration.status == 'rejected'
+    if cleanup_type == 'all_old':
+        # Все заявки старше 30 дней
+        return Registration.created_at < datetime.utcnow() - timedelta(days=30)
+    raise ValueError(f"Unknown cleanup type: {cleanup_type}")
+
+
+def preview_counts(session):
+    """Число заявок для каждого типа очистки одним запросом"""
+    columns = [
+        func.coalesce(func.sum(case((cleanup_condition(t), 1), else_=0)), 0).label(t)
+        for t in CLEANUP_TYPES
+    ]
+    row = session.query(*columns).select_from(Registration).one()
+    return {t: int(getattr(row, t)) for t in CLEANUP_TYPES}
+
+
+def delete_chunk(session, condition, chunk_size):
+    """Удаление одной порции; возвращает [(id, status)] удаленных заявок.
+
+    На PostgreSQL это один DELETE ... WHERE id IN (SELECT ... LIMIT n) RETURNING,
+    на остальных СУБД - выборка порции и DELETE по списку id.
+    """
+    chunk_ids = select(Registration.id).where(condition).limit(chunk_size)
+
+    if session.bind.dialect.name == 'postgresql':
+        stmt = delete(Registration).where(
+            Registration.id.in_(chunk_ids.scalar_subquery())
+        ).returning(Registration.id, Registration.status)
+        return [tuple(row) for row in session.execute(stmt)]
+
+    rows = [tuple(row) for row in session.execute(
+        select(Registration.id, Registration.status).where(condition).limit(chunk_size)
+    )]
+    if rows:
+        session.execute(
+            delete(Registration).where(Registration.id.in_([reg_id for reg_id, _ in rows])),
+            execution_options={'synchronize_session': False}
+        )
+    return rows
+
+
+class CleanupRunner:
+    """Запуск очисток в фоновых потоках.
+
+    Каждая порция удаляется и фиксируется отдельной транзакцией вместе с
+    прогрессом задачи в cleanup_jobs, поэтому блокировки держатся недолго,
+    а статус задачи можно запросить из любого воркера. Одновременный запуск
+    одного типа из разных воркеров отсекает уникальный индекс
+    idx_cleanup_jobs_running: проигравший возвращает задачу победителя.
+    """
+
+    def __init__(self, chunk_size=500, pause=0.05):
+        self.chunk_size = chunk_size
+        self.pause = pause
+
+    def start(self, cleanup_type):
+        """Создание задачи и запуск ее в фоне; возвращает словарь задачи"""
+        if cleanup_type not in CLEANUP_TYPES:
+            raise ValueError(f"Unknown cleanup type: {cleanup_type}")
+
+        with session_scope() as session:
+            running = session.query(CleanupJob).filter_by(cleanup_type=cleanup_type, status='running').first()
+            if running:
+                if running.updated_at and running.updated_at > datetime.utcnow() - timedelta(seconds=STALE_JOB_SECONDS):
+                    return running.to_dict()
+                # Воркер с этой задачей был перезапущен - начинаем заново
+                running.status = 'failed'
+                running.error = 'interrupted'
+                running.finished_at = datetime.utcnow()
+                session.flush()
+
+            job = CleanupJob(
+                id=uuid.uuid4().hex,
+                cleanup_type=cleanup_type,
+                status='running',
+                total=preview_counts(session)[cleanup_type],
+                deleted_count=0
+            )
+            try:
+                with session.begin_nested():
+                    session.add(job)
+            except IntegrityError:
+                # Задачу этого типа только что запустил другой воркер
+                running = session.query(CleanupJob).filter_by(cleanup_type=cleanup_type, status='running').one()
+                return running.to_dict()
+            job_dict = job.to_dict()
+
+        thread = threading.Thread(target=self._run, args=(job_dict['id'], cleanup_type),
+                                  name=f'cleanup-{job_dict["id"][:8]}', daemon=True)
+        thread.start()
+        return job_dict
+
+    def _run(self, job_id, cleanup_type):
+        logger.info(f"🗑️ Очистка {cleanup_type} запущена (задача {job_id})")
+        try:
+            with session_scope() as session:
+                purge_tombstones(session)
+
+            while True:
+                condition = cleanup_condition(cleanup_type)
+                with session_scope() as session:
+                    deleted = delete_chunk(session, condition, self.chunk_size)
+
+                    by_status = {}
+                    for _, status in deleted:
+                        by_status[status] = by_status.get(status, 0) + 1
+                    record_deleted(session, by_status)
+                    record_tombstones(session, 'registration', [reg_id for reg_id, _ in deleted])
+
+                    session.query(CleanupJob).filter_by(id=job_id).update(
+                        {'deleted_count': CleanupJob.deleted_count + len(deleted), 'updated_at': datetime.utcnow()},
+                        synchronize_session=False
+                    )
+
+                if len(deleted) < self.chunk_size:
+                    break
+                time.sleep(self.pause)
+
+            self._finish(job_id, 'done')
+            logger.info(f"✅ Очистка {cleanup_type} завершена (задача {job_id})")
+        except Exception as e:
+            logger.error(f"❌ Ошибка очистки {cleanup_type} (задача {job_id}): {e}")
+            self._finish(job_id, 'failed', str(e))
+
+    def _finish(self, job_id, status, error=None):
+        with session_scope() as session:
+            session.query(CleanupJob).filter_by(id=job_id).update(
+                {'status': status, 'error': error, 'finished_at': datetime.utcnow()},
+                synchronize_session=False
+            )
+
+
+def get_job(session, job_id):
+    job = session.query(CleanupJob).get(job_id)
+    return job.to_dict() if job else None
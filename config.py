@@ -12,6 +12,29 @@ class Config:
 
     ADMIN_TELEGRAM_IDS = os.environ.get('ADMIN_TELEGRAM_IDS', '')
     DATABASE_URL = os.environ.get('DATABASE_URL', '')
+    # Реплика для отчетов и списков (пусто - все запросы к основной БД);
+    # при отставании больше REPLICA_MAX_LAG секунд чтение идет с основной БД
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL', '')
+    REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 5))
+    REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', 5))
+
+    # Пул соединений: размер считается из числа воркеров и потоков gunicorn
+    # и лимита соединений БД (0 - запросить max_connections у Postgres)
+    WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+    GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', 2))
+    DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', 0))
+    DB_RESERVED_CONNECTIONS = int(os.environ.get('DB_RESERVED_CONNECTIONS', 3))
+    # Явные размеры пула (0 и -1 - посчитать автоматически)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 0))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', -1))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    # Проверка соединения перед выдачей только после такого простоя (секунды)
+    DB_PING_IDLE_SECONDS = float(os.environ.get('DB_PING_IDLE_SECONDS', 30))
+    # Работа через pgbouncer в режиме transaction pooling: без своего пула
+    # (DB_PGBOUNCER_POOL_SIZE=0) или с маленьким пулом
+    DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER', 'False').lower() == 'true'
+    DB_PGBOUNCER_POOL_SIZE = int(os.environ.get('DB_PGBOUNCER_POOL_SIZE', 0))
 
     PORT = int(os.environ.get('PORT', 10000))
     DEBUG = os.environ.get('DEBUG', 'False').lower() == 'true'
@@ -19,14 +42,89 @@ class Config:
 
     MAX_FILE_SIZE = int(os.environ.get('MAX_FILE_SIZE', 16 * 1024 * 1024))
     ITEMS_PER_PAGE = int(os.environ.get('ITEMS_PER_PAGE', 20))
+    API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 500))
+
+    # Бюджет SQL-запросов на HTTP-запрос / обновление Telegram (0 - без проверки);
+    # в strict-режиме превышение бросает QueryBudgetExceeded (для тестов)
+    SQL_QUERY_BUDGET = int(os.environ.get('SQL_QUERY_BUDGET', 0))
+    SQL_QUERY_BUDGET_STRICT = os.environ.get('SQL_QUERY_BUDGET_STRICT', 'False').lower() == 'true'
+
+    # Асинхронная обработка вебхука через очередь
+    WEBHOOK_QUEUE_ENABLED = os.environ.get('WEBHOOK_QUEUE_ENABLED', 'False').lower() == 'true'
+    WEBHOOK_QUEUE_SIZE = int(os.environ.get('WEBHOOK_QUEUE_SIZE', 1000))
+    WEBHOOK_QUEUE_WORKERS = int(os.environ.get('WEBHOOK_QUEUE_WORKERS', 2))
+    WEBHOOK_QUEUE_OVERFLOW = os.environ.get('WEBHOOK_QUEUE_OVERFLOW', 'reject')
+    WEBHOOK_QUEUE_PUT_TIMEOUT = float(os.environ.get('WEBHOOK_QUEUE_PUT_TIMEOUT', 0.5))
+
+    # Параллельная обработка обновлений разных чатов (0 - обработка в потоке запроса)
+    DISPATCH_WORKERS = int(os.environ.get('DISPATCH_WORKERS', 0))
+    DISPATCH_MAX_PENDING = int(os.environ.get('DISPATCH_MAX_PENDING', 1000))
+    DISPATCH_SUBMIT_TIMEOUT = float(os.environ.get('DISPATCH_SUBMIT_TIMEOUT', 0.5))
+
+    # Хранилище состояния диалогов: '' (в памяти), 'database' или 'sqlite'
+    PERSISTENCE_BACKEND = os.environ.get('PERSISTENCE_BACKEND', '')
+    PERSISTENCE_SQLITE_PATH = os.environ.get('PERSISTENCE_SQLITE_PATH', 'bot_state.db')
+    PERSISTENCE_FLUSH_INTERVAL = float(os.environ.get('PERSISTENCE_FLUSH_INTERVAL', 0.2))
+
+    # Исходящие сообщения: лимиты Telegram и повторы
+    DELIVERY_WORKERS = int(os.environ.get('DELIVERY_WORKERS', 4))
+    DELIVERY_GLOBAL_RATE = float(os.environ.get('DELIVERY_GLOBAL_RATE', 30))
+    DELIVERY_CHAT_RATE = float(os.environ.get('DELIVERY_CHAT_RATE', 1))
+    DELIVERY_MAX_RETRIES = int(os.environ.get('DELIVERY_MAX_RETRIES', 3))
+
+    # Outbox уведомлений
+    OUTBOX_RELAY_ENABLED = os.environ.get('OUTBOX_RELAY_ENABLED', 'True').lower() == 'true'
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 50))
+    OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', 2.0))
+    OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 5))
+    # Сколько часов хранить отправленные уведомления
+    OUTBOX_SENT_RETENTION_HOURS = int(os.environ.get('OUTBOX_SENT_RETENTION_HOURS', 24))
+    # Сколько часов хранить недоставленные уведомления (от создания), чтобы успеть разобрать ошибки
+    OUTBOX_FAILED_RETENTION_HOURS = int(os.environ.get('OUTBOX_FAILED_RETENTION_HOURS', 168))
+
+    # Как часто воркер сверяет версии своих кэшей с БД (секунды)
+    CACHE_VERSION_CHECK_INTERVAL = float(os.environ.get('CACHE_VERSION_CHECK_INTERVAL', 5))
+    ADMIN_CACHE_TTL = float(os.environ.get('ADMIN_CACHE_TTL', 300))
+
+    # Статистика из таблицы счетчиков вместо подсчета по всем заявкам.
+    # Счетчики заполняет миграция 6; если они были выключены, пока менялись
+    # заявки, перед включением пересчитайте их: stats.rebuild_counters
+    STATS_COUNTERS_ENABLED = os.environ.get('STATS_COUNTERS_ENABLED', 'False').lower() == 'true'
+
+    # Очистка заявок: размер порции (одна транзакция) и пауза между порциями
+    CLEANUP_CHUNK_SIZE = int(os.environ.get('CLEANUP_CHUNK_SIZE', 500))
+    CLEANUP_CHUNK_PAUSE = float(os.environ.get('CLEANUP_CHUNK_PAUSE', 0.05))
+
+    # Лента изменений /api/changes: перекрытие окна (повторно отдаются изменения
+    # последних секунд, чтобы не потерять поздно зафиксированные транзакции),
+    # срок хранения удалений и максимум строк, после которого нужна полная загрузка
+    CHANGE_FEED_OVERLAP = float(os.environ.get('CHANGE_FEED_OVERLAP', 10))
+    CHANGE_FEED_RETENTION_DAYS = int(os.environ.get('CHANGE_FEED_RETENTION_DAYS', 7))
+    CHANGE_FEED_MAX_ROWS = int(os.environ.get('CHANGE_FEED_MAX_ROWS', 500))
+
+    # Интервал фоновой проверки БД, бота и вебхука для /readyz и /health
+    HEALTH_PROBE_INTERVAL = float(os.environ.get('HEALTH_PROBE_INTERVAL', 15))
+
+    # Токен для /metrics (пусто - эндпоинт открыт)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+    # Профилирование: доля обновлений/запросов под cProfile (0 - выключено),
+    # порог медленного прогона и размер буфера медленных прогонов
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', 500))
+    PROFILE_RING_SIZE = int(os.environ.get('PROFILE_RING_SIZE', 50))
+    TRACEMALLOC_FRAMES = int(os.environ.get('TRACEMALLOC_FRAMES', 10))
 
     WEAPON_TYPES = ['Сабля', 'Шпага', 'Рапира']
     CATEGORIES = ['Юниоры', 'Взрослые', 'Ветераны']
     AGE_GROUPS = ['до 12 лет', '13-15 лет', '16-18 лет', '19+ лет']
     ADMIN_ROLES = ['admin', 'moderator']
 
+    _admin_ids = None
+    _admin_id_set = None
+
     @classmethod
-    def get_admin_ids(cls):
+    def _parse_admin_ids(cls):
         if not cls.ADMIN_TELEGRAM_IDS:
             return []
         try:
@@ -34,6 +132,19 @@ class Config:
         except:
             return []
 
+    @classmethod
+    def get_admin_ids(cls):
+        # Разбираем ADMIN_TELEGRAM_IDS один раз
+        if cls._admin_ids is None:
+            cls._admin_ids = tuple(cls._parse_admin_ids())
+        return list(cls._admin_ids)
+
+    @classmethod
+    def get_admin_id_set(cls):
+        if cls._admin_id_set is None:
+            cls._admin_id_set = frozenset(cls.get_admin_ids())
+        return cls._admin_id_set
+
     @classmethod
     def get_webhook_url(cls):
         if not cls.WEBHOOK_URL:
@@ -74,4 +185,3 @@ class Config:
         return len(errors) == 0
 
 config = Config()
-config.validate()
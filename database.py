@@ -1,12 +1,17 @@
 import os
 import logging
-from sqlalchemy import create_engine, Column, BigInteger, String, Boolean, DateTime, Text, inspect, text, Integer, Date, ForeignKey
+import threading
+import time
+from sqlalchemy import create_engine, Column, BigInteger, String, Boolean, DateTime, Text, text, Integer, Date, ForeignKey, Index
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, scoped_session, relationship
 from datetime import datetime
 from contextlib import contextmanager
 
 from config import config
+from migrations import run_migrations
+from db_pool import create_db_engine
 
 logging.basicConfig(level=getattr(logging, config.LOG_LEVEL))
 logger = logging.getLogger(__name__)
@@ -16,6 +21,12 @@ Base = declarative_base()
 
 class Event(Base):
     __tablename__ = 'events'
+    __table_args__ = (
+        # Активные будущие события при регистрации и прошедшие - при очистке
+        Index('idx_events_date_active', 'event_date', 'is_active'),
+        # Лента изменений для админ-панели; создается миграцией 5
+        Index('idx_events_updated', 'updated_at', 'id'),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String(200), nullable=False)
@@ -39,9 +50,21 @@ class Event(Base):
 
 class Registration(Base):
     __tablename__ = 'registrations'
+    __table_args__ = (
+        # Индексы под запросы со страницами по (created_at, id); создаются миграцией 3
+        Index('idx_registrations_telegram_created', 'telegram_id', 'created_at'),
+        Index('idx_registrations_status_created', 'status', 'created_at', 'id'),
+        Index('idx_registrations_event_created', 'event_id', 'created_at', 'id'),
+        Index('idx_registrations_created', 'created_at', 'id'),
+        # Очередь на рассмотрение: маленький индекс только по ожидающим заявкам
+        Index('idx_registrations_pending', 'created_at', 'id',
+              postgresql_where=text("status = 'pending'"), sqlite_where=text("status = 'pending'")),
+        # Лента изменений для админ-панели; создается миграцией 5
+        Index('idx_registrations_updated', 'updated_at', 'id'),
+    )
     
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
-    telegram_id = Column(BigInteger, nullable=False, index=True)
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    telegram_id = Column(BigInteger, nullable=False)
     username = Column(String(100))
     full_name = Column(String(200), nullable=False)
     weapon_type = Column(String(50), nullable=False)
@@ -49,11 +72,14 @@ class Registration(Base):
     age_group = Column(String(50), nullable=False)
     phone = Column(String(20), nullable=False)
     experience = Column(Text, nullable=False)
-    status = Column(String(20), default='pending', index=True)
+    status = Column(String(20), default='pending')
     admin_comment = Column(Text)
     event_id = Column(Integer, ForeignKey('events.id'))
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # NOT NULL: курсор страниц - (created_at, id); старые строки заполняет миграция 7
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, server_default=text('CURRENT_TIMESTAMP'))
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Увеличивается при каждой смене статуса
+    version = Column(Integer, nullable=False, default=1, server_default='1')
     
     # Связь
     event = relationship("Event")
@@ -74,14 +100,15 @@ class Registration(Base):
             'event_id': self.event_id,
             'event_name': self.event.name if self.event else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'version': self.version
         }
 
 
 class Admin(Base):
     __tablename__ = 'admins'
     
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True, autoincrement=True)
     telegram_id = Column(BigInteger, unique=True, nullable=False, index=True)
     username = Column(String(100))
     full_name = Column(String(200))
@@ -103,8 +130,107 @@ class Admin(Base):
         }
 
 
+class BotState(Base):
+    """Состояние бота: диалоги, user_data и chat_data (см. persistence.py)"""
+    __tablename__ = 'bot_state'
+    
+    kind = Column(String(100), primary_key=True)
+    key = Column(String(100), primary_key=True)
+    data = Column(Text, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class OutboxMessage(Base):
+    """Исходящее сообщение Telegram, записанное в одной транзакции с изменением данных"""
+    __tablename__ = 'outbox'
+    __table_args__ = (
+        Index('idx_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    chat_id = Column(BigInteger, nullable=False)
+    text = Column(Text, nullable=False)
+    status = Column(String(20), default='pending')
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime)
+
+
+class CleanupJob(Base):
+    """Фоновая очистка заявок и ее прогресс"""
+    __tablename__ = 'cleanup_jobs'
+    __table_args__ = (
+        # Не больше одной выполняемой задачи каждого типа; создается миграцией 8
+        Index('idx_cleanup_jobs_running', 'cleanup_type', unique=True,
+              postgresql_where=text("status = 'running'"), sqlite_where=text("status = 'running'")),
+    )
+    
+    id = Column(String(32), primary_key=True)
+    cleanup_type = Column(String(50), nullable=False)
+    status = Column(String(20), default='running')
+    total = Column(BigInteger, default=0)
+    deleted_count = Column(BigInteger, default=0)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'type': self.cleanup_type,
+            'status': self.status,
+            'total': self.total,
+            'deleted_count': self.deleted_count,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class RegistrationCounter(Base):
+    """Число заявок по статусам, поддерживается при вставке и смене статуса"""
+    __tablename__ = 'registration_counters'
+    
+    status = Column(String(20), primary_key=True)
+    count = Column(BigInteger, nullable=False, default=0)
+
+
+class Tombstone(Base):
+    """Удаленная заявка или событие для ленты изменений (/api/changes)"""
+    __tablename__ = 'tombstones'
+    __table_args__ = (
+        Index('idx_tombstones_deleted_at', 'deleted_at'),
+    )
+    
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    entity = Column(String(20), nullable=False)
+    entity_id = Column(BigInteger, nullable=False)
+    deleted_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class CacheVersion(Base):
+    """Версии закэшированных данных для сброса кэшей во всех воркерах"""
+    __tablename__ = 'cache_versions'
+    
+    name = Column(String(50), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 engine = None
 SessionLocal = None
+# Сессии только для чтения с основной БД: отдельные от потоковой SessionLocal,
+# чтобы закрытие сессии чтения не закрывало открытую сессию записи
+ReadSessionLocal = None
+
+# Реплика для чтения (DATABASE_REPLICA_URL); без нее чтение идет с основной БД
+replica_engine = None
+ReplicaSessionLocal = None
+replica_router = None
 
 
 @contextmanager
@@ -122,27 +248,153 @@ def session_scope():
         session.close()
 
 
+class ReplicaRouter:
+    """Выбор реплики или основной БД для запросов только на чтение.
+
+    Отставание реплики проверяется не чаще раза в check_interval секунд
+    (проверку делает один поток, остальные используют последний
+    результат). Если отставание больше max_lag или реплика недоступна,
+    чтение идет с основной БД до следующей успешной проверки.
+    """
+
+    def __init__(self, engine, max_lag=5.0, check_interval=5.0):
+        self.engine = engine
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+
+        self._healthy = False
+        self._lag = None
+        self._error = None
+        self._checked_at = 0.0
+        self._check_lock = threading.Lock()
+        self._counters = {'replica': 0, 'primary_fallback': 0}
+
+    def measure_lag(self):
+        """Отставание реплики в секундах (0 для БД без репликации)"""
+        with self.engine.connect() as conn:
+            if conn.dialect.name != 'postgresql':
+                conn.execute(text("SELECT 1"))
+                return 0.0
+            # Если все полученное уже применено, реплика не отстает, даже
+            # если на основной БД давно не было записей
+            return float(conn.execute(text(
+                "SELECT CASE WHEN NOT pg_is_in_recovery() "
+                "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+            )).scalar() or 0)
+
+    def check(self):
+        try:
+            lag = self.measure_lag()
+        except Exception as e:
+            self.mark_failed(e)
+            return
+        was_healthy = self._healthy
+        self._lag = lag
+        self._error = None
+        self._healthy = lag <= self.max_lag
+        self._checked_at = time.monotonic()
+        if was_healthy and not self._healthy:
+            logger.warning(f"⚠️ Реплика отстает на {lag:.1f} с, чтение переключено на основную БД")
+        elif self._healthy and not was_healthy:
+            logger.info(f"✅ Чтение с реплики (отставание {lag:.1f} с)")
+
+    def mark_failed(self, error):
+        if self._healthy:
+            logger.warning(f"⚠️ Реплика недоступна, чтение переключено на основную БД: {error}")
+        self._healthy = False
+        self._error = str(error)
+        self._checked_at = time.monotonic()
+
+    def use_replica(self):
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            if self._check_lock.acquire(blocking=False):
+                try:
+                    self.check()
+                finally:
+                    self._check_lock.release()
+        use = self._healthy
+        self._counters['replica' if use else 'primary_fallback'] += 1
+        return use
+
+    def stats(self):
+        return dict(self._counters, healthy=self._healthy, lag_seconds=self._lag,
+                    max_lag=self.max_lag, error=self._error)
+
+
+def get_read_session():
+    """Новая сессия для чтения: реплика, если она настроена и не отстает.
+
+    Сессия не фиксирует изменения (read_only) и закрывается вызывающим.
+    """
+    if replica_router and replica_router.use_replica():
+        return ReplicaSessionLocal()
+    return ReadSessionLocal()
+
+
+@contextmanager
+def read_session_scope():
+    """Контекстный менеджер для запросов только на чтение.
+
+    Данные могут отставать от основной БД на REPLICA_MAX_LAG секунд,
+    поэтому сценарии "записал и сразу прочитал" используют session_scope.
+    Транзакция не фиксируется: записи в этой сессии откатываются.
+    """
+    session = get_read_session()
+    try:
+        yield session
+    except DBAPIError as e:
+        if session.info.get('replica') and e.connection_invalidated:
+            replica_router.mark_failed(e)
+        logger.error(f"Read session error: {e}")
+        raise
+    except Exception as e:
+        logger.error(f"Read session error: {e}")
+        raise
+    finally:
+        session.close()
+
+
+def _database_url(url):
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+        logger.info("✅ Преобразовали postgres:// в postgresql://")
+    return url
+
+
+def init_replica():
+    """Движок и сессии реплики; ошибка подключения не мешает старту"""
+    global replica_engine, ReplicaSessionLocal, replica_router
+
+    if not config.DATABASE_REPLICA_URL:
+        return False
+
+    replica_engine = create_db_engine(_database_url(config.DATABASE_REPLICA_URL))
+    ReplicaSessionLocal = sessionmaker(
+        bind=replica_engine, expire_on_commit=False, info={'replica': True, 'read_only': True}
+    )
+    replica_router = ReplicaRouter(
+        replica_engine,
+        max_lag=config.REPLICA_MAX_LAG,
+        check_interval=config.REPLICA_CHECK_INTERVAL
+    )
+    replica_router.check()
+    logger.info("📊 Реплика для чтения подключена" if replica_router.stats()['healthy']
+                else "⚠️ Реплика пока недоступна, чтение идет с основной БД")
+    return True
+
+
 def init_db():
-    global engine, SessionLocal
+    global engine, SessionLocal, ReadSessionLocal
 
     logger.info("🔄 Инициализация базы данных...")
     
-    db_url = config.DATABASE_URL
-    if db_url.startswith("postgres://"):
-        db_url = db_url.replace("postgres://", "postgresql://", 1)
-        logger.info("✅ Преобразовали postgres:// в postgresql://")
+    db_url = _database_url(config.DATABASE_URL)
 
     logger.info(f"📊 Подключаемся к БД")
     
     try:
-        engine = create_engine(
-            db_url, 
-            pool_pre_ping=True, 
-            echo=config.DEBUG,
-            pool_size=5,
-            max_overflow=10,
-            pool_recycle=3600
-        )
+        engine = create_db_engine(db_url)
         
         # Проверяем соединение
         with engine.connect() as conn:
@@ -153,159 +405,23 @@ def init_db():
         logger.error(f"❌ Не удалось подключиться к БД: {e}")
         raise
     
-    # Создаем таблицы
+    # Применяем миграции (если схема актуальна - один запрос версии)
     try:
-        Base.metadata.create_all(bind=engine)
-        logger.info("✅ Таблицы созданы/проверены")
+        run_migrations(engine, Base.metadata)
     except Exception as e:
-        logger.error(f"❌ Ошибка при создании таблиц: {e}")
+        logger.error(f"❌ Ошибка миграции схемы: {e}")
         raise
     
     SessionLocal = scoped_session(sessionmaker(bind=engine, expire_on_commit=False))
+    ReadSessionLocal = sessionmaker(bind=engine, expire_on_commit=False, info={'read_only': True})
     
-    # Исправляем схему и инициализируем админов
-    fix_database_schema()
     initialize_super_admins()
+    init_replica()
     
     logger.info("✅ База данных инициализирована")
     return True
 
 
-def fix_database_schema():
-    """Исправление схемы базы данных"""
-    logger.info("🔧 Проверка и исправление схемы БД...")
-    
-    session = SessionLocal()
-    try:
-        inspector = inspect(engine)
-        
-        # ===== Таблица admins =====
-        if 'admins' in inspector.get_table_names():
-            logger.info("✅ Таблица 'admins' существует")
-            
-            # Получаем информацию о колонках
-            columns = {col['name']: col for col in inspector.get_columns('admins')}
-            
-            # 1. Проверяем telegram_id
-            if 'telegram_id' in columns:
-                col_type = str(columns['telegram_id']['type'])
-                logger.info(f"   telegram_id тип: {col_type}")
-                
-                # Если тип integer, меняем на bigint
-                if 'INTEGER' in col_type.upper() or 'INT' in col_type.upper():
-                    logger.warning("   ⚠️ telegram_id имеет тип INTEGER, меняем на BIGINT")
-                    try:
-                        session.execute(text("ALTER TABLE admins ALTER COLUMN telegram_id TYPE BIGINT"))
-                        session.commit()
-                        logger.info("   ✅ telegram_id изменен на BIGINT")
-                    except Exception as e:
-                        logger.error(f"   ❌ Ошибка изменения типа telegram_id: {e}")
-                        session.rollback()
-                else:
-                    logger.info("   ✅ telegram_id уже имеет правильный тип")
-            
-            # 2. Проверяем created_at
-            if 'created_at' not in columns:
-                logger.warning("   ⚠️ Колонка created_at не найдена, добавляем...")
-                try:
-                    session.execute(text("ALTER TABLE admins ADD COLUMN created_at TIMESTAMP DEFAULT NOW()"))
-                    session.commit()
-                    logger.info("   ✅ Колонка created_at добавлена")
-                except Exception as e:
-                    logger.error(f"   ❌ Ошибка добавления created_at: {e}")
-                    session.rollback()
-            
-            # 3. Проверяем created_by
-            if 'created_by' not in columns:
-                logger.warning("   ⚠️ Колонка created_by не найдена, добавляем...")
-                try:
-                    session.execute(text("ALTER TABLE admins ADD COLUMN created_by BIGINT"))
-                    session.commit()
-                    logger.info("   ✅ Колонка created_by добавлена")
-                except Exception as e:
-                    logger.error(f"   ❌ Ошибка добавления created_by: {e}")
-                    session.rollback()
-        
-        # ===== Таблица registrations =====
-        if 'registrations' in inspector.get_table_names():
-            logger.info("✅ Таблица 'registrations' существует")
-            
-            # Получаем информацию о колонках
-            columns = inspector.get_columns('registrations')
-            column_names = [col['name'] for col in columns]
-            logger.info(f"   Найдены колонки: {column_names}")
-            
-            # Проверяем и добавляем отсутствующие колонки
-            expected_columns = {
-                'username': 'VARCHAR(100)',
-                'updated_at': 'TIMESTAMP'
-            }
-            
-            for column_name, column_type in expected_columns.items():
-                if column_name not in column_names:
-                    logger.warning(f"   ⚠️ Колонка '{column_name}' не найден, добавляем...")
-                    try:
-                        if column_name == 'updated_at':
-                            session.execute(text(f"ALTER TABLE registrations ADD COLUMN {column_name} {column_type} DEFAULT NOW()"))
-                        else:
-                            session.execute(text(f"ALTER TABLE registrations ADD COLUMN {column_name} {column_type}"))
-                        session.commit()
-                        logger.info(f"   ✅ Колонка '{column_name}' добавлен")
-                    except Exception as e:
-                        logger.error(f"   ❌ Ошибка добавления колонки '{column_name}': {e}")
-                        session.rollback()
-            
-            # Создаем индексы если их нет
-            indexes = inspector.get_indexes('registrations')
-            
-            # Индекс для telegram_id
-            if not any('telegram_id' in idx.get('column_names', []) for idx in indexes):
-                logger.warning("   ⚠️ Индекс для telegram_id не найден, создаем...")
-                try:
-                    session.execute(text("CREATE INDEX IF NOT EXISTS idx_registrations_telegram_id ON registrations(telegram_id)"))
-                    session.commit()
-                    logger.info("   ✅ Индекс для telegram_id создан")
-                except Exception as e:
-                    logger.error(f"   ❌ Ошибка создания индекса: {e}")
-            
-            # Индекс для status
-            if not any('status' in idx.get('column_names', []) for idx in indexes):
-                logger.warning("   ⚠️ Индекс для status не найден, создаем...")
-                try:
-                    session.execute(text("CREATE INDEX IF NOT EXISTS idx_registrations_status ON registrations(status)"))
-                    session.commit()
-                    logger.info("   ✅ Индекс для status создан")
-                except Exception as e:
-                    logger.error(f"   ❌ Ошибка создания индекса: {e}")
-        
-        # ===== Таблица events =====
-        if 'events' not in inspector.get_table_names():
-            logger.warning("⚠️ Таблица 'events' не найдена, создаем...")
-            try:
-                session.execute(text("""
-                    CREATE TABLE events (
-                        id SERIAL PRIMARY KEY,
-                        name VARCHAR(200) NOT NULL,
-                        event_date DATE NOT NULL,
-                        description TEXT,
-                        is_active BOOLEAN DEFAULT TRUE,
-                        created_at TIMESTAMP DEFAULT NOW(),
-                        updated_at TIMESTAMP DEFAULT NOW()
-                    )
-                """))
-                logger.info("   ✅ Таблица 'events' создана")
-            except Exception as e:
-                logger.error(f"   ❌ Ошибка создания таблицы 'events': {e}")
-        
-        logger.info("✅ Проверка схемы завершена")
-        
-    except Exception as e:
-        logger.error(f"❌ Ошибка при проверке схемы: {e}")
-        session.rollback()
-    finally:
-        session.close()
-
-
 def initialize_super_admins():
     """Инициализация супер-администраторов из конфига"""
     admin_ids = config.get_admin_ids()
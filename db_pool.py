@@ -0,0 +1,135 @@
+"""
+Параметры пула соединений SQLAlchemy
+
+Размер пула считается из числа воркеров gunicorn, потоков и фоновых
+задач процесса и ограничивается лимитом соединений БД. Проверка
+соединения (ping) выполняется только после простоя, а не при каждой
+выдаче из пула.
+"""
+
+import logging
+import time
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import DisconnectionError
+from sqlalchemy.pool import StaticPool
+
+from config import config
+from metrics import InstrumentedNullPool, InstrumentedQueuePool
+
+logger = logging.getLogger(__name__)
+
+# Фоновые потоки процесса, которым нужна БД: outbox, очистка, проверки состояния
+BACKGROUND_DB_THREADS = 3
+
+
+def db_threads_per_worker():
+    """Сколько потоков одного воркера одновременно работают с БД"""
+    threads = config.GUNICORN_THREADS
+    if config.DISPATCH_WORKERS > 0:
+        # Обновления обрабатывает пул диспетчера, а не поток запроса
+        threads += config.DISPATCH_WORKERS
+    if config.WEBHOOK_QUEUE_ENABLED:
+        threads += config.WEBHOOK_QUEUE_WORKERS
+    return threads + BACKGROUND_DB_THREADS
+
+
+def fetch_max_connections(db_url):
+    """max_connections сервера Postgres за вычетом резерва (None, если неизвестно)"""
+    try:
+        probe = create_engine(db_url, poolclass=InstrumentedNullPool)
+        try:
+            with probe.connect() as conn:
+                limit = int(conn.execute(text("SHOW max_connections")).scalar())
+        finally:
+            probe.dispose()
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось узнать лимит соединений БД: {e}")
+        return None
+    return max(1, limit - config.DB_RESERVED_CONNECTIONS)
+
+
+def pool_size_for(demand, budget, workers):
+    """(pool_size, max_overflow) для одного воркера.
+
+    Постоянный пул покрывает все потоки воркера, переполнение - всплески
+    до двойной нагрузки; вместе они не превышают долю воркера в бюджете
+    соединений.
+    """
+    per_worker = max(1, budget // max(1, workers)) if budget else demand * 2
+    pool_size = min(demand, per_worker)
+    max_overflow = max(0, min(per_worker, demand * 2) - pool_size)
+    return pool_size, max_overflow
+
+
+def engine_options(db_url):
+    """Аргументы create_engine для основной БД или реплики"""
+    options = {'echo': config.DEBUG}
+
+    if db_url.startswith('sqlite'):
+        # Соединения пула используются из разных потоков
+        options['connect_args'] = {'check_same_thread': False}
+        if db_url in ('sqlite://', 'sqlite:///:memory:'):
+            # У каждой базы в памяти свое соединение: держим одно на процесс
+            options['poolclass'] = StaticPool
+        else:
+            options.update(poolclass=InstrumentedQueuePool, pool_size=db_threads_per_worker(),
+                           max_overflow=0, pool_timeout=config.DB_POOL_TIMEOUT)
+        return options
+
+    if config.DB_PGBOUNCER:
+        # Режим transaction pooling: соединения держит pgbouncer. Сессионное
+        # состояние между транзакциями не сохраняется, поэтому в коде нет
+        # SET, LISTEN и pg_advisory_lock вне транзакции, а psycopg2 не
+        # использует серверные prepared statements
+        if config.DB_PGBOUNCER_POOL_SIZE <= 0:
+            options['poolclass'] = InstrumentedNullPool
+        else:
+            options.update(poolclass=InstrumentedQueuePool, pool_size=config.DB_PGBOUNCER_POOL_SIZE,
+                           max_overflow=0, pool_timeout=config.DB_POOL_TIMEOUT,
+                           pool_recycle=config.DB_POOL_RECYCLE)
+        return options
+
+    budget = config.DB_MAX_CONNECTIONS or fetch_max_connections(db_url)
+    pool_size, max_overflow = pool_size_for(db_threads_per_worker(), budget, config.WEB_CONCURRENCY)
+    if config.DB_POOL_SIZE:
+        pool_size = config.DB_POOL_SIZE
+    if config.DB_MAX_OVERFLOW >= 0:
+        max_overflow = config.DB_MAX_OVERFLOW
+
+    logger.info(f"📊 Пул БД: {pool_size} + {max_overflow} соединений на воркер "
+                f"(воркеров: {config.WEB_CONCURRENCY}, лимит: {budget or 'не задан'})")
+    options.update(poolclass=InstrumentedQueuePool, pool_size=pool_size, max_overflow=max_overflow,
+                   pool_timeout=config.DB_POOL_TIMEOUT, pool_recycle=config.DB_POOL_RECYCLE)
+    return options
+
+
+def install_idle_ping(engine, idle_seconds):
+    """Проверка соединения при выдаче из пула, только если оно простаивало.
+
+    Замена pool_pre_ping: соединение, которое только что вернулось в пул,
+    выдается без лишнего запроса. Если проверка не прошла, пул отбрасывает
+    соединение и открывает новое.
+    """
+    @event.listens_for(engine, 'checkin')
+    def remember_checkin(dbapi_connection, connection_record):
+        connection_record.info['checked_in_at'] = time.monotonic()
+
+    @event.listens_for(engine, 'checkout')
+    def ping_if_idle(dbapi_connection, connection_record, connection_proxy):
+        checked_in_at = connection_record.info.get('checked_in_at')
+        if checked_in_at is None or time.monotonic() - checked_in_at < idle_seconds:
+            return
+        try:
+            cursor = dbapi_connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+        except Exception as e:
+            raise DisconnectionError(f"Соединение с БД потеряно: {e}")
+
+
+def create_db_engine(db_url):
+    engine = create_engine(db_url, **engine_options(db_url))
+    if not db_url.startswith('sqlite') and not (config.DB_PGBOUNCER and config.DB_PGBOUNCER_POOL_SIZE <= 0):
+        install_idle_ping(engine, config.DB_PING_IDLE_SECONDS)
+    return engine
@@ -0,0 +1,158 @@
+"""
+Отправка исходящих сообщений Telegram с ограничением частоты и повторами
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from telegram.error import RetryAfter, BadRequest, Unauthorized, NetworkError
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity подряд"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Резервирует токен и возвращает, сколько секунд нужно подождать"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def is_idle(self):
+        with self._lock:
+            now = time.monotonic()
+            return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class DeliveryEngine:
+    """Пул отправки сообщений с учетом лимитов Telegram.
+
+    Общий лимит (~30 сообщений в секунду) и лимит на чат (~1 в секунду)
+    соблюдаются ведрами токенов. Ответы 429 повторяются через retry_after,
+    сетевые ошибки и 5xx - с экспоненциальной задержкой. Ошибки запроса
+    (400, 403) не повторяются.
+
+    send_message() не блокирует вызывающий поток и возвращает Future с
+    результатом доставки:
+        {'chat_id', 'ok', 'attempts', 'message_id', 'error', 'permanent'}
+    permanent=True - ошибка запроса, повторять отправку бессмысленно.
+    """
+
+    MAX_CHAT_BUCKETS = 10000
+
+    def __init__(self, bot_getter, workers=4, global_rate=30, chat_rate=1, max_retries=3):
+        self.bot_getter = bot_getter
+        self.chat_rate = chat_rate
+        self.max_retries = max_retries
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='delivery')
+        self._global_bucket = TokenBucket(global_rate)
+        self._chat_buckets = {}
+        self._lock = threading.Lock()
+        self._counters = {
+            'queued': 0,
+            'sent': 0,
+            'failed': 0,
+            'retried': 0
+        }
+
+    def _incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def _chat_bucket(self, chat_id):
+        with self._lock:
+            bucket = self._chat_buckets.get(chat_id)
+            if bucket is None:
+                if len(self._chat_buckets) >= self.MAX_CHAT_BUCKETS:
+                    self._chat_buckets = {k: b for k, b in self._chat_buckets.items() if not b.is_idle()}
+                bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1)
+            return bucket
+
+    def _wait_for_slot(self, chat_id):
+        delay = self._chat_bucket(chat_id).reserve()
+        if delay:
+            time.sleep(delay)
+        delay = self._global_bucket.reserve()
+        if delay:
+            time.sleep(delay)
+
+    def send_message(self, chat_id, text, **kwargs):
+        """Постановка сообщения в очередь отправки"""
+        self._incr('queued')
+        return self._executor.submit(self._deliver, chat_id, text, kwargs)
+
+    def send_many(self, chat_ids, text, **kwargs):
+        """Рассылка одного сообщения нескольким получателям"""
+        return [self.send_message(chat_id, text, **kwargs) for chat_id in chat_ids]
+
+    def _deliver(self, chat_id, text, kwargs):
+        result = {'chat_id': chat_id, 'ok': False, 'attempts': 0, 'message_id': None, 'error': None,
+                  'permanent': False}
+
+        bot = self.bot_getter()
+        if not bot:
+            result['error'] = 'Бот не инициализирован'
+            self._incr('failed')
+            return result
+
+        while result['attempts'] <= self.max_retries:
+            self._wait_for_slot(chat_id)
+            result['attempts'] += 1
+            try:
+                message = bot.send_message(chat_id, text, **kwargs)
+                result['ok'] = True
+                result['message_id'] = message.message_id if message else None
+                result['error'] = None
+                self._incr('sent')
+                return result
+            except RetryAfter as e:
+                result['error'] = str(e)
+                delay = e.retry_after
+            except (BadRequest, Unauthorized) as e:
+                result['error'] = str(e)
+                result['permanent'] = True
+                break
+            except NetworkError as e:
+                result['error'] = str(e)
+                delay = 2 ** (result['attempts'] - 1)
+            except Exception as e:
+                result['error'] = str(e)
+                break
+
+            if result['attempts'] > self.max_retries:
+                break
+            self._incr('retried')
+            logger.warning(f"⚠️ Повтор отправки в чат {chat_id} через {delay} с: {result['error']}")
+            time.sleep(delay)
+
+        self._incr('failed')
+        logger.error(f"❌ Не удалось отправить сообщение в чат {chat_id}: {result['error']}")
+        return result
+
+    def stop(self, wait=True):
+        """Остановка после отправки уже принятых сообщений"""
+        self._executor.shutdown(wait=wait)
+
+    def stats(self):
+        """Счетчики отправки для мониторинга"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['chat_buckets'] = len(self._chat_buckets)
+        stats['in_flight'] = stats['queued'] - stats['sent'] - stats['failed']
+        return stats
@@ -0,0 +1,73 @@
+"""
+Кэш активных соревнований для шага выбора события при регистрации
+"""
+
+from datetime import datetime
+
+from telegram import ReplyKeyboardMarkup
+
+from cache_versions import VersionedCache
+from config import config
+from database import Event, session_scope
+
+EVENTS_CACHE = 'events'
+
+
+def event_label(name, event_date):
+    """Подпись соревнования на кнопке клавиатуры"""
+    return f"{name} ({event_date.strftime('%d.%m.%Y')})"
+
+
+class ActiveEventsSnapshot:
+    """Неизменяемый снимок активных будущих соревнований на конкретный день"""
+
+    def __init__(self, day, events):
+        self.day = day
+        # (id, name, event_date), отсортированы по дате
+        self.events = tuple(events)
+
+        labels = {}
+        for event_id, name, event_date in self.events:
+            labels.setdefault(event_label(name, event_date), (event_id, name))
+        self.labels = labels
+
+        self.keyboard = ReplyKeyboardMarkup(
+            [[event_label(name, event_date)] for _, name, event_date in self.events],
+            one_time_keyboard=True,
+            resize_keyboard=True
+        )
+        self.event_list = "\n".join(
+            f"{i + 1}. {name} - {event_date.strftime('%d.%m.%Y')}"
+            for i, (_, name, event_date) in enumerate(self.events)
+        )
+
+    def find(self, label):
+        """(event_id, name) по подписи кнопки или None"""
+        return self.labels.get(label)
+
+
+def _load_active_events():
+    today = datetime.now().date()
+    with session_scope() as session:
+        rows = session.query(Event.id, Event.name, Event.event_date).filter(
+            Event.is_active == True,
+            Event.event_date >= today
+        ).order_by(Event.event_date).all()
+    return ActiveEventsSnapshot(today, rows)
+
+
+_cache = VersionedCache(EVENTS_CACHE, _load_active_events, check_interval=config.CACHE_VERSION_CHECK_INTERVAL)
+
+
+def get_active_events():
+    """Снимок активных соревнований; после полуночи перестраивается"""
+    snapshot = _cache.get()
+    if snapshot.day != datetime.now().date():
+        _cache.invalidate()
+        snapshot = _cache.get()
+    return snapshot
+
+
+def invalidate_events_cache():
+    """Сброс кэша в этом воркере; остальные увидят новую версию из БД"""
+    _cache.invalidate()
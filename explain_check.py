@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+"""
+Проверка планов горячих запросов: ни один не должен читать всю таблицу
+
+Скрипт заполняет БД заявками за несколько сезонов, выполняет запросы
+приложения (списки и страницы заявок, заявки пользователя, активные
+события, лента изменений, порции очистки), перехватывает их SQL и выполняет EXPLAIN.
+Если план читает registrations или events целиком (последовательно или
+обходом всего индекса без условия), скрипт завершается с кодом 1.
+Обход индекса по порядку допустим только для страниц без фильтров:
+LIMIT останавливает его после первых строк.
+
+    python explain_check.py
+    python explain_check.py --database-url postgresql://localhost/fencing_explain --rows 100000
+
+На Postgres планы строятся с enable_seqscan = off: Seq Scan в плане
+означает, что подходящего индекса нет. Для Postgres используйте
+отдельную пустую базу: скрипт добавляет события и заявки.
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+CHECKED_TABLES = ('registrations', 'events')
+
+# На маленькой таблице планировщик SQLite по статистике честно выбирает
+# полное чтение (на Postgres это отключает enable_seqscan = off)
+MIN_SEED_ROWS = 10000
+
+# SQLite: SEARCH - поиск по индексу, SCAN - чтение всей таблицы или всего индекса
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?( USING (?:COVERING )?INDEX \w+)?')
+
+
+class StatementCapture:
+    """SQL-запросы, выполненные внутри capture()"""
+
+    def __init__(self, engine):
+        self.statements = None
+        from sqlalchemy import event
+        event.listen(engine, 'before_cursor_execute', self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if self.statements is not None and not executemany:
+            self.statements.append((statement, parameters))
+
+    @contextmanager
+    def capture(self):
+        self.statements = []
+        try:
+            yield self.statements
+        finally:
+            self.statements = None
+
+
+def seed(database, rows, seasons=3):
+    """События за несколько сезонов и rows заявок с разными статусами"""
+    from sqlalchemy import insert
+
+    today = date.today()
+    with database.session_scope() as session:
+        events = []
+        for season in range(seasons):
+            for month in range(12):
+                event_date = today - timedelta(days=365 * season + 30 * month - 60)
+                events.append(database.Event(
+                    name=f'Турнир {event_date:%m.%Y}', event_date=event_date,
+                    is_active=event_date >= today
+                ))
+        session.add_all(events)
+        session.flush()
+        event_ids = [e.id for e in events]
+
+    rnd = random.Random(42)
+    now = datetime.utcnow()
+    statuses = ['confirmed'] * 8 + ['pending', 'rejected']
+    batch = []
+    with database.engine.begin() as conn:
+        for i in range(rows):
+            created_at = now - timedelta(minutes=rnd.randrange(365 * seasons * 24 * 60))
+            batch.append({
+                'telegram_id': 1_000_000 + rnd.randrange(max(1, rows // 3)),
+                'full_name': f'Участник {i}',
+                'weapon_type': rnd.choice(('Сабля', 'Шпага', 'Рапира')),
+                'category': rnd.choice(('Юниоры', 'Взрослые', 'Ветераны')),
+                'age_group': '19+ лет',
+                'phone': f'+7999{i:07d}',
+                'experience': 'опыт',
+                'status': rnd.choice(statuses),
+                'event_id': rnd.choice(event_ids),
+                'created_at': created_at,
+                'updated_at': created_at,
+                'version': 1
+            })
+            if len(batch) >= 5000:
+                conn.execute(insert(database.Registration), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(database.Registration), batch)
+        conn.exec_driver_sql("ANALYZE")
+    return event_ids
+
+
+def hot_queries(database, sample):
+    """Запросы, чьи планы проверяются"""
+    from change_feed import encode_cursor, fetch_changes
+    from cleanup_jobs import CLEANUP_TYPES, cleanup_condition, delete_chunk
+    from events_cache import _load_active_events
+    from registration_queries import fetch_page, user_registrations_query
+
+    def page(args):
+        return lambda session: fetch_page(session, args, default_limit=20, max_limit=500)
+
+    def second_page(args):
+        def run(session):
+            _, cursor = fetch_page(session, args, default_limit=20, max_limit=500)
+            if cursor:
+                fetch_page(session, dict(args, cursor=cursor), default_limit=20, max_limit=500)
+        return run
+
+    month_ago = (date.today() - timedelta(days=30)).isoformat()
+    # (название, функция, допустим ли обход индекса по порядку)
+    queries = [
+        ('заявки пользователя', lambda session: user_registrations_query(session, sample['telegram_id']).all(), False),
+        ('список заявок', page({}), True),
+        ('список заявок, страница 2', second_page({}), True),
+        ('ожидающие заявки', page({'status': 'pending'}), False),
+        ('подтвержденные, страница 2', second_page({'status': 'confirmed'}), False),
+        ('заявки события', page({'event_id': str(sample['event_id'])}), False),
+        ('заявки за месяц', page({'date_from': month_ago}), False),
+        ('заявки удаляемого события',
+         lambda session: session.query(database.Registration).filter_by(event_id=sample['event_id']).all(), False),
+        ('активные события', lambda session: _load_active_events(), False),
+        ('лента изменений за час',
+         lambda session: fetch_changes(session, {'cursor': encode_cursor(datetime.utcnow() - timedelta(hours=1))}),
+         False),
+    ]
+    for cleanup_type in CLEANUP_TYPES:
+        queries.append((f'порция очистки {cleanup_type}',
+                        lambda session, t=cleanup_type: delete_chunk(session, cleanup_condition(t), 500), False))
+    if database.engine.dialect.name == 'postgresql':
+        # На SQLite поиск - LIKE '%...%' без индекса
+        from registration_search import search_registrations
+        queries.append(('поиск заявок',
+                        lambda session: search_registrations(session, {'q': 'Участник 123'}, 20, 500), False))
+        queries.append(('поиск по цифрам телефона',
+                        lambda session: search_registrations(session, {'q': '999 000-01-23'}, 20, 500), False))
+    return queries
+
+
+def _pg_nodes(node):
+    yield node
+    for child in node.get('Plans', ()):
+        yield from _pg_nodes(child)
+
+
+def explain(engine, statement, parameters):
+    """(строки плана, [(таблица, 'seq' | 'index')]) - полные чтения таблиц"""
+    scans = []
+    with engine.connect() as conn:
+        with conn.begin() as transaction:
+            if conn.dialect.name == 'postgresql':
+                conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+                text_plan = conn.exec_driver_sql("EXPLAIN " + statement, parameters).fetchall()
+                plan = [row[0] for row in text_plan]
+                document = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+                for node in _pg_nodes(document[0]['Plan']):
+                    table = node.get('Relation Name')
+                    if node['Node Type'] == 'Seq Scan':
+                        scans.append((table, 'seq'))
+                    elif node['Node Type'] in ('Index Scan', 'Index Only Scan') and 'Index Cond' not in node:
+                        scans.append((table, 'index'))
+            else:
+                rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+                plan = [row[-1] for row in rows]
+                for line in plan:
+                    match = SQLITE_SCAN.match(line.strip())
+                    if match:
+                        # В плане SQLite псевдонимы SQLAlchemy: events_1 -> events
+                        table = re.sub(r'_\d+$', '', match.group(1))
+                        scans.append((table, 'index' if match.group(2) else 'seq'))
+            transaction.rollback()
+    return plan, [(table, kind) for table, kind in scans if table in CHECKED_TABLES]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EXPLAIN горячих запросов на заполненной БД')
+    parser.add_argument('--database-url', help='БД для проверки (по умолчанию временный SQLite)')
+    parser.add_argument('--rows', type=int, default=20000, help='число заявок для заполнения')
+    parser.add_argument('--no-seed', action='store_true', help='проверять на уже имеющихся данных')
+    parser.add_argument('--verbose', action='store_true', help='печатать планы всех запросов')
+    args = parser.parse_args()
+    if not args.no_seed and args.rows < MIN_SEED_ROWS:
+        parser.error(f"--rows должно быть не меньше {MIN_SEED_ROWS}")
+
+    workdir = tempfile.mkdtemp(prefix='fencing-explain-')
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(workdir, 'explain.db')}"
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    import database
+
+    database.init_db()
+    engine = database.engine
+    dialect = engine.dialect.name
+    capture = StatementCapture(engine)
+
+    if not args.no_seed:
+        with database.session_scope() as session:
+            if session.query(database.Registration.id).first():
+                print("❌ В БД уже есть заявки: используйте пустую базу или --no-seed")
+                return 2
+        print(f"🌱 Заполнение: {args.rows} заявок...")
+        seed(database, args.rows)
+
+    with database.session_scope() as session:
+        row = session.query(database.Registration.telegram_id, database.Registration.event_id).filter(
+            database.Registration.event_id.isnot(None)
+        ).first()
+    if not row:
+        print("❌ В БД нет заявок для проверки")
+        return 2
+    sample = {'telegram_id': row.telegram_id, 'event_id': row.event_id}
+
+    print(f"🔍 Проверка планов запросов ({dialect})\n")
+    failed = []
+    for name, run, allow_ordered in hot_queries(database, sample):
+        session = database.SessionLocal()
+        try:
+            with capture.capture() as statements:
+                run(session)
+        finally:
+            # Порции очистки выполняются без сохранения
+            session.rollback()
+            session.close()
+
+        scans = []
+        plans = []
+        for statement, parameters in statements:
+            plan, full = explain(engine, statement, parameters)
+            plans.append((statement, plan))
+            scans.extend(table for table, kind in full if kind == 'seq' or not allow_ordered)
+
+        if scans:
+            failed.append(name)
+            print(f"❌ {name}: полное чтение {', '.join(sorted(set(scans)))}")
+        else:
+            print(f"✅ {name}")
+        if scans or args.verbose:
+            for statement, plan in plans:
+                print('   ' + ' '.join(statement.split())[:200])
+                for line in plan:
+                    print(f"      {line}")
+
+    print()
+    if failed:
+        print(f"❌ Запросов с полным чтением таблицы: {len(failed)}")
+        return 1
+    print("✅ Все запросы используют индексы")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+Потоковая выгрузка заявок в CSV и NDJSON
+"""
+
+import csv
+import io
+import json
+import logging
+
+from database import Registration
+from registration_queries import build_query, parse_fields, row_to_dict
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8'
+}
+
+# Для стартовых протоколов по умолчанию выгружаем все поля анкеты
+EXPORT_FIELDS = (
+    'id', 'full_name', 'weapon_type', 'category', 'age_group', 'phone', 'username',
+    'experience', 'status', 'event_id', 'event_name', 'created_at'
+)
+
+
+def build_export_query(session, args, chunk_size=500):
+    """Запрос выгрузки с серверным курсором: строки читаются пачками по chunk_size"""
+    fields = parse_fields(args.get('fields'), default=EXPORT_FIELDS)
+    query = build_query(session, args, fields).order_by(Registration.created_at, Registration.id)
+    return query.yield_per(chunk_size), fields
+
+
+def _batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_csv(rows, fields, batch_size=200):
+    """Строки CSV; BOM в начале нужен Excel для кириллицы"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    buffer.write('\ufeff')
+    writer.writerow(fields)
+    yield buffer.getvalue()
+
+    for batch in _batched(rows, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        for row in batch:
+            item = row_to_dict(row, fields)
+            writer.writerow(['' if item[f] is None else item[f] for f in fields])
+        yield buffer.getvalue()
+
+
+def iter_ndjson(rows, fields, batch_size=200):
+    """Одна заявка - одна строка JSON"""
+    for batch in _batched(rows, batch_size):
+        yield ''.join(json.dumps(row_to_dict(row, fields), ensure_ascii=False) + '\n' for row in batch)
+
+
+def stream_export(session, query, fields, export_format):
+    """Генератор выгрузки; закрывает сессию по окончании"""
+    writer = iter_csv if export_format == 'csv' else iter_ndjson
+    try:
+        for chunk in writer(query, fields):
+            yield chunk
+    except Exception as e:
+        logger.error(f"❌ Ошибка выгрузки заявок: {e}")
+        raise
+    finally:
+        session.close()
@@ -0,0 +1,77 @@
+"""
+Фоновая проверка зависимостей для /readyz и /health
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class HealthProber:
+    """Периодическая проверка БД, бота и вебхука в фоновом потоке.
+
+    checks - словарь {имя: функция}; функция возвращает значение для
+    ответа или бросает исключение. Эндпоинты читают только последний
+    снимок, поэтому проверки не зависят от задержек Telegram API и не
+    занимают соединения из пула на каждый запрос.
+    """
+
+    def __init__(self, checks, interval=15.0, required=None, max_age=None):
+        self.checks = checks
+        self.interval = interval
+        # Проверки, без которых сервис не готов принимать трафик
+        self.required = tuple(required if required is not None else checks)
+        # Снимок старше max_age считается устаревшим (поток проверок завис)
+        self.max_age = max_age if max_age is not None else interval * 4
+
+        self._results = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._loop, name='health-prober', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.probe()
+            self._stop.wait(self.interval)
+
+    def probe(self):
+        """Однократный прогон всех проверок"""
+        for name, check in self.checks.items():
+            started = time.monotonic()
+            try:
+                result = {'ok': True, 'value': check(), 'error': None}
+            except Exception as e:
+                logger.warning(f"⚠️ Проверка '{name}' не прошла: {e}")
+                result = {'ok': False, 'value': None, 'error': str(e)}
+            result['latency_ms'] = round((time.monotonic() - started) * 1000, 1)
+            result['checked_at'] = datetime.utcnow().isoformat()
+            result['_monotonic'] = time.monotonic()
+            # Замена целого словаря: читатели не видят частично записанный результат
+            self._results = {**self._results, name: result}
+
+    def results(self):
+        """Последние результаты проверок без служебных полей"""
+        return {
+            name: {k: v for k, v in result.items() if not k.startswith('_')}
+            for name, result in self._results.items()
+        }
+
+    def is_ready(self):
+        results = self._results
+        now = time.monotonic()
+        for name in self.required:
+            result = results.get(name)
+            if not result or not result['ok'] or now - result['_monotonic'] > self.max_age:
+                return False
+        return True
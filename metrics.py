@@ -0,0 +1,262 @@
+"""
+Метрики в текстовом формате Prometheus для /metrics
+"""
+
+import threading
+import time
+from functools import wraps
+
+from sqlalchemy.pool import NullPool, QueuePool
+from telegram import Bot
+from telegram.error import TelegramError
+
+import profiling
+
+# Границы гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics = []
+_gauges = []
+_registry_lock = threading.Lock()
+
+
+class _Metric:
+    """Метрика с метками; значения пишутся в шард текущего потока.
+
+    Запись не берет блокировок: у каждого потока свой словарь, а /metrics
+    суммирует шарды всех потоков. Блокировка нужна только при первом
+    обращении потока к метрике.
+    """
+
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._local = threading.local()
+        self._shards = []
+        with _registry_lock:
+            _metrics.append(self)
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with _registry_lock:
+                self._shards.append(shard)
+        return shard
+
+    def _merged(self):
+        merged = {}
+        for shard in list(self._shards):
+            for key, value in list(shard.items()):
+                merged[key] = self._merge(merged.get(key), value)
+        return merged
+
+    def _label_str(self, key, extra=None):
+        pairs = list(zip(self.labels, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        shard = self._shard()
+        shard[label_values] = shard.get(label_values, 0) + amount
+
+    def _merge(self, total, value):
+        return (total or 0) + value
+
+    def render(self):
+        for key, value in sorted(self._merged().items()):
+            yield f"{self.name}{self._label_str(key)} {value}"
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        shard = self._shard()
+        state = shard.get(label_values)
+        if state is None:
+            # [счетчики по корзинам..., +Inf, сумма]
+            state = shard[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[i] += 1
+                break
+        else:
+            state[len(self.buckets)] += 1
+        state[-1] += value
+
+    def _merge(self, total, value):
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+    def render(self):
+        for key, state in sorted(self._merged().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), state):
+                cumulative += count
+                yield f"{self.name}_bucket{self._label_str(key, ('le', bound))} {cumulative}"
+            yield f"{self.name}_sum{self._label_str(key)} {state[-1]}"
+            yield f"{self.name}_count{self._label_str(key)} {cumulative}"
+
+    def time(self, *label_values):
+        return _Timer(self, label_values)
+
+
+class _Timer:
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+
+
+def register_gauge(name, help, func, labels=()):
+    """Показатель, вычисляемый при чтении /metrics.
+
+    func возвращает число или словарь {кортеж значений меток: число};
+    None означает, что показатель сейчас недоступен.
+    """
+    with _registry_lock:
+        _gauges.append((name, help, func, tuple(labels)))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_metrics():
+    """Все метрики в текстовом формате Prometheus 0.0.4"""
+    lines = []
+    for metric in list(_metrics):
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.render())
+
+    for name, help, func, labels in list(_gauges):
+        try:
+            value = func()
+        except Exception:
+            value = None
+        if value is None:
+            continue
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        if isinstance(value, dict):
+            for key, item in sorted(value.items()):
+                label_str = ','.join(f'{k}="{_escape(v)}"' for k, v in zip(labels, key))
+                lines.append(f"{name}{{{label_str}}} {item}")
+        else:
+            lines.append(f"{name} {value}")
+
+    return '\n'.join(lines) + '\n'
+
+
+# ===== Метрики приложения =====
+HTTP_REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Время обработки HTTP-запроса', ('method', 'route', 'status'))
+
+HANDLER_DURATION = Histogram(
+    'telegram_handler_duration_seconds', 'Время выполнения обработчика Telegram', ('handler',))
+
+UPDATES_BY_STATE = Counter(
+    'telegram_updates_processed_total', 'Обновления, обработанные в состоянии диалога', ('state',))
+
+UPDATES_TOTAL = Counter(
+    'telegram_updates_total', 'Все обновления, переданные диспетчеру')
+
+TELEGRAM_API_DURATION = Histogram(
+    'telegram_api_request_duration_seconds', 'Время запроса к Bot API', ('method',))
+
+TELEGRAM_API_ERRORS = Counter(
+    'telegram_api_errors_total', 'Ошибки запросов к Bot API', ('method', 'error'))
+
+DB_POOL_CHECKOUTS = Counter(
+    'db_pool_checkouts_total', 'Выдачи соединений из пула SQLAlchemy')
+
+DB_POOL_WAIT = Histogram(
+    'db_pool_wait_seconds', 'Ожидание свободного соединения в пуле',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0))
+
+
+def instrument_handler(callback, state=None):
+    """Обертка обработчика Telegram: время выполнения и состояние диалога"""
+    name = callback.__name__
+    state = state or 'none'
+
+    @wraps(callback)
+    def wrapper(update, context):
+        UPDATES_BY_STATE.inc(state)
+        profiling.annotate(name, state)
+        with HANDLER_DURATION.time(name):
+            return callback(update, context)
+    return wrapper
+
+
+class InstrumentedBot(Bot):
+    """Bot с учетом времени и ошибок каждого запроса к Bot API"""
+
+    def _post(self, endpoint, data=None, timeout=None, api_kwargs=None):
+        started = time.perf_counter()
+        try:
+            return super()._post(endpoint, data=data, timeout=timeout, api_kwargs=api_kwargs)
+        except TelegramError as e:
+            TELEGRAM_API_ERRORS.inc(endpoint, type(e).__name__)
+            raise
+        finally:
+            TELEGRAM_API_DURATION.observe(time.perf_counter() - started, endpoint)
+
+
+class _InstrumentedPool:
+    """Учет выдач соединений и времени ожидания (для NullPool - времени подключения)"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUTS.inc()
+            DB_POOL_WAIT.observe(time.perf_counter() - started)
+
+
+class InstrumentedQueuePool(_InstrumentedPool, QueuePool):
+    pass
+
+
+class InstrumentedNullPool(_InstrumentedPool, NullPool):
+    pass
+
+
+def register_pool_gauges(engine_getter):
+    """Показатели пула движка, созданного в init_db"""
+    def pool_value(attr):
+        def read():
+            engine = engine_getter()
+            if engine is None or not isinstance(engine.pool, QueuePool):
+                return None
+            return getattr(engine.pool, attr)()
+        return read
+
+    register_gauge('db_pool_size', 'Размер пула соединений', pool_value('size'))
+    register_gauge('db_pool_checked_out', 'Соединения, выданные из пула', pool_value('checkedout'))
+    register_gauge('db_pool_checked_in', 'Свободные соединения в пуле', pool_value('checkedin'))
+    register_gauge('db_pool_overflow', 'Соединения сверх pool_size', pool_value('overflow'))
@@ -1,20 +1,257 @@
 #!/usr/bin/env python
 """
 Миграции базы данных
+
+Схема описывается упорядоченным списком MIGRATIONS, номер примененной
+версии хранится в таблице schema_version. При старте выполняется один
+запрос версии; если схема актуальна, таблицы и индексы не проверяются.
 """
 
 import sys
 import os
+import logging
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from config import config
-from database import init_db
+logger = logging.getLogger(__name__)
+
+# Ключ pg_advisory_xact_lock: миграции выполняет только один воркер
+MIGRATION_LOCK_KEY = 7315203
+
+_version_metadata = MetaData()
+
+schema_version = Table(
+    'schema_version', _version_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200)),
+    Column('applied_at', DateTime, default=datetime.utcnow)
+)
+
+
+def _add_column(conn, table, column, ddl):
+    """ALTER TABLE ... ADD COLUMN, если колонки еще нет"""
+    columns = [col['name'] for col in inspect(conn).get_columns(table)]
+    if column not in columns:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+        logger.info(f"   ✅ Колонка {table}.{column} добавлена")
+
+
+def _create_index(conn, name, table, columns):
+    """CREATE INDEX, если на колонках еще нет индекса"""
+    indexes = inspect(conn).get_indexes(table)
+    if not any(idx.get('column_names') == columns for idx in indexes):
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+        logger.info(f"   ✅ Индекс {name} создан")
+
+
+def _m001_baseline(conn, metadata):
+    """Создание отсутствующих таблиц по моделям"""
+    metadata.create_all(bind=conn)
+
+
+def _m002_legacy_columns(conn, metadata):
+    """Колонки и индексы, которых нет в БД, созданных старыми версиями бота"""
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text("ALTER TABLE admins ALTER COLUMN telegram_id TYPE BIGINT"))
+
+    _add_column(conn, 'admins', 'created_at', 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP')
+    _add_column(conn, 'admins', 'created_by', 'BIGINT')
+
+    _add_column(conn, 'registrations', 'username', 'VARCHAR(100)')
+    _add_column(conn, 'registrations', 'admin_comment', 'TEXT')
+    _add_column(conn, 'registrations', 'created_at', 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP')
+    _add_column(conn, 'registrations', 'updated_at', 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP')
+    _add_column(conn, 'registrations', 'event_id', 'INTEGER REFERENCES events(id)')
+    _add_column(conn, 'registrations', 'version', 'INTEGER NOT NULL DEFAULT 1')
+
+    _create_index(conn, 'idx_registrations_telegram_id', 'registrations', ['telegram_id'])
+    _create_index(conn, 'idx_registrations_status', 'registrations', ['status'])
+
+
+def _m003_query_indexes(conn, metadata):
+    """Составные и частичные индексы под запросы со страницами по (created_at, id)"""
+    for table_name in ('registrations', 'events'):
+        for index in metadata.tables[table_name].indexes:
+            index.create(bind=conn, checkfirst=True)
+            logger.info(f"   ✅ Индекс {index.name}")
+
+    # Одноколоночные индексы покрываются составными (telegram_id, created_at)
+    # и (status, created_at, id) и только замедляют вставку
+    for name in ('ix_registrations_telegram_id', 'idx_registrations_telegram_id',
+                 'ix_registrations_status', 'idx_registrations_status'):
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+    conn.execute(text("ANALYZE registrations"))
+    conn.execute(text("ANALYZE events"))
+
+
+def _m004_search_indexes(conn, metadata):
+    """Триграммные GIN-индексы для поиска заявок (только PostgreSQL с pg_trgm)"""
+    if conn.dialect.name != 'postgresql':
+        return
+
+    # Без прав на CREATE EXTENSION поиск работает через ILIKE без индекса
+    savepoint = conn.begin_nested()
+    try:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        savepoint.commit()
+    except SQLAlchemyError as e:
+        savepoint.rollback()
+        logger.warning(f"   ⚠️ Расширение pg_trgm недоступно, индексы поиска не созданы: {e}")
+        return
+
+    for column in ('full_name', 'phone', 'username', 'experience'):
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS idx_registrations_{column}_trgm "
+            f"ON registrations USING gin ({column} gin_trgm_ops)"
+        ))
+        logger.info(f"   ✅ Индекс idx_registrations_{column}_trgm")
+
+
+def _m005_change_feed(conn, metadata):
+    """Таблица tombstones и индексы по updated_at для ленты изменений"""
+    metadata.tables['tombstones'].create(bind=conn, checkfirst=True)
+    for table_name, name in (('registrations', 'idx_registrations_updated'), ('events', 'idx_events_updated')):
+        for index in metadata.tables[table_name].indexes:
+            if index.name == name:
+                index.create(bind=conn, checkfirst=True)
+                logger.info(f"   ✅ Индекс {name}")
+
+
+def _m006_backfill_counters(conn, metadata):
+    """Заполнение registration_counters по текущим заявкам.
+
+    Без этого первое изменение статуса на существующей БД создавало
+    строку счетчика только с приращением (pending = -1).
+    """
+    metadata.tables['registration_counters'].create(bind=conn, checkfirst=True)
+    conn.execute(text("DELETE FROM registration_counters"))
+    conn.execute(text(
+        "INSERT INTO registration_counters (status, count) "
+        "SELECT status, COUNT(*) FROM registrations WHERE status IS NOT NULL GROUP BY status"
+    ))
+    for status in ('pending', 'confirmed', 'rejected'):
+        conn.execute(text(
+            "INSERT INTO registration_counters (status, count) SELECT :status, 0 "
+            "WHERE NOT EXISTS (SELECT 1 FROM registration_counters WHERE status = :status)"
+        ), {'status': status})
+    logger.info("   ✅ Счетчики заявок заполнены")
+
+
+def _m007_registration_created_at(conn, metadata):
+    """created_at для заявок без даты и NOT NULL.
+
+    Строки с NULL выпадали из страниц после первой: (created_at, id) < курсор
+    для них не выполняется. Дата берется из updated_at, иначе они встают
+    в конец списка (самая ранняя дата заявок).
+    """
+    result = conn.execute(text(
+        "UPDATE registrations SET created_at = COALESCE(updated_at, "
+        "(SELECT MIN(r.created_at) FROM registrations r), CURRENT_TIMESTAMP) "
+        "WHERE created_at IS NULL"
+    ))
+    if result.rowcount:
+        logger.info(f"   ✅ Заполнена дата у заявок: {result.rowcount}")
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text("ALTER TABLE registrations ALTER COLUMN created_at SET NOT NULL"))
+
+
+def _m008_cleanup_running_index(conn, metadata):
+    """Уникальный частичный индекс: одна выполняемая очистка каждого типа"""
+    # Дубликаты от одновременных запусков: оставляем последнюю задачу
+    conn.execute(text(
+        "UPDATE cleanup_jobs SET status = 'failed', error = 'duplicate', finished_at = CURRENT_TIMESTAMP "
+        "WHERE status = 'running' AND id NOT IN ("
+        "SELECT id FROM (SELECT j.id FROM cleanup_jobs j WHERE j.status = 'running' AND j.created_at = ("
+        "SELECT MAX(k.created_at) FROM cleanup_jobs k WHERE k.status = 'running' "
+        "AND k.cleanup_type = j.cleanup_type)) latest)"
+    ))
+    for index in metadata.tables['cleanup_jobs'].indexes:
+        if index.name == 'idx_cleanup_jobs_running':
+            index.create(bind=conn, checkfirst=True)
+            logger.info("   ✅ Индекс idx_cleanup_jobs_running")
+
+
+def _m009_phone_digits_index(conn, metadata):
+    """Триграммный индекс по цифрам телефона: поиск 9991234 находит +7 (999) 123-..."""
+    if conn.dialect.name != 'postgresql':
+        return
+    if not conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar():
+        logger.warning("   ⚠️ pg_trgm не установлено, индекс по цифрам телефона не создан")
+        return
+    # Выражение совпадает с registration_search.PHONE_DIGITS_SQL
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS idx_registrations_phone_digits_trgm "
+        "ON registrations USING gin ((regexp_replace(phone, '\\D', '', 'g')) gin_trgm_ops)"
+    ))
+    logger.info("   ✅ Индекс idx_registrations_phone_digits_trgm")
+
+
+# (версия, описание, функция); новые миграции добавляются только в конец
+MIGRATIONS = [
+    (1, 'Базовая схема', _m001_baseline),
+    (2, 'Колонки и индексы старых схем', _m002_legacy_columns),
+    (3, 'Составные и частичные индексы заявок и событий', _m003_query_indexes),
+    (4, 'Триграммные индексы поиска заявок', _m004_search_indexes),
+    (5, 'Лента изменений: tombstones и индексы updated_at', _m005_change_feed),
+    (6, 'Заполнение счетчиков заявок', _m006_backfill_counters),
+    (7, 'Дата создания заявок: заполнение и NOT NULL', _m007_registration_created_at),
+    (8, 'Одна выполняемая очистка каждого типа', _m008_cleanup_running_index),
+    (9, 'Индекс поиска по цифрам телефона', _m009_phone_digits_index),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    """Номер примененной версии (0, если миграции еще не выполнялись)"""
+    return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+
+def run_migrations(engine, metadata):
+    """Применение недостающих миграций; возвращает итоговую версию схемы"""
+    # Быстрый путь: один запрос, если схема актуальна
+    try:
+        with engine.connect() as conn:
+            if current_version(conn) >= LATEST_VERSION:
+                return LATEST_VERSION
+    except SQLAlchemyError:
+        pass  # таблицы schema_version еще нет
+
+    with engine.begin() as conn:
+        if conn.dialect.name == 'postgresql':
+            # Блокировка до конца транзакции: остальные воркеры ждут и
+            # затем видят уже примененные миграции
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': MIGRATION_LOCK_KEY})
+
+        _version_metadata.create_all(bind=conn)
+        version = current_version(conn)
+
+        for number, description, migrate in MIGRATIONS:
+            if number <= version:
+                continue
+            logger.info(f"🔄 Миграция {number}: {description}")
+            migrate(conn, metadata)
+            conn.execute(schema_version.insert().values(
+                version=number, description=description, applied_at=datetime.utcnow()
+            ))
+            version = number
+
+    logger.info(f"✅ Схема БД актуальна (версия {version})")
+    return version
+
 
 def main():
     """Основная функция миграций"""
+    from database import init_db
+
     print("🤺 Tolyatti Fencing - Миграции базы данных")
     print("=" * 50)
-    
+
     print("🔄 Инициализация базы данных...")
     try:
         init_db()
@@ -22,8 +259,8 @@ def main():
     except Exception as e:
         print(f"❌ Ошибка: {e}")
         return 1
-    
+
     return 0
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(main())
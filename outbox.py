@@ -0,0 +1,217 @@
+"""
+Транзакционный outbox для уведомлений Telegram
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import wait
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, or_
+
+from database import OutboxMessage, session_scope
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_message(session, chat_id, text):
+    """Запись уведомления в outbox в текущей транзакции.
+
+    Сообщение будет отправлено только после коммита транзакции, поэтому
+    уведомление не уйдет, если изменение данных откатилось, и не потеряется,
+    если отправка не удалась.
+    """
+    message = OutboxMessage(chat_id=chat_id, text=text, status='pending', next_attempt_at=datetime.utcnow())
+    session.add(message)
+    return message
+
+
+def enqueue_messages(session, messages):
+    """Запись пачки уведомлений [(chat_id, text)] одним INSERT в текущей транзакции"""
+    if not messages:
+        return 0
+    now = datetime.utcnow()
+    session.execute(insert(OutboxMessage), [
+        {'chat_id': chat_id, 'text': text, 'status': 'pending', 'attempts': 0, 'next_attempt_at': now, 'created_at': now}
+        for chat_id, text in messages
+    ])
+    return len(messages)
+
+
+class OutboxRelay:
+    """Фоновая отправка сообщений из outbox пачками.
+
+    Пачка захватывается через SELECT ... FOR UPDATE SKIP LOCKED и помечается
+    как 'sending' с арендой на lease_seconds, после чего транзакция сразу
+    завершается: соединение с БД не держится во время запросов к Telegram.
+    Несколько relay (например, в разных воркерах gunicorn) не мешают друг
+    другу, а сообщения упавшего relay заберут после окончания аренды.
+    Пока отправка идет (повторы после 429 могут занять больше аренды),
+    аренда продлевается, чтобы другой relay не отправил сообщение повторно.
+
+    Ошибки запроса (permanent в результате send_func) не повторяются.
+    Отправленные сообщения удаляются через sent_retention_hours,
+    недоставленные - через failed_retention_hours после создания.
+    """
+
+    PURGE_INTERVAL = 3600
+
+    def __init__(self, send_func, batch_size=50, poll_interval=2.0, lease_seconds=60, max_attempts=5,
+                 sent_retention_hours=24, failed_retention_hours=168):
+        self.send_func = send_func
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.sent_retention_hours = sent_retention_hours
+        self.failed_retention_hours = failed_retention_hours
+        self._last_purge = None
+
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='outbox-relay', daemon=True)
+        self._thread.start()
+        logger.info("✅ Отправка уведомлений из outbox запущена")
+
+    def stop(self, timeout=5):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def notify(self):
+        """Разбудить relay сразу после коммита новых сообщений"""
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                processed = self.relay_batch()
+            except Exception as e:
+                logger.error(f"❌ Ошибка отправки уведомлений из outbox: {e}")
+                processed = 0
+
+            if self._last_purge is None or time.monotonic() - self._last_purge >= self.PURGE_INTERVAL:
+                self._last_purge = time.monotonic()
+                try:
+                    self.purge_finished()
+                except Exception as e:
+                    logger.error(f"❌ Ошибка очистки outbox: {e}")
+
+            # Полная пачка - вероятно, есть еще сообщения, не ждем
+            if processed < self.batch_size:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _claim_batch(self):
+        now = datetime.utcnow()
+        with session_scope() as session:
+            messages = session.query(OutboxMessage).filter(
+                or_(OutboxMessage.status == 'pending', OutboxMessage.status == 'sending'),
+                OutboxMessage.next_attempt_at <= now
+            ).order_by(OutboxMessage.id).limit(self.batch_size).with_for_update(skip_locked=True).all()
+
+            for message in messages:
+                message.status = 'sending'
+                message.next_attempt_at = now + timedelta(seconds=self.lease_seconds)
+
+            return [(m.id, m.chat_id, m.text, m.attempts or 0) for m in messages]
+
+    def _renew_lease(self, message_ids):
+        """Продление аренды сообщений пачки, пока она отправляется"""
+        with session_scope() as session:
+            session.query(OutboxMessage).filter(
+                OutboxMessage.id.in_(message_ids),
+                OutboxMessage.status == 'sending'
+            ).update({'next_attempt_at': datetime.utcnow() + timedelta(seconds=self.lease_seconds)},
+                     synchronize_session=False)
+
+    def _wait_results(self, futures):
+        """Ожидание отправки {future: message_id} с продлением аренды.
+
+        Аренда продлевается для всей пачки: результаты уже отправленных
+        сообщений записываются в БД только после завершения пачки.
+        """
+        interval = self.lease_seconds / 3
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=interval)
+            if pending:
+                try:
+                    self._renew_lease(list(futures.values()))
+                except Exception as e:
+                    logger.error(f"❌ Не удалось продлить аренду outbox: {e}")
+
+    def relay_batch(self):
+        """Отправка одной пачки; возвращает число обработанных сообщений"""
+        batch = self._claim_batch()
+        if not batch:
+            return 0
+
+        futures = {}
+        attempts_by_id = {}
+        for message_id, chat_id, text, attempts in batch:
+            futures[self.send_func(chat_id, text)] = message_id
+            attempts_by_id[message_id] = attempts
+
+        self._wait_results(futures)
+
+        results = {}
+        for future, message_id in futures.items():
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'ok': False, 'error': str(e)}
+            results[message_id] = (attempts_by_id[message_id] + 1, result)
+
+        now = datetime.utcnow()
+        with session_scope() as session:
+            messages = session.query(OutboxMessage).filter(OutboxMessage.id.in_(list(results))).all()
+            for message in messages:
+                attempts, result = results[message.id]
+                message.attempts = attempts
+                if result['ok']:
+                    message.status = 'sent'
+                    message.sent_at = now
+                    message.last_error = None
+                elif result.get('permanent'):
+                    # Чат недоступен или запрос неверен: повтор не поможет
+                    message.status = 'failed'
+                    message.last_error = result['error']
+                    logger.error(f"❌ Уведомление #{message.id} отклонено Telegram: {result['error']}")
+                elif attempts >= self.max_attempts:
+                    message.status = 'failed'
+                    message.last_error = result['error']
+                    logger.error(f"❌ Уведомление #{message.id} не доставлено после {attempts} попыток")
+                else:
+                    message.status = 'pending'
+                    message.last_error = result['error']
+                    message.next_attempt_at = now + timedelta(seconds=30 * 2 ** (attempts - 1))
+
+        return len(batch)
+
+    def purge_finished(self):
+        """Удаление отправленных и недоставленных сообщений после срока хранения.
+
+        Недоставленные сообщения отсчитываются от created_at: последняя попытка
+        бывает через минуты после создания, а срок хранения - сутки и больше.
+        """
+        now = datetime.utcnow()
+        with session_scope() as session:
+            sent = session.query(OutboxMessage).filter(
+                OutboxMessage.status == 'sent',
+                OutboxMessage.sent_at < now - timedelta(hours=self.sent_retention_hours)
+            ).delete(synchronize_session=False)
+            failed = session.query(OutboxMessage).filter(
+                OutboxMessage.status == 'failed',
+                OutboxMessage.created_at < now - timedelta(hours=self.failed_retention_hours)
+            ).delete(synchronize_session=False)
+        if sent or failed:
+            logger.info(f"🧹 Удалено из outbox: отправленных {sent}, недоставленных {failed}")
+        return sent + failed
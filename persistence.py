@@ -0,0 +1,313 @@
+"""
+Хранение состояния диалогов, user_data и chat_data вне памяти процесса
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import create_engine, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from telegram.ext import BasePersistence
+
+import database
+from config import config
+from database import BotState
+
+logger = logging.getLogger(__name__)
+
+USER_DATA = 'user_data'
+CHAT_DATA = 'chat_data'
+BOT_DATA = 'bot_data'
+
+
+def _conversation_kind(name):
+    return f'conversation:{name}'
+
+
+def _conversation_key(key):
+    return ','.join(str(part) for part in key)
+
+
+class PersistentConversations(dict):
+    """Словарь состояний ConversationHandler, читающий состояние из хранилища.
+
+    ConversationHandler при каждом обновлении вызывает get(key), поэтому
+    состояние, записанное другим процессом gunicorn, видно сразу. Запись
+    по-прежнему идет через persistence.update_conversation().
+    """
+
+    def __init__(self, persistence, name):
+        super().__init__()
+        self.persistence = persistence
+        self.name = name
+
+    def get(self, key, default=None):
+        state = self.persistence.load_conversation(self.name, key)
+        if state is None:
+            super().pop(key, None)
+            return default
+        super().__setitem__(key, state)
+        return state
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        state = self.get(key)
+        if state is None:
+            raise KeyError(key)
+        return state
+
+
+class DatabasePersistence(BasePersistence):
+    """Хранилище состояния бота в таблице bot_state.
+
+    По умолчанию использует engine из database.py (PostgreSQL); для локальной
+    разработки можно передать отдельный engine, например SQLite-файл.
+
+    Состояние диалога пишется сразу и в той же транзакции, что user_data и
+    chat_data этого обновления: следующее сообщение пользователя может
+    обработать другой воркер, и он должен увидеть новый шаг вместе с
+    данными, собранными на предыдущих шагах. PTB передает user_data уже после
+    состояния диалога, поэтому словари, выданные обработчику через
+    refresh_user_data/refresh_chat_data, запоминаются до конца обновления.
+
+    Остальные изменения user_data и chat_data (вне диалога) пишутся
+    отложенно: копятся в памяти и сбрасываются одной транзакцией раз в
+    flush_interval секунд фоновым потоком. При flush_interval=0 каждое
+    изменение пишется сразу. Чтение всегда учитывает еще не сброшенные
+    изменения этого процесса.
+
+    Перед обработкой обновления одним запросом подгружаются состояние диалога,
+    user_data и chat_data этого пользователя и чата.
+    """
+
+    def __init__(self, engine=None, flush_interval=0.2, store_user_data=True, store_chat_data=True,
+                 store_bot_data=False):
+        super().__init__(
+            store_user_data=store_user_data,
+            store_chat_data=store_chat_data,
+            store_bot_data=store_bot_data
+        )
+        self._engine = engine
+        self.flush_interval = flush_interval
+
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flusher = None
+        self._local = threading.local()
+
+    @property
+    def engine(self):
+        return self._engine or database.engine
+
+    # ===== Чтение =====
+    def _load(self, rows):
+        """Загрузка записей {(kind, key)}; возвращает {(kind, key): data}"""
+        with self._pending_lock:
+            pending = {row: self._pending[row] for row in rows if row in self._pending}
+
+        result = {}
+        missing = [row for row in rows if row not in pending]
+        if missing:
+            table = BotState.__table__
+            query = table.select().where(tuple_(table.c.kind, table.c.key).in_(missing))
+            with self.engine.connect() as conn:
+                for row in conn.execute(query):
+                    result[(row.kind, row.key)] = json.loads(row.data)
+
+        for row, data in pending.items():
+            if data is not None:
+                result[row] = json.loads(data)
+        return result
+
+    def load_conversation(self, name, key):
+        """Состояние диалога с подгрузкой user_data и chat_data того же обновления"""
+        chat_id, user_id = key[0], key[-1]
+        conv_row = (_conversation_kind(name), _conversation_key(key))
+        rows = [conv_row]
+        if self.store_user_data:
+            rows.append((USER_DATA, str(user_id)))
+        if self.store_chat_data:
+            rows.append((CHAT_DATA, str(chat_id)))
+
+        loaded = self._load(rows)
+        self._local.prefetched = {row: loaded.get(row, {}) for row in rows[1:]}
+        state = loaded.get(conv_row)
+        return tuple(state) if isinstance(state, list) else state
+
+    def _take_prefetched(self, kind, key):
+        prefetched = getattr(self._local, 'prefetched', None) or {}
+        row = (kind, str(key))
+        if row in prefetched:
+            return prefetched.pop(row)
+        return self._load([row]).get(row, {})
+
+    def get_user_data(self):
+        return defaultdict(dict)
+
+    def get_chat_data(self):
+        return defaultdict(dict)
+
+    def get_bot_data(self):
+        if not self.store_bot_data:
+            return {}
+        return self._load([(BOT_DATA, '')]).get((BOT_DATA, ''), {})
+
+    def get_conversations(self, name):
+        return PersistentConversations(self, name)
+
+    def _live_data(self):
+        """{(kind, key): словарь} user_data/chat_data текущего обновления этого потока"""
+        if not hasattr(self._local, 'live'):
+            self._local.live = {}
+            self._local.synced = {}
+        return self._local.live
+
+    def refresh_user_data(self, user_id, user_data):
+        data = self._take_prefetched(USER_DATA, user_id)
+        user_data.clear()
+        user_data.update(data)
+        self._live_data()[(USER_DATA, str(user_id))] = user_data
+
+    def refresh_chat_data(self, chat_id, chat_data):
+        data = self._take_prefetched(CHAT_DATA, chat_id)
+        chat_data.clear()
+        chat_data.update(data)
+        self._live_data()[(CHAT_DATA, str(chat_id))] = chat_data
+
+    # ===== Запись =====
+    @staticmethod
+    def _serialize(data):
+        return None if data is None else json.dumps(data, ensure_ascii=False, default=str)
+
+    def _write_rows(self, rows, sync=False):
+        """Запись {(kind, key): сериализованные данные}; sync - сразу, одной транзакцией"""
+        with self._pending_lock:
+            self._pending.update(rows)
+
+        if sync or self.flush_interval <= 0:
+            self.flush()
+            return
+
+        if self._flusher is None:
+            self._start_flusher()
+        self._wakeup.set()
+
+    def update_conversation(self, name, key, new_state):
+        rows = {(_conversation_kind(name), _conversation_key(key)): self._serialize(new_state)}
+        live = self._live_data()
+        # user_data и chat_data этого шага - в той же транзакции, что и новое состояние
+        for row in ((USER_DATA, str(key[-1])), (CHAT_DATA, str(key[0]))):
+            if row in live:
+                rows[row] = self._serialize(live[row] or None)
+                self._local.synced[row] = rows[row]
+        self._write_rows(rows, sync=True)
+
+    def _write_data(self, kind, key, data):
+        row = (kind, str(key))
+        value = self._serialize(data or None)
+        self._live_data().pop(row, None)
+        synced = self._local.synced.pop(row, False)
+        if synced == value:
+            # Уже записано вместе с состоянием диалога; повторная отложенная
+            # запись могла бы затереть более новые данные другого воркера
+            return
+        # После шага диалога данные пишутся сразу, вне диалога - отложенно
+        self._write_rows({row: value}, sync=synced is not False)
+
+    def update_user_data(self, user_id, data):
+        self._write_data(USER_DATA, user_id, data)
+
+    def update_chat_data(self, chat_id, data):
+        self._write_data(CHAT_DATA, chat_id, data)
+
+    def update_bot_data(self, data):
+        if self.store_bot_data:
+            self._write_rows({(BOT_DATA, ''): self._serialize(data)})
+
+    def _upsert(self, conn, rows):
+        table = BotState.__table__
+        values = [{'kind': kind, 'key': key, 'data': data, 'updated_at': datetime.utcnow()}
+                  for (kind, key), data in rows.items()]
+        dialect = conn.dialect.name
+
+        if dialect in ('postgresql', 'sqlite'):
+            insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            stmt = insert(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.kind, table.c.key],
+                set_={'data': stmt.excluded.data, 'updated_at': stmt.excluded.updated_at}
+            )
+            conn.execute(stmt, values)
+        else:
+            conn.execute(table.delete().where(tuple_(table.c.kind, table.c.key).in_(list(rows))))
+            conn.execute(table.insert(), values)
+
+    def flush(self):
+        """Сброс накопленных изменений одной транзакцией"""
+        with self._flush_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+
+            upserts = {row: data for row, data in pending.items() if data is not None}
+            deletes = [row for row, data in pending.items() if data is None]
+            table = BotState.__table__
+            try:
+                with self.engine.begin() as conn:
+                    if upserts:
+                        self._upsert(conn, upserts)
+                    if deletes:
+                        conn.execute(table.delete().where(tuple_(table.c.kind, table.c.key).in_(deletes)))
+            except Exception as e:
+                logger.error(f"❌ Ошибка сохранения состояния бота: {e}")
+                # Возвращаем изменения в очередь, не затирая более новые
+                with self._pending_lock:
+                    for row, data in pending.items():
+                        self._pending.setdefault(row, data)
+                raise
+
+    def _start_flusher(self):
+        with self._flush_lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name='persistence-flush', daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            # Даем накопиться изменениям, чтобы записать их одной транзакцией
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                self._wakeup.set()
+
+
+def create_persistence():
+    """Создание хранилища состояния по настройкам конфигурации"""
+    backend = config.PERSISTENCE_BACKEND
+    if not backend:
+        return None
+
+    if backend == 'database':
+        persistence = DatabasePersistence(flush_interval=config.PERSISTENCE_FLUSH_INTERVAL)
+    elif backend == 'sqlite':
+        engine = create_engine(f"sqlite:///{config.PERSISTENCE_SQLITE_PATH}")
+        BotState.__table__.create(engine, checkfirst=True)
+        persistence = DatabasePersistence(engine=engine, flush_interval=config.PERSISTENCE_FLUSH_INTERVAL)
+    else:
+        raise ValueError(f"Неизвестное хранилище состояния: {backend}")
+
+    logger.info(f"✅ Хранилище состояния бота: {backend}")
+    return persistence
@@ -0,0 +1,173 @@
+"""
+Выборочное профилирование обновлений и HTTP-запросов, снимки памяти
+"""
+
+import cProfile
+import io
+import logging
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import query_counter
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class ProfileRun:
+    """Одно профилируемое обновление или запрос"""
+
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.handler = None
+        self.state = None
+        self.profile = cProfile.Profile()
+        self.counter = query_counter.start(f"profile {name}")
+        self.started = time.perf_counter()
+        self.profile.enable()
+
+
+def annotate(handler=None, state=None):
+    """Обработчик и состояние диалога для текущего профилируемого обновления"""
+    run = getattr(_local, 'run', None)
+    if run is not None:
+        run.handler = handler
+        run.state = state
+
+
+class Profiler:
+    """Профилирование доли sample_rate обновлений и запросов под cProfile.
+
+    Прогоны дольше slow_ms сохраняются в кольцевой буфер вместе с именем
+    обработчика, состоянием диалога, числом SQL-запросов и топом функций.
+    В каждый момент профилируется не больше одного прогона: cProfile
+    нельзя включить дважды, а в Python 3.12 он видит все потоки.
+    """
+
+    def __init__(self, sample_rate=0.0, slow_ms=500, ring_size=50, top=30):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.top = top
+        self._slow = deque(maxlen=ring_size)
+        self._busy = threading.Lock()
+        self._counters = {'sampled': 0, 'slow': 0, 'skipped_busy': 0}
+
+    def start(self, kind, name):
+        """Начало прогона или None, если он не попал в выборку"""
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return None
+        if not self._busy.acquire(blocking=False):
+            self._counters['skipped_busy'] += 1
+            return None
+        try:
+            run = ProfileRun(kind, name)
+        except Exception as e:
+            self._busy.release()
+            logger.warning(f"⚠️ Не удалось запустить профилирование: {e}")
+            return None
+        _local.run = run
+        return run
+
+    def finish(self, run):
+        if run is None:
+            return
+        try:
+            run.profile.disable()
+            duration_ms = (time.perf_counter() - run.started) * 1000
+            query_counter.stop(run.counter)
+        finally:
+            _local.run = None
+            self._busy.release()
+
+        self._counters['sampled'] += 1
+        if duration_ms < self.slow_ms:
+            return
+
+        self._counters['slow'] += 1
+        stream = io.StringIO()
+        pstats.Stats(run.profile, stream=stream).sort_stats('cumulative').print_stats(self.top)
+        self._slow.append({
+            'kind': run.kind,
+            'name': run.name,
+            'handler': run.handler,
+            'state': run.state,
+            'duration_ms': round(duration_ms, 1),
+            'sql_count': run.counter.count,
+            'sql': run.counter.statements[:10],
+            'at': datetime.utcnow().isoformat(),
+            'profile': stream.getvalue()
+        })
+        logger.warning(f"🐢 Медленный {run.kind} {run.name}: {duration_ms:.0f} мс, {run.counter.count} SQL")
+
+    @contextmanager
+    def profile(self, kind, name):
+        run = self.start(kind, name)
+        try:
+            yield run
+        finally:
+            self.finish(run)
+
+    def slow_runs(self, with_profile=False):
+        runs = list(self._slow)
+        if not with_profile:
+            runs = [{k: v for k, v in run.items() if k != 'profile'} for run in runs]
+        return runs
+
+    def stats(self):
+        return dict(self._counters, sample_rate=self.sample_rate, slow_ms=self.slow_ms,
+                    stored=len(self._slow))
+
+
+class MemoryTracker:
+    """Снимки tracemalloc и разница с базовым снимком"""
+
+    def __init__(self, frames=10):
+        self.frames = frames
+        self._baseline = None
+        self._baseline_at = None
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        """Новый базовый снимок; при первом вызове включает tracemalloc"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+                logger.info("🧠 tracemalloc включен")
+            self._baseline = tracemalloc.take_snapshot()
+            self._baseline_at = datetime.utcnow().isoformat()
+        current, peak = tracemalloc.get_traced_memory()
+        return {'baseline_at': self._baseline_at, 'traced_bytes': current, 'peak_bytes': peak}
+
+    def diff(self, limit=20, group_by='lineno'):
+        """Рост памяти с момента базового снимка по строкам кода"""
+        with self._lock:
+            if self._baseline is None or not tracemalloc.is_tracing():
+                return None
+            current = tracemalloc.take_snapshot()
+            stats = current.compare_to(self._baseline, group_by)
+        current_bytes, peak = tracemalloc.get_traced_memory()
+        return {
+            'baseline_at': self._baseline_at,
+            'traced_bytes': current_bytes,
+            'peak_bytes': peak,
+            'top': [{
+                'location': str(stat.traceback[0]) if stat.traceback else None,
+                'size_diff': stat.size_diff,
+                'size': stat.size,
+                'count_diff': stat.count_diff
+            } for stat in stats[:limit]]
+        }
+
+    def stop(self):
+        with self._lock:
+            self._baseline = None
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
@@ -0,0 +1,93 @@
+"""
+Подсчет SQL-запросов на HTTP-запрос Flask и обновление Telegram
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Выполнено больше SQL-запросов, чем разрешено бюджетом"""
+
+
+class QueryCounter:
+    """Счетчик SQL-запросов текущего потока"""
+
+    def __init__(self, label):
+        self.label = label
+        self.count = 0
+        self.statements = []
+
+    def record(self, statement):
+        self.count += 1
+        if len(self.statements) < 50:
+            self.statements.append(statement)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    for counter in getattr(_local, 'counters', ()):
+        counter.record(statement)
+
+
+def start(label):
+    """Начать подсчет в текущем потоке; счетчики могут быть вложенными"""
+    counter = QueryCounter(label)
+    if not hasattr(_local, 'counters'):
+        _local.counters = []
+    _local.counters.append(counter)
+    return counter
+
+
+def stop(counter):
+    counters = getattr(_local, 'counters', [])
+    if counter in counters:
+        counters.remove(counter)
+    return counter.count
+
+
+def current_count():
+    """Число запросов самого внутреннего активного счетчика"""
+    counters = getattr(_local, 'counters', None)
+    return counters[-1].count if counters else 0
+
+
+def check_budget(counter, budget, strict=False):
+    """Проверка бюджета: предупреждение в лог или исключение в strict-режиме"""
+    if not budget or counter.count <= budget:
+        return
+    message = f"{counter.label}: {counter.count} SQL-запросов при бюджете {budget}"
+    if strict:
+        raise QueryBudgetExceeded(message + "\n" + "\n".join(counter.statements))
+    logger.warning(f"⚠️ {message}")
+
+
+@contextmanager
+def track_queries(label, budget=0, strict=False):
+    """Подсчет запросов в блоке с логированием и проверкой бюджета"""
+    counter = start(label)
+    try:
+        yield counter
+    finally:
+        stop(counter)
+    logger.debug(f"{label}: {counter.count} SQL-запросов")
+    check_budget(counter, budget, strict)
+
+
+@contextmanager
+def query_budget(max_statements, label='block'):
+    """Для тестов: блок должен выполнить не больше max_statements запросов.
+
+        with query_budget(3):
+            client.get('/api/registrations?token=...')
+    """
+    with track_queries(label, budget=max_statements, strict=True) as counter:
+        yield counter
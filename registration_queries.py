@@ -0,0 +1,163 @@
+"""
+Фильтры, проекция полей и keyset-пагинация списка заявок для API и выгрузки
+"""
+
+import base64
+from datetime import datetime, timedelta
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import joinedload
+
+from database import Registration, Event
+
+# Поле ответа -> колонка
+REGISTRATION_FIELDS = {
+    'id': Registration.id,
+    'telegram_id': Registration.telegram_id,
+    'username': Registration.username,
+    'full_name': Registration.full_name,
+    'weapon_type': Registration.weapon_type,
+    'category': Registration.category,
+    'age_group': Registration.age_group,
+    'phone': Registration.phone,
+    'experience': Registration.experience,
+    'status': Registration.status,
+    'admin_comment': Registration.admin_comment,
+    'event_id': Registration.event_id,
+    'event_name': Event.name,
+    'created_at': Registration.created_at,
+    'updated_at': Registration.updated_at,
+    'version': Registration.version
+}
+
+DEFAULT_FIELDS = (
+    'id', 'full_name', 'weapon_type', 'category', 'age_group', 'phone', 'experience',
+    'status', 'event_id', 'event_name', 'created_at', 'version'
+)
+
+
+class QueryParamError(ValueError):
+    """Некорректный параметр запроса"""
+
+
+def parse_fields(value, default=DEFAULT_FIELDS):
+    """Список полей из параметра fields=a,b,c"""
+    if not value:
+        return list(default)
+    fields = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in REGISTRATION_FIELDS]
+    if unknown:
+        raise QueryParamError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def _parse_date(value, name):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise QueryParamError(f"Invalid {name}, expected YYYY-MM-DD")
+
+
+def apply_filters(query, args):
+    """Фильтры status, event_id, weapon_type, category, age_group, date_from, date_to"""
+    for name in ('status', 'weapon_type', 'category', 'age_group'):
+        value = args.get(name)
+        if value:
+            query = query.filter(REGISTRATION_FIELDS[name] == value)
+
+    event_id = args.get('event_id')
+    if event_id:
+        try:
+            query = query.filter(Registration.event_id == int(event_id))
+        except ValueError:
+            raise QueryParamError("Invalid event_id")
+
+    date_from = args.get('date_from')
+    if date_from:
+        query = query.filter(Registration.created_at >= _parse_date(date_from, 'date_from'))
+
+    date_to = args.get('date_to')
+    if date_to:
+        # date_to включительно
+        query = query.filter(Registration.created_at < _parse_date(date_to, 'date_to') + timedelta(days=1))
+
+    return query
+
+
+def encode_cursor(created_at, reg_id):
+    raw = f"{created_at.isoformat()}|{reg_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, reg_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(reg_id)
+    except Exception:
+        raise QueryParamError("Invalid cursor")
+
+
+def parse_limit(value, default, maximum):
+    if not value:
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise QueryParamError("Invalid limit")
+    if limit < 1:
+        raise QueryParamError("Invalid limit")
+    return min(limit, maximum)
+
+
+def build_query(session, args, fields):
+    """Запрос выбранных полей заявок с фильтрами из args.
+
+    Кроме полей, в строке всегда есть _id и _created_at для курсора.
+    """
+    columns = [REGISTRATION_FIELDS[f].label(f) for f in fields]
+    query = session.query(Registration.id.label('_id'), Registration.created_at.label('_created_at'), *columns)
+    if 'event_name' in fields:
+        query = query.outerjoin(Event, Registration.event_id == Event.id)
+    return apply_filters(query, args)
+
+
+def row_to_dict(row, fields):
+    item = {}
+    for f in fields:
+        value = getattr(row, f)
+        item[f] = value.isoformat() if isinstance(value, datetime) else value
+    return item
+
+
+def fetch_page(session, args, default_limit, max_limit):
+    """Страница заявок, упорядоченных по (created_at, id) по убыванию.
+
+    Следующая страница начинается строго после последней строки предыдущей,
+    поэтому стоимость запроса не зависит от того, насколько глубоко листать.
+    Возвращает (список словарей, курсор следующей страницы или None).
+    """
+    fields = parse_fields(args.get('fields'))
+    limit = parse_limit(args.get('limit'), default_limit, max_limit)
+    query = build_query(session, args, fields)
+
+    cursor = args.get('cursor')
+    if cursor:
+        created_at, reg_id = decode_cursor(cursor)
+        query = query.filter(tuple_(Registration.created_at, Registration.id) < tuple_(created_at, reg_id))
+
+    rows = query.order_by(Registration.created_at.desc(), Registration.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]._created_at, rows[-1]._id)
+
+    return [row_to_dict(row, fields) for row in rows], next_cursor
+
+
+def user_registrations_query(session, telegram_id):
+    """Заявки пользователя, новые первыми (индекс telegram_id, created_at)"""
+    return session.query(Registration).options(joinedload(Registration.event)).filter(
+        Registration.telegram_id == telegram_id
+    ).order_by(Registration.created_at.desc())
@@ -0,0 +1,171 @@
+"""
+Поиск заявок по ФИО, телефону, username и опыту для админ-панели
+
+На PostgreSQL с расширением pg_trgm поиск идет по GIN-индексам триграмм
+(миграция 4) и ранжируется по word_similarity, поэтому находятся и имена
+с опечатками. Без расширения используется ILIKE, на SQLite - LIKE.
+
+Запрос из цифр и знаков телефона сравнивается с цифрами телефона без
+оформления: 9991234 находит +7 (999) 123-45-67 (индекс - миграция 9).
+"""
+
+import logging
+import re
+import threading
+
+from sqlalchemy import case, func, literal, literal_column, or_, text
+
+from database import Registration
+from registration_queries import QueryParamError, build_query, parse_fields, parse_limit, row_to_dict
+
+logger = logging.getLogger(__name__)
+
+MIN_QUERY_LENGTH = 3
+MAX_QUERY_LENGTH = 100
+# Поиск - для нахождения конкретного участника, а не для обхода всех заявок
+MAX_OFFSET = 1000
+
+# Вес совпадения в каждом поле
+FIELD_WEIGHTS = (
+    (Registration.full_name, 1.0),
+    (Registration.username, 0.8),
+    (Registration.phone, 0.8),
+    (Registration.experience, 0.3),
+)
+
+# Запрос, похожий на номер телефона: цифры и знаки оформления
+PHONE_QUERY = re.compile(r'^[\d\s()+\-.]+$')
+# Должно совпадать с выражением индекса из миграции 9
+PHONE_DIGITS_SQL = "regexp_replace(registrations.phone, '\\D', '', 'g')"
+PHONE_FORMATTING = (' ', '-', '(', ')', '+', '.')
+# Вес совпадения по цифрам - как у поля phone
+PHONE_DIGITS_WEIGHT = 0.8
+
+_trgm_available = {}
+_trgm_lock = threading.Lock()
+
+
+def parse_search_query(value):
+    q = ' '.join((value or '').split())
+    if len(q) < MIN_QUERY_LENGTH:
+        raise QueryParamError(f"Query must be at least {MIN_QUERY_LENGTH} characters")
+    if len(q) > MAX_QUERY_LENGTH:
+        raise QueryParamError(f"Query must be at most {MAX_QUERY_LENGTH} characters")
+    return q
+
+
+def parse_offset(value):
+    if not value:
+        return 0
+    try:
+        offset = int(value)
+    except ValueError:
+        raise QueryParamError("Invalid offset")
+    if offset < 0 or offset > MAX_OFFSET:
+        raise QueryParamError(f"Offset must be between 0 and {MAX_OFFSET}")
+    return offset
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_mode(session):
+    """'trgm', 'ilike' или 'like'; наличие pg_trgm проверяется один раз на движок"""
+    bind = session.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return 'like'
+
+    key = str(bind.url)
+    if key not in _trgm_available:
+        with _trgm_lock:
+            if key not in _trgm_available:
+                _trgm_available[key] = bool(session.execute(text(
+                    "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+                )).scalar())
+                if not _trgm_available[key]:
+                    logger.warning("⚠️ pg_trgm не установлено: поиск заявок без индекса (ILIKE)")
+    return 'trgm' if _trgm_available[key] else 'ilike'
+
+
+def _phone_digits_match(mode, q):
+    """Совпадение цифр запроса с цифрами телефона или None, если запрос не номер"""
+    digits = re.sub(r'\D', '', q)
+    if not PHONE_QUERY.match(q) or len(digits) < MIN_QUERY_LENGTH:
+        return None
+    if mode == 'like':
+        phone = Registration.phone
+        for char in PHONE_FORMATTING:
+            phone = func.replace(phone, char, '')
+    else:
+        phone = literal_column(PHONE_DIGITS_SQL)
+    return phone.like(literal(f"%{digits}%"))
+
+
+def _search_terms(mode, q):
+    """(условие отбора, выражение ранга)"""
+    pattern = f"%{_escape_like(q)}%"
+    phone_match = _phone_digits_match(mode, q)
+
+    if mode == 'trgm':
+        # ILIKE по каждому полю использует свой GIN-индекс (BitmapOr);
+        # <% находит ФИО с опечатками
+        conditions = [column.ilike(pattern, escape='\\') for column, _ in FIELD_WEIGHTS]
+        conditions.append(literal(q).op('<%')(Registration.full_name))
+        ranks = [func.word_similarity(q, func.coalesce(column, '')) * weight for column, weight in FIELD_WEIGHTS]
+        if phone_match is not None:
+            conditions.append(phone_match)
+            ranks.append(case((phone_match, PHONE_DIGITS_WEIGHT), else_=0.0))
+        return or_(*conditions), func.greatest(*ranks)
+
+    if mode == 'ilike':
+        matches = [(column.ilike(pattern, escape='\\'), weight) for column, weight in FIELD_WEIGHTS]
+    else:
+        # LIKE в SQLite не различает регистр только для латиницы:
+        # кириллицу ищем в написании как введено, строчными и с заглавной
+        variants = {q, q.lower(), q.title()}
+        matches = [
+            (or_(*[column.like(f"%{_escape_like(v)}%", escape='\\') for v in variants]), weight)
+            for column, weight in FIELD_WEIGHTS
+        ]
+
+    if phone_match is not None:
+        matches.append((phone_match, PHONE_DIGITS_WEIGHT))
+
+    condition = or_(*[match for match, _ in matches])
+    # Без триграмм ранг - вес лучшего совпавшего поля
+    rank = case(*[(match, weight) for match, weight in matches], else_=0.0)
+    return condition, rank
+
+
+def search_registrations(session, args, default_limit, max_limit):
+    """Страница найденных заявок по убыванию ранга.
+
+    Параметры: q, limit, offset, fields и фильтры как у /api/registrations.
+    Возвращает (список словарей с полем rank, offset следующей страницы или None, режим).
+    """
+    q = parse_search_query(args.get('q'))
+    fields = parse_fields(args.get('fields'))
+    limit = parse_limit(args.get('limit'), default_limit, max_limit)
+    offset = parse_offset(args.get('offset'))
+
+    mode = search_mode(session)
+    condition, rank = _search_terms(mode, q)
+
+    query = build_query(session, args, fields).add_columns(rank.label('_rank')).filter(condition)
+    rows = query.order_by(
+        rank.desc(), Registration.created_at.desc(), Registration.id.desc()
+    ).offset(offset).limit(limit + 1).all()
+
+    next_offset = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        if offset + limit <= MAX_OFFSET:
+            next_offset = offset + limit
+
+    result = []
+    for row in rows:
+        item = row_to_dict(row, fields)
+        item['rank'] = round(float(row._rank or 0), 3)
+        result.append(item)
+    return result, next_offset, mode
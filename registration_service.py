@@ -0,0 +1,216 @@
+"""
+Смена статусов заявок и уведомления участникам
+"""
+
+import logging
+from datetime import datetime
+
+from sqlalchemy import BigInteger, any_, bindparam, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from database import Event, Registration
+from outbox import enqueue_messages
+from registration_queries import QueryParamError, apply_filters
+from stats import record_status_change
+
+logger = logging.getLogger(__name__)
+
+# Действие -> новый статус
+STATUS_ACTIONS = {
+    'confirm': 'confirmed',
+    'reject': 'rejected'
+}
+
+# Максимум заявок в одном массовом изменении
+MAX_BULK_IDS = 5000
+
+# Ключи фильтра массовой смены статуса (подмножество параметров /api/registrations)
+BULK_FILTER_KEYS = ('event_id', 'weapon_type', 'category', 'age_group', 'date_from', 'date_to')
+
+
+def status_message(reg_id, status, full_name=None, weapon_type=None, category=None, event_name=None):
+    """Текст уведомления участнику о новом статусе заявки"""
+    if status == 'confirmed':
+        return (
+            f"✅ Ваша заявка #{reg_id} подтверждена!\n\n"
+            f"Рады сообщить, что ваша заявка на участие в соревнованиях по фехтованию подтверждена.\n"
+            f"Ждем вас на соревнованиях!\n\n"
+            f"Детали заявки:\n"
+            f"ФИО: {full_name}\n"
+            f"Оружие: {weapon_type}\n"
+            f"Категория: {category}\n"
+            f"Соревнование: {event_name or 'Не указано'}"
+        )
+    return (
+        f"❌ Ваша заявка #{reg_id} отклонена\n\n"
+        f"К сожалению, ваша заявка на участие в соревнованиях была отклонена.\n"
+        f"По вопросам обращайтесь к организаторам."
+    )
+
+
+def change_status(session, reg_id, new_status, expected_status=None, expected_version=None):
+    """Условная смена статуса одной заявки без блокировок.
+
+    UPDATE ... WHERE id = :id AND status = :expected [AND version = :version]
+    меняет строку, только если ее никто не изменил раньше нас, и увеличивает
+    version. Если expected_status не задан, ожидается текущий статус заявки.
+    Уведомление пишется в outbox только при реальном изменении.
+
+    Возвращает словарь измененной заявки или None, если заявки нет, она уже
+    в new_status или ее статус/версия успели измениться.
+    """
+    if expected_status is None:
+        current = session.query(Registration.status).filter(Registration.id == reg_id).scalar()
+        if current is None or current == new_status:
+            return None
+        expected_status = current
+    elif expected_status == new_status:
+        return None
+
+    conditions = [Registration.id == reg_id, Registration.status == expected_status]
+    if expected_version is not None:
+        conditions.append(Registration.version == expected_version)
+
+    stmt = update(Registration).where(*conditions).values(
+        status=new_status,
+        version=Registration.version + 1,
+        updated_at=datetime.utcnow()
+    ).execution_options(synchronize_session=False)
+
+    event_name = select(Event.name).where(Event.id == Registration.event_id).scalar_subquery()
+    columns = (Registration.id, Registration.telegram_id, Registration.full_name, Registration.weapon_type,
+               Registration.category, Registration.status, Registration.version, event_name.label('event_name'))
+
+    if session.bind.dialect.name == 'postgresql':
+        row = session.execute(stmt.returning(*columns)).first()
+    else:
+        # Без RETURNING: строку изменил именно этот UPDATE, если rowcount == 1
+        if session.execute(stmt).rowcount != 1:
+            return None
+        row = session.query(*columns).filter(Registration.id == reg_id).first()
+
+    if row is None:
+        return None
+
+    record_status_change(session, expected_status, new_status)
+    enqueue_messages(session, [(
+        row.telegram_id,
+        status_message(row.id, new_status, row.full_name, row.weapon_type, row.category, row.event_name)
+    )])
+    return {'id': row.id, 'status': row.status, 'version': row.version}
+
+
+def _bulk_filters(filters):
+    """Проверенный фильтр массовой смены статуса.
+
+    Неизвестные ключи apply_filters молча пропускает, и опечатка вроде
+    evnt_id превратила бы UPDATE в смену статуса всех заявок, поэтому
+    принимаются только ключи из BULK_FILTER_KEYS с непустыми значениями.
+    """
+    if not isinstance(filters, dict) or not filters:
+        raise QueryParamError("filter must be a non-empty object")
+    unknown = sorted(k for k in filters if k not in BULK_FILTER_KEYS)
+    if unknown:
+        raise QueryParamError(f"Unknown filter keys: {', '.join(unknown)}")
+    filters = {k: str(v) for k, v in filters.items() if v is not None and str(v) != ''}
+    if not filters:
+        raise QueryParamError("filter must contain at least one non-empty value")
+    return filters
+
+
+def parse_bulk_request(data):
+    """(новый статус, список id или None, фильтр или None) из тела запроса.
+
+    {"action": "confirm", "ids": [1, 2, 3]}
+    {"action": "reject", "filter": {"event_id": 5}}
+    """
+    if not isinstance(data, dict):
+        raise QueryParamError("Expected JSON object")
+
+    new_status = STATUS_ACTIONS.get(data.get('action'))
+    if not new_status:
+        raise QueryParamError("Unknown action, expected confirm or reject")
+
+    ids = data.get('ids')
+    filters = data.get('filter')
+    if (ids is None) == (filters is None):
+        raise QueryParamError("Expected either ids or filter")
+
+    if ids is not None:
+        if not isinstance(ids, list) or not ids:
+            raise QueryParamError("ids must be a non-empty list")
+        if len(ids) > MAX_BULK_IDS:
+            raise QueryParamError(f"Too many ids, maximum is {MAX_BULK_IDS}")
+        try:
+            ids = sorted({int(reg_id) for reg_id in ids})
+        except (TypeError, ValueError):
+            raise QueryParamError("ids must be integers")
+    else:
+        filters = _bulk_filters(filters)
+
+    return new_status, ids, filters
+
+
+def bulk_change_status(session, new_status, ids=None, filters=None, from_status='pending'):
+    """Перевод заявок из from_status в new_status одним UPDATE.
+
+    Меняются только заявки, которые на момент UPDATE находятся в from_status,
+    поэтому повторный запрос или гонка с другим админом ничего не ломают.
+    Уведомления пишутся в outbox в той же транзакции. Возвращает список id
+    измененных заявок.
+    """
+    is_postgres = session.bind.dialect.name == 'postgresql'
+
+    stmt = update(Registration).where(Registration.status == from_status)
+    if ids is not None:
+        if is_postgres:
+            # id = ANY(:ids) - один параметр-массив вместо тысяч параметров IN
+            stmt = stmt.where(Registration.id == any_(bindparam('ids', ids, type_=ARRAY(BigInteger))))
+        else:
+            stmt = stmt.where(Registration.id.in_(ids))
+    else:
+        # Фильтр в формате параметров /api/registrations (статус задает from_status)
+        filters = _bulk_filters(filters)
+        selected = apply_filters(session.query(Registration.id), filters)
+        stmt = stmt.where(Registration.id.in_(selected.scalar_subquery()))
+
+    stmt = stmt.values(
+        status=new_status,
+        version=Registration.version + 1,
+        updated_at=datetime.utcnow()
+    ).execution_options(synchronize_session=False)
+
+    columns = (Registration.id, Registration.telegram_id, Registration.full_name,
+               Registration.weapon_type, Registration.category, Registration.event_id)
+    if is_postgres:
+        rows = session.execute(stmt.returning(*columns)).all()
+    else:
+        # Без RETURNING: блокируем и читаем строки, затем обновляем именно их
+        query = session.query(*columns).filter(stmt.whereclause)
+        rows = query.with_for_update().all()
+        if rows:
+            session.execute(
+                update(Registration)
+                .where(Registration.id.in_([row.id for row in rows]))
+                .values(status=new_status, version=Registration.version + 1, updated_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+
+    if not rows:
+        return []
+
+    record_status_change(session, from_status, new_status, count=len(rows))
+
+    event_names = {}
+    event_ids = {row.event_id for row in rows if row.event_id}
+    if new_status == 'confirmed' and event_ids:
+        event_names = dict(session.query(Event.id, Event.name).filter(Event.id.in_(event_ids)).all())
+
+    enqueue_messages(session, [
+        (row.telegram_id, status_message(row.id, new_status, row.full_name, row.weapon_type,
+                                         row.category, event_names.get(row.event_id)))
+        for row in rows
+    ])
+
+    logger.info(f"✅ Статус {len(rows)} заявок изменен: {from_status} -> {new_status}")
+    return sorted(row.id for row in rows)
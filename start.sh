@@ -9,19 +9,25 @@ export PORT=${PORT:-10000}
 # Создаем папку templates если её нет
 mkdir -p templates
 
-# Выполняем миграции базы данных
+# Выполняем миграции базы данных (если схема актуальна - одна проверка версии)
 echo "🔄 Выполнение миграций базы данных..."
-python add_events_table.py || echo "Миграция событий"
-python fix_created_at.py || echo "Проверка created_at"
+python migrations.py || echo "⚠️ Миграции будут повторены при запуске приложения"
+
+# Несколько воркеров возможны только при общем хранилище состояния диалогов
+# (PERSISTENCE_BACKEND=database), иначе пользователь теряет шаг регистрации.
+# Файл SQLite не рассчитан на одновременную запись из нескольких процессов
+if [ -z "$PERSISTENCE_BACKEND" ] || [ "$PERSISTENCE_BACKEND" = "sqlite" ]; then
+    export WEB_CONCURRENCY=1
+fi
 
 # Запуск основного приложения
 echo "🚀 Запуск приложения на порту $PORT..."
 exec gunicorn --bind 0.0.0.0:$PORT \
-    --workers 1 \
-    --threads 2 \
+    --workers ${WEB_CONCURRENCY:-1} \
+    --threads ${GUNICORN_THREADS:-2} \
     --timeout 120 \
     --access-logfile - \
     --error-logfile - \
     --log-level info \
     --worker-class sync \
-    app:app
+    'app:create_app()'
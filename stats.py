@@ -0,0 +1,132 @@
+"""
+Статистика заявок: агрегация на стороне БД и счетчики по статусам
+"""
+
+import logging
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import config
+from database import Registration, RegistrationCounter, Event
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ('pending', 'confirmed', 'rejected')
+
+
+def _empty_counts():
+    counts = {status: 0 for status in STATUSES}
+    counts['total'] = 0
+    return counts
+
+
+def count_by_status(session):
+    """Число заявок по статусам одним запросом GROUP BY status"""
+    counts = _empty_counts()
+    rows = session.query(Registration.status, func.count(Registration.id)).group_by(Registration.status).all()
+    for status, count in rows:
+        counts[status] = counts.get(status, 0) + count
+        counts['total'] += count
+    return counts
+
+
+def count_by(session, column):
+    """Число заявок по статусам в разрезе колонки (weapon_type, category, age_group)"""
+    result = {}
+    rows = session.query(column, Registration.status, func.count(Registration.id)).group_by(
+        column, Registration.status
+    ).all()
+    for key, status, count in rows:
+        counts = result.setdefault(key, _empty_counts())
+        counts[status] = counts.get(status, 0) + count
+        counts['total'] += count
+    return result
+
+
+def count_by_event(session):
+    """Число заявок по статусам в разрезе соревнований"""
+    result = {}
+    rows = session.query(Registration.event_id, Event.name, Registration.status, func.count(Registration.id)).outerjoin(
+        Event, Registration.event_id == Event.id
+    ).group_by(Registration.event_id, Event.name, Registration.status).all()
+    for event_id, name, status, count in rows:
+        counts = result.setdefault(event_id, dict(_empty_counts(), event_name=name))
+        counts[status] = counts.get(status, 0) + count
+        counts['total'] += count
+    return result
+
+
+# ===== Счетчики =====
+def record_status_change(session, old_status, new_status, count=1):
+    """Учет вставки (old_status=None), смены статуса или удаления (new_status=None).
+
+    Вызывается в той же транзакции, что и изменение заявок.
+    """
+    if not config.STATS_COUNTERS_ENABLED or old_status == new_status or not count:
+        return
+    if old_status:
+        _add(session, old_status, -count)
+    if new_status:
+        _add(session, new_status, count)
+
+
+def record_deleted(session, status_counts):
+    """Учет удаления заявок: {status: число удаленных}"""
+    for status, count in status_counts.items():
+        record_status_change(session, status, None, count)
+
+
+def _add(session, status, delta):
+    """Атомарное изменение счетчика; строки всех статусов создает миграция 6"""
+    insert = {'postgresql': pg_insert, 'sqlite': sqlite_insert}.get(session.bind.dialect.name)
+    if insert is not None:
+        stmt = insert(RegistrationCounter).values(status=status, count=delta)
+        session.execute(stmt.on_conflict_do_update(
+            index_elements=[RegistrationCounter.status],
+            set_={'count': RegistrationCounter.count + delta}
+        ))
+        return
+
+    updated = session.query(RegistrationCounter).filter_by(status=status).update(
+        {'count': RegistrationCounter.count + delta},
+        synchronize_session=False
+    )
+    if not updated:
+        session.add(RegistrationCounter(status=status, count=delta))
+        session.flush()
+
+
+def rebuild_counters(session):
+    """Пересчет счетчиков по данным таблицы заявок"""
+    counts = count_by_status(session)
+    session.query(RegistrationCounter).delete(synchronize_session=False)
+    for status, count in counts.items():
+        if status != 'total':
+            session.add(RegistrationCounter(status=status, count=count))
+    session.flush()
+    logger.info(f"✅ Счетчики заявок пересчитаны: {counts}")
+    return counts
+
+
+def get_status_counts(session):
+    """Число заявок по статусам.
+
+    Со включенными счетчиками (STATS_COUNTERS_ENABLED) читается маленькая
+    таблица registration_counters, и стоимость не зависит от числа заявок.
+    Функция только читает (вызывается и на реплике): счетчики заполняет
+    миграция 6, пересчет - rebuild_counters.
+    """
+    if not config.STATS_COUNTERS_ENABLED:
+        return count_by_status(session)
+
+    rows = session.query(RegistrationCounter.status, RegistrationCounter.count).all()
+    if not rows:
+        return count_by_status(session)
+
+    counts = _empty_counts()
+    for status, count in rows:
+        counts[status] = count
+        counts['total'] += count
+    return counts
@@ -1,89 +0,0 @@
-#!/usr/bin/env python
-"""
-Скрипт для исправления схемы базы данных
-"""
-
-import sys
-import os
-
-# Добавляем корневую директорию в путь Python
-current_dir = os.path.dirname(os.path.abspath(__file__))
-parent_dir = os.path.dirname(current_dir)
-sys.path.insert(0, parent_dir)
-
-from config import config
-import psycopg2
-
-def fix_database_columns():
-    """Добавляет отсутствующие столбцы в базу данных"""
-    
-    db_url = config.DATABASE_URL
-    if db_url.startswith("postgres://"):
-        db_url = db_url.replace("postgres://", "postgresql://", 1)
-    
-    print("🔧 Исправление схемы базы данных...")
-    
-    try:
-        conn = psycopg2.connect(db_url)
-        conn.autocommit = True
-        cursor = conn.cursor()
-        
-        # 1. Проверяем и добавляем столбец admin_comment в registrations
-        print("1. Проверяем столбец 'admin_comment' в таблице 'registrations'...")
-        cursor.execute("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name = 'registrations' AND column_name = 'admin_comment'
-        """)
-        
-        if not cursor.fetchone():
-            print("   ⚠️ Столбец 'admin_comment' не найден, добавляем...")
-            cursor.execute("ALTER TABLE registrations ADD COLUMN admin_comment TEXT")
-            print("   ✅ Столбец 'admin_comment' добавлен")
-        else:
-            print("   ✅ Столбец 'admin_comment' уже существует")
-        
-        # 2. Проверяем и добавляем столбец created_at в registrations
-        print("\n2. Проверяем столбец 'created_at' в таблице 'registrations'...")
-        cursor.execute("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name = 'registrations' AND column_name = 'created_at'
-        """)
-        
-        if not cursor.fetchone():
-            print("   ⚠️ Столбец 'created_at' не найден, добавляем...")
-            cursor.execute("ALTER TABLE registrations ADD COLUMN created_at TIMESTAMP DEFAULT NOW()")
-            print("   ✅ Столбец 'created_at' добавлен")
-        else:
-            print("   ✅ Столбец 'created_at' уже существует")
-        
-        # 3. Проверяем и добавляем столбец username в registrations
-        print("\n3. Проверяем столбец 'username' в таблице 'registrations'...")
-        cursor.execute("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name = 'registrations' AND column_name = 'username'
-        """)
-        
-        if not cursor.fetchone():
-            print("   ⚠️ Столбец 'username' не найден, добавляем...")
-            cursor.execute("ALTER TABLE registrations ADD COLUMN username VARCHAR(100)")
-            print("   ✅ Столбец 'username' добавлен")
-        else:
-            print("   ✅ Столбец 'username' уже существует")
-        
-        print("\n✅ Схема базы данных проверена!")
-        
-    except Exception as e:
-        print(f"❌ Ошибка: {e}")
-        import traceback
-        traceback.print_exc()
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if 'conn' in locals():
-            conn.close()
-
-if __name__ == "__main__":
-    fix_database_columns()
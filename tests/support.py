@@ -0,0 +1,82 @@
+"""
+Общее окружение тестов: временная SQLite-база и приложение Flask
+
+Импортируется первым в каждом тестовом модуле: окружение должно быть
+задано до импорта config.
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SECRET = 'test-secret'
+ADMIN_ID = 999000
+WORKDIR = tempfile.mkdtemp(prefix='fencing-tests-')
+
+os.environ.update({
+    'TELEGRAM_TOKEN': '123456:TEST',
+    'WEBHOOK_URL': 'https://tests.invalid',
+    'DATABASE_URL': f"sqlite:///{os.path.join(WORKDIR, 'tests.db')}",
+    'SECRET_KEY': SECRET,
+    'ADMIN_TELEGRAM_IDS': str(ADMIN_ID),
+    'OUTBOX_RELAY_ENABLED': 'False',
+    'WEBHOOK_QUEUE_ENABLED': 'False',
+    'DISPATCH_WORKERS': '0',
+    'LOG_LEVEL': 'WARNING',
+})
+
+import app as app_module  # noqa: E402
+import database  # noqa: E402
+from events_cache import invalidate_events_cache  # noqa: E402
+from outbox import OutboxRelay  # noqa: E402
+
+# Relay не запускается: тесты проверяют строки outbox, а не отправку в Telegram
+app_module.outbox_relay = OutboxRelay(send_func=None)
+
+# Таблицы, которые reset_db не очищает
+KEPT_TABLES = ('admins', 'schema_version')
+
+
+def client():
+    """Тестовый клиент Flask с инициализированной БД"""
+    app_module.ensure_db()
+    return app_module.app.test_client()
+
+
+def reset_db():
+    """Удаление данных, оставшихся от предыдущих тестов"""
+    app_module.ensure_db()
+    with database.engine.begin() as conn:
+        for table in reversed(database.Base.metadata.sorted_tables):
+            if table.name not in KEPT_TABLES:
+                conn.execute(table.delete())
+    invalidate_events_cache()
+
+
+def add_event(session, name='Турнир', days=30, is_active=True):
+    from datetime import date, timedelta
+    event = database.Event(name=name, event_date=date.today() + timedelta(days=days), is_active=is_active)
+    session.add(event)
+    session.flush()
+    return event
+
+
+def add_registration(session, **fields):
+    values = {
+        'telegram_id': 1000,
+        'full_name': 'Иванов Иван',
+        'weapon_type': 'Сабля',
+        'category': 'Взрослые',
+        'age_group': '19+ лет',
+        'phone': '+79990000000',
+        'experience': 'опыт',
+        'status': 'pending',
+    }
+    values.update(fields)
+    registration = database.Registration(**values)
+    session.add(registration)
+    session.flush()
+    return registration
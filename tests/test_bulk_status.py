@@ -0,0 +1,96 @@
+"""
+Массовая смена статуса: /api/registrations/bulk-status
+"""
+
+import unittest
+from unittest import mock
+
+import support
+from support import SECRET, add_event, add_registration, database
+from config import config
+from stats import count_by_status, rebuild_counters
+
+
+class BulkStatusTest(unittest.TestCase):
+
+    def setUp(self):
+        support.reset_db()
+        self.client = support.client()
+        with database.session_scope() as session:
+            self.event_id = add_event(session, name='Кубок').id
+            other_event = add_event(session, name='Первенство').id
+            self.pending = [add_registration(session, telegram_id=100 + i, event_id=self.event_id).id
+                            for i in range(3)]
+            self.other = add_registration(session, telegram_id=200, event_id=other_event).id
+            self.rejected = add_registration(session, telegram_id=300, event_id=self.event_id,
+                                             status='rejected').id
+            rebuild_counters(session)
+        counters = mock.patch.object(config, 'STATS_COUNTERS_ENABLED', True)
+        counters.start()
+        self.addCleanup(counters.stop)
+
+    def bulk(self, body):
+        return self.client.post('/api/registrations/bulk-status', json=body, query_string={'token': SECRET})
+
+    def statuses(self):
+        with database.session_scope() as session:
+            return dict(session.query(database.Registration.id, database.Registration.status).all())
+
+    def stats(self):
+        response = self.client.get('/api/stats', query_string={'token': SECRET})
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()['statuses']
+
+    def test_ids_with_unknown_and_not_pending(self):
+        unknown = max(self.pending + [self.other, self.rejected]) + 100
+        response = self.bulk({'action': 'confirm', 'ids': self.pending[:2] + [self.rejected, unknown]})
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['changed'], sorted(self.pending[:2]))
+        self.assertEqual(sorted(data['skipped']), sorted([self.rejected, unknown]))
+
+        statuses = self.statuses()
+        self.assertEqual(statuses[self.pending[2]], 'pending')
+        self.assertEqual(statuses[self.rejected], 'rejected')
+
+        with database.session_scope() as session:
+            outbox = session.query(database.OutboxMessage.chat_id).all()
+        self.assertEqual(sorted(chat_id for chat_id, in outbox), [100, 101])
+
+    def test_filter_changes_only_matching_pending(self):
+        response = self.bulk({'action': 'reject', 'filter': {'event_id': self.event_id}})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['changed'], sorted(self.pending))
+        self.assertNotIn('skipped', response.get_json())
+        self.assertEqual(self.statuses()[self.other], 'pending')
+
+    def test_counters_follow_changes(self):
+        self.bulk({'action': 'confirm', 'ids': self.pending})
+        self.bulk({'action': 'reject', 'filter': {'event_id': self.event_id}})
+        self.bulk({'action': 'reject', 'ids': [self.other]})
+
+        stats = self.stats()
+        self.assertEqual(stats, dict(stats, pending=0, confirmed=3, rejected=2, total=5))
+        with database.session_scope() as session:
+            self.assertEqual(stats, count_by_status(session))
+
+    def test_bad_requests(self):
+        for body in (
+            {'action': 'confirm', 'filter': {'evnt_id': self.event_id}},
+            {'action': 'confirm', 'filter': {'status': 'pending'}},
+            {'action': 'confirm', 'filter': {'event_id': ''}},
+            {'action': 'confirm', 'filter': {}},
+            {'action': 'confirm', 'ids': [1], 'filter': {'event_id': self.event_id}},
+            {'action': 'confirm'},
+            {'action': 'approve', 'ids': [1]},
+            {'action': 'confirm', 'ids': ['x']},
+            {'action': 'confirm', 'ids': []},
+        ):
+            with self.subTest(body=body):
+                response = self.bulk(body)
+                self.assertEqual(response.status_code, 400, response.get_json())
+        self.assertEqual(set(self.statuses().values()), {'pending', 'rejected'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+Лента изменений /api/changes: удаления, сдвиг курсора, полная перезагрузка
+"""
+
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import support
+from support import SECRET, add_event, add_registration, database
+from change_feed import encode_cursor
+from config import config
+
+
+class ChangeFeedTest(unittest.TestCase):
+
+    def setUp(self):
+        support.reset_db()
+        self.client = support.client()
+        with database.session_scope() as session:
+            self.event_id = add_event(session, name='Кубок', days=-10).id
+            self.past = add_registration(session, telegram_id=1, event_id=self.event_id).id
+            self.kept = add_registration(session, telegram_id=2).id
+        # Без окна перекрытия: строки, полученные по курсору, не приходят повторно
+        overlap = mock.patch.object(config, 'CHANGE_FEED_OVERLAP', 0)
+        overlap.start()
+        self.addCleanup(overlap.stop)
+        self.cursor = self.changes()['cursor']
+
+    def changes(self, cursor=None, status=200):
+        params = {'token': SECRET}
+        if cursor:
+            params['cursor'] = cursor
+        response = self.client.get('/api/changes', query_string=params)
+        self.assertEqual(response.status_code, status, response.get_data(as_text=True))
+        return response.get_json()
+
+    def sync(self):
+        """Изменения после текущего курсора с переходом к следующему"""
+        data = self.changes(self.cursor)
+        self.assertFalse(data['resync'])
+        self.cursor = data['cursor']
+        return data
+
+    def test_bookmark_only(self):
+        data = self.changes()
+        self.assertTrue(data['cursor'])
+        self.assertEqual((data['registrations'], data['events']), ([], []))
+
+    def test_cursor_advances(self):
+        self.assertEqual(self.sync()['registrations'], [])
+
+        response = self.client.get(f'/api/registrations/{self.kept}/confirm', query_string={'token': SECRET})
+        self.assertEqual(response.status_code, 200)
+        data = self.sync()
+        self.assertEqual([(r['id'], r['status']) for r in data['registrations']], [(self.kept, 'confirmed')])
+
+        # Следующий курсор уже после изменения
+        self.assertEqual(self.sync()['registrations'], [])
+
+    def test_event_delete_tombstone(self):
+        response = self.client.delete(f'/api/events/{self.event_id}', query_string={'token': SECRET})
+        self.assertEqual(response.status_code, 200)
+        data = self.sync()
+        self.assertEqual(data['deleted']['events'], [self.event_id])
+        # Заявки события отвязаны и тоже приходят в ленте
+        self.assertIn(self.past, [r['id'] for r in data['registrations']])
+
+    def test_cleanup_tombstones(self):
+        response = self.client.post('/api/cleanup/execute', query_string={'token': SECRET, 'type': 'past_events'})
+        self.assertEqual(response.status_code, 202)
+        job_id = response.get_json()['job_id']
+
+        deadline = time.monotonic() + 10
+        while True:
+            job = self.client.get(f'/api/cleanup/jobs/{job_id}', query_string={'token': SECRET}).get_json()
+            if job['status'] != 'running' or time.monotonic() > deadline:
+                break
+            time.sleep(0.05)
+        self.assertEqual((job['status'], job['deleted_count']), ('done', 1))
+
+        data = self.sync()
+        self.assertEqual(data['deleted']['registrations'], [self.past])
+        self.assertEqual(data['registrations'], [])
+
+    def test_old_cursor_requires_resync(self):
+        old = datetime.utcnow() - timedelta(days=config.CHANGE_FEED_RETENTION_DAYS, hours=1)
+        data = self.changes(encode_cursor(old))
+        self.assertTrue(data['resync'])
+        self.assertTrue(data['cursor'])
+
+    def test_too_many_changes_requires_resync(self):
+        with database.session_scope() as session:
+            for i in range(3):
+                add_registration(session, telegram_id=10 + i)
+        with mock.patch.object(config, 'CHANGE_FEED_MAX_ROWS', 2):
+            self.assertTrue(self.changes(self.cursor)['resync'])
+
+    def test_invalid_cursor(self):
+        self.changes('not-a-cursor', status=400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+Условная смена статуса заявки: /api/registrations/<id>/confirm|reject
+"""
+
+import unittest
+
+import support
+from support import SECRET, add_registration, database
+
+
+class ChangeStatusTest(unittest.TestCase):
+
+    def setUp(self):
+        support.reset_db()
+        self.client = support.client()
+        with database.session_scope() as session:
+            self.reg_id = add_registration(session, telegram_id=4242).id
+
+    def action(self, action, reg_id=None, **params):
+        return self.client.get(f'/api/registrations/{reg_id or self.reg_id}/{action}',
+                               query_string=dict(params, token=SECRET))
+
+    def outbox_count(self):
+        with database.session_scope() as session:
+            return session.query(database.OutboxMessage).filter_by(chat_id=4242).count()
+
+    def test_confirm_bumps_version(self):
+        response = self.action('confirm', expected='pending', version=1)
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertTrue(data['changed'])
+        self.assertEqual((data['status'], data['version']), ('confirmed', 2))
+
+    def test_version_mismatch_is_conflict(self):
+        response = self.action('confirm', version=7)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.get_json()['version'], 1)
+        self.assertEqual(self.outbox_count(), 0)
+
+    def test_expected_status_mismatch_is_conflict(self):
+        self.assertEqual(self.action('reject').status_code, 200)
+        response = self.action('confirm', expected='pending')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.get_json()['status'], 'rejected')
+
+    def test_double_click_changes_once(self):
+        first = self.action('confirm', expected='pending').get_json()
+        second = self.action('confirm', expected='pending')
+        self.assertEqual(second.status_code, 200)
+        self.assertTrue(first['changed'])
+        self.assertFalse(second.get_json()['changed'])
+
+        with database.session_scope() as session:
+            registration = session.query(database.Registration).get(self.reg_id)
+            self.assertEqual((registration.status, registration.version), ('confirmed', 2))
+        self.assertEqual(self.outbox_count(), 1)
+
+    def test_unknown_id_is_not_found(self):
+        self.assertEqual(self.action('confirm', reg_id=self.reg_id + 1000).status_code, 404)
+        self.assertEqual(self.action('reject', reg_id=self.reg_id + 1000, version=1).status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
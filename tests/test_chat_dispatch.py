@@ -0,0 +1,81 @@
+"""
+ChatOrderedExecutor: порядок внутри чата и параллельность между чатами
+"""
+
+import random
+import threading
+import time
+import unittest
+
+import support  # noqa: F401 (окружение до импорта config)
+from chat_dispatch import ChatOrderedExecutor
+
+KEYS = ('chat-1', 'chat-2', 'chat-3')
+PER_KEY = 20
+
+
+class ChatOrderedExecutorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.processed = {key: [] for key in KEYS}
+        self.active = {key: 0 for key in KEYS}
+        self.overlaps = 0
+        # Первые обновления всех чатов должны выполняться одновременно
+        self.barrier = threading.Barrier(len(KEYS), timeout=5)
+        self.rnd = random.Random(7)
+
+    def process(self, item):
+        key, seq = item
+        with self.lock:
+            self.active[key] += 1
+            if self.active[key] > 1:
+                self.overlaps += 1
+        try:
+            if seq == 0:
+                self.barrier.wait()
+            time.sleep(self.rnd.random() / 500)
+            with self.lock:
+                self.processed[key].append(seq)
+        finally:
+            with self.lock:
+                self.active[key] -= 1
+
+    def test_order_per_chat_and_parallel_chats(self):
+        executor = ChatOrderedExecutor(self.process, workers=len(KEYS), max_pending=100)
+        try:
+            # Вперемешку: chat-1 #0, chat-2 #0, chat-3 #0, chat-1 #1, ...
+            for seq in range(PER_KEY):
+                for key in KEYS:
+                    self.assertTrue(executor.submit(key, (key, seq), timeout=5))
+        finally:
+            executor.stop(wait=True)
+
+        for key in KEYS:
+            self.assertEqual(self.processed[key], list(range(PER_KEY)), key)
+        self.assertEqual(self.overlaps, 0)
+        self.assertFalse(self.barrier.broken, 'чаты обрабатывались не параллельно')
+
+        stats = executor.stats()
+        self.assertEqual(stats['processed'], PER_KEY * len(KEYS))
+        self.assertEqual(stats['failed'], 0)
+        self.assertEqual(stats['active_chats'], 0)
+
+    def test_failure_does_not_stop_chat(self):
+        processed = []
+
+        def process(item):
+            if item == 1:
+                raise ValueError('boom')
+            processed.append(item)
+
+        executor = ChatOrderedExecutor(process, workers=2)
+        for item in range(4):
+            executor.submit('chat', item)
+        executor.stop(wait=True)
+        self.assertEqual(processed, [0, 2, 3])
+        self.assertEqual(executor.stats()['failed'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+"""
+Очистка заявок порциями и задачи очистки
+"""
+
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from sqlalchemy.exc import IntegrityError
+
+import support
+from support import add_event, add_registration, database
+import cleanup_jobs
+from cleanup_jobs import CleanupRunner, cleanup_condition, delete_chunk, get_job
+from database import CleanupJob, Registration
+
+
+def wait_job(job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        with database.session_scope() as session:
+            job = get_job(session, job_id)
+        if job['status'] != 'running' or time.monotonic() > deadline:
+            return job
+        time.sleep(0.02)
+
+
+class DeleteChunkTest(unittest.TestCase):
+
+    def setUp(self):
+        support.reset_db()
+        with database.session_scope() as session:
+            for i in range(12):
+                add_registration(session, telegram_id=i, status='rejected' if i % 3 == 0 else 'pending')
+
+    def test_chunks_until_empty(self):
+        condition = cleanup_condition('all_rejected')
+        sizes = []
+        while True:
+            with database.session_scope() as session:
+                deleted = delete_chunk(session, condition, 3)
+            self.assertTrue(all(status == 'rejected' for _, status in deleted))
+            sizes.append(len(deleted))
+            if len(deleted) < 3:
+                break
+        self.assertEqual(sizes, [3, 1])
+        with database.session_scope() as session:
+            self.assertEqual(session.query(Registration).count(), 8)
+            self.assertEqual(session.query(Registration).filter_by(status='rejected').count(), 0)
+
+
+class CleanupRunnerTest(unittest.TestCase):
+
+    def setUp(self):
+        support.reset_db()
+        with database.session_scope() as session:
+            past = add_event(session, name='Прошедший', days=-5).id
+            future = add_event(session, name='Будущий', days=5).id
+            for i in range(7):
+                add_registration(session, telegram_id=i, event_id=past)
+            add_registration(session, telegram_id=100, event_id=future)
+        self.runner = CleanupRunner(chunk_size=2, pause=0)
+
+    def test_job_runs_to_done(self):
+        job = self.runner.start('past_events')
+        self.assertEqual((job['status'], job['total']), ('running', 7))
+        job = wait_job(job['id'])
+        self.assertEqual((job['status'], job['deleted_count'], job['error']), ('done', 7, None))
+        self.assertIsNotNone(job['finished_at'])
+        with database.session_scope() as session:
+            self.assertEqual(session.query(Registration).count(), 1)
+            self.assertEqual(session.query(database.Tombstone).filter_by(entity='registration').count(), 7)
+
+    def test_error_marks_job_failed(self):
+        with mock.patch.object(cleanup_jobs, 'delete_chunk', side_effect=RuntimeError('boom')):
+            job = wait_job(self.runner.start('past_events')['id'])
+        self.assertEqual((job['status'], job['error']), ('failed', 'boom'))
+        # Тип снова можно запустить
+        self.assertEqual(wait_job(self.runner.start('past_events')['id'])['status'], 'done')
+
+    def test_running_job_is_reused(self):
+        with database.session_scope() as session:
+            session.add(CleanupJob(id='running', cleanup_type='past_events', status='running',
+                                   total=7, deleted_count=0))
+        self.assertEqual(self.runner.start('past_events')['id'], 'running')
+
+    def test_stale_job_is_replaced(self):
+        with database.session_scope() as session:
+            session.add(CleanupJob(id='stale', cleanup_type='past_events', status='running', total=7,
+                                   deleted_count=0, updated_at=datetime.utcnow() - timedelta(hours=1)))
+        job = self.runner.start('past_events')
+        self.assertNotEqual(job['id'], 'stale')
+        wait_job(job['id'])
+        with database.session_scope() as session:
+            stale = get_job(session, 'stale')
+        self.assertEqual((stale['status'], stale['error']), ('failed', 'interrupted'))
+
+    def test_concurrent_start_returns_winner(self):
+        real_preview = cleanup_jobs.preview_counts
+
+        def other_worker_starts(session):
+            # Другой воркер вставляет свою задачу между проверкой и вставкой
+            with database.engine.begin() as conn:
+                conn.execute(CleanupJob.__table__.insert().values(
+                    id='other', cleanup_type='past_events', status='running', total=7, deleted_count=0,
+                    created_at=datetime.utcnow(), updated_at=datetime.utcnow()))
+            return real_preview(session)
+
+        with mock.patch.object(cleanup_jobs, 'preview_counts', side_effect=other_worker_starts):
+            job = self.runner.start('past_events')
+        self.assertEqual(job['id'], 'other')
+        with database.session_scope() as session:
+            self.assertEqual(session.query(CleanupJob).filter_by(status='running').count(), 1)
+
+    def test_one_running_job_per_type(self):
+        with database.session_scope() as session:
+            session.add(CleanupJob(id='a', cleanup_type='all_old', status='running'))
+            session.add(CleanupJob(id='b', cleanup_type='all_rejected', status='running'))
+            session.add(CleanupJob(id='c', cleanup_type='all_old', status='done'))
+        with self.assertRaises(IntegrityError):
+            with database.session_scope() as session:
+                session.add(CleanupJob(id='d', cleanup_type='all_old', status='running'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+"""
+/health отвечает 200 до и после инициализации БД
+"""
+
+import unittest
+from unittest import mock
+
+import support
+
+
+class HealthTest(unittest.TestCase):
+
+    def test_before_probe(self):
+        with mock.patch.object(support.app_module.health_prober, 'results', return_value={}):
+            response = support.app_module.app.test_client().get('/health')
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        self.assertEqual(response.get_json()['database'], 'initializing')
+
+    def test_after_probe(self):
+        client = support.client()
+        prober = support.app_module.health_prober
+        # Только БД: проверки бота и вебхука обращаются к Telegram
+        with mock.patch.object(prober, 'checks', {'database': support.app_module.check_database}):
+            prober.probe()
+        response = client.get('/health')
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        data = response.get_json()
+        self.assertIn('replica', data)
+        self.assertIn('delivery', data)
+        self.assertTrue(data['checks']['database']['ok'])
+
+
+if __name__ == '__main__':
+    unittest.main()
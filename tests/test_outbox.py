@@ -0,0 +1,128 @@
+"""
+OutboxRelay: переходы статусов сообщений outbox и очистка
+"""
+
+import unittest
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+import support
+from support import database
+from database import OutboxMessage
+from outbox import OutboxRelay, enqueue_message
+
+
+class FakeSender:
+    """send_func relay: результат по chat_id, без запросов к Telegram"""
+
+    def __init__(self, results=None):
+        self.results = results or {}
+        self.sent = []
+
+    def __call__(self, chat_id, text):
+        self.sent.append(chat_id)
+        future = Future()
+        future.set_result(self.results.get(chat_id, {'ok': True}))
+        return future
+
+
+class OutboxRelayTest(unittest.TestCase):
+
+    def setUp(self):
+        support.reset_db()
+
+    def relay(self, sender, **kwargs):
+        return OutboxRelay(send_func=sender, **kwargs)
+
+    def enqueue(self, *chat_ids):
+        with database.session_scope() as session:
+            messages = [enqueue_message(session, chat_id, f'Сообщение {chat_id}') for chat_id in chat_ids]
+            session.flush()
+            return [message.id for message in messages]
+
+    def message(self, message_id):
+        with database.session_scope() as session:
+            message = session.query(OutboxMessage).get(message_id)
+            return {'status': message.status, 'attempts': message.attempts, 'last_error': message.last_error,
+                    'sent_at': message.sent_at, 'next_attempt_at': message.next_attempt_at}
+
+    def test_pending_to_sent(self):
+        message_id, = self.enqueue(1)
+        sender = FakeSender()
+        self.assertEqual(self.relay(sender).relay_batch(), 1)
+
+        message = self.message(message_id)
+        self.assertEqual((message['status'], message['attempts']), ('sent', 1))
+        self.assertIsNotNone(message['sent_at'])
+        # Отправленное не отправляется повторно
+        self.assertEqual(self.relay(sender).relay_batch(), 0)
+        self.assertEqual(sender.sent, [1])
+
+    def test_permanent_error_to_failed(self):
+        message_id, = self.enqueue(2)
+        sender = FakeSender({2: {'ok': False, 'permanent': True, 'error': 'Forbidden: bot was blocked'}})
+        self.relay(sender, max_attempts=5).relay_batch()
+
+        message = self.message(message_id)
+        self.assertEqual((message['status'], message['attempts']), ('failed', 1))
+        self.assertEqual(message['last_error'], 'Forbidden: bot was blocked')
+
+    def test_temporary_error_retried_later(self):
+        message_id, = self.enqueue(3)
+        sender = FakeSender({3: {'ok': False, 'error': 'timeout'}})
+        relay = self.relay(sender, max_attempts=2)
+        relay.relay_batch()
+
+        message = self.message(message_id)
+        self.assertEqual((message['status'], message['attempts']), ('pending', 1))
+        self.assertGreater(message['next_attempt_at'], datetime.utcnow())
+        # До следующей попытки сообщение не берется
+        self.assertEqual(relay.relay_batch(), 0)
+
+        with database.session_scope() as session:
+            session.query(OutboxMessage).get(message_id).next_attempt_at = datetime.utcnow()
+        relay.relay_batch()
+        message = self.message(message_id)
+        self.assertEqual((message['status'], message['attempts']), ('failed', 2))
+
+    def test_expired_lease_is_reclaimed(self):
+        message_id, = self.enqueue(4)
+        # Первый relay захватил сообщение и упал, не записав результат
+        crashed = self.relay(FakeSender(), lease_seconds=60)
+        self.assertEqual([row[0] for row in crashed._claim_batch()], [message_id])
+        self.assertEqual(self.message(message_id)['status'], 'sending')
+
+        # Пока аренда действует, другой relay сообщение не трогает
+        sender = FakeSender()
+        other = self.relay(sender)
+        self.assertEqual(other.relay_batch(), 0)
+
+        with database.session_scope() as session:
+            session.query(OutboxMessage).get(message_id).next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+        self.assertEqual(other.relay_batch(), 1)
+        self.assertEqual(sender.sent, [4])
+        self.assertEqual(self.message(message_id)['status'], 'sent')
+
+    def test_purge_sent_and_failed_after_retention(self):
+        now = datetime.utcnow()
+        with database.session_scope() as session:
+            for chat_id, status, created_hours_ago, sent_hours_ago in (
+                (1, 'sent', 30, 25),       # удаляется
+                (2, 'sent', 30, 1),        # отправлено недавно
+                (3, 'failed', 200, None),  # удаляется
+                (4, 'failed', 30, None),   # еще хранится
+                (5, 'pending', 200, None),
+            ):
+                session.add(OutboxMessage(
+                    chat_id=chat_id, text='x', status=status,
+                    created_at=now - timedelta(hours=created_hours_ago),
+                    sent_at=now - timedelta(hours=sent_hours_ago) if sent_hours_ago else None))
+
+        relay = self.relay(FakeSender(), sent_retention_hours=24, failed_retention_hours=168)
+        self.assertEqual(relay.purge_finished(), 2)
+        with database.session_scope() as session:
+            self.assertEqual(sorted(chat_id for chat_id, in session.query(OutboxMessage.chat_id)), [2, 4, 5])
+
+
+if __name__ == '__main__':
+    unittest.main()
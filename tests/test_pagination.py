@@ -0,0 +1,84 @@
+"""
+Постраничный вывод /api/registrations по курсору (created_at, id)
+"""
+
+import unittest
+from datetime import datetime, timedelta
+
+import support
+from support import SECRET, add_registration, database
+
+
+class KeysetPaginationTest(unittest.TestCase):
+
+    def setUp(self):
+        support.reset_db()
+        self.client = support.client()
+        base = datetime(2026, 3, 1, 12, 0, 0)
+        with database.session_scope() as session:
+            self.ids = []
+            # Группы по 7 заявок с одинаковым created_at: границы страниц попадают внутрь групп
+            for i in range(40):
+                created_at = base + timedelta(minutes=i // 7)
+                registration = add_registration(session, telegram_id=i, status='pending' if i % 2 else 'confirmed',
+                                                created_at=created_at, updated_at=created_at)
+                self.ids.append(registration.id)
+
+    def walk(self, limit, **params):
+        seen = []
+        cursor = None
+        for _ in range(100):
+            query = dict(params, token=SECRET, limit=limit, fields='id,created_at')
+            if cursor:
+                query['cursor'] = cursor
+            response = self.client.get('/api/registrations', query_string=query)
+            self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+            data = response.get_json()
+            self.assertLessEqual(data['count'], limit)
+            seen.extend(item['id'] for item in data['registrations'])
+            cursor = data['next_cursor']
+            if not cursor:
+                return seen
+        self.fail('курсор не закончился')
+
+    def expected(self, status=None):
+        with database.session_scope() as session:
+            query = session.query(database.Registration.id)
+            if status:
+                query = query.filter_by(status=status)
+            rows = query.order_by(database.Registration.created_at.desc(), database.Registration.id.desc())
+            return [reg_id for reg_id, in rows]
+
+    def test_every_row_once_across_ties(self):
+        for limit in (1, 3, 5, 7, 40, 100):
+            with self.subTest(limit=limit):
+                seen = self.walk(limit)
+                self.assertEqual(len(seen), len(set(seen)), 'дубликаты')
+                self.assertEqual(seen, self.expected())
+
+    def test_filtered_walk(self):
+        self.assertEqual(self.walk(4, status='pending'), self.expected('pending'))
+
+    def test_new_rows_do_not_shift_pages(self):
+        first = self.client.get('/api/registrations', query_string={'token': SECRET, 'limit': 10}).get_json()
+        with database.session_scope() as session:
+            add_registration(session, telegram_id=999)
+        rest = self.walk(10)
+        # Новая заявка - в начале списка, а продолжение с курсора ее не видит
+        cursor_rest = []
+        cursor = first['next_cursor']
+        while cursor:
+            data = self.client.get('/api/registrations',
+                                   query_string={'token': SECRET, 'limit': 10, 'cursor': cursor}).get_json()
+            cursor_rest.extend(item['id'] for item in data['registrations'])
+            cursor = data['next_cursor']
+        self.assertEqual([item['id'] for item in first['registrations']] + cursor_rest, self.expected()[1:])
+        self.assertEqual(rest, self.expected())
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/registrations', query_string={'token': SECRET, 'cursor': 'xyz'})
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""
+Состояние диалога и user_data между двумя воркерами с общей БД
+
+Вызовы повторяют порядок PTB: load_conversation и refresh_user_data перед
+обработчиком, update_conversation после него, update_user_data последним.
+"""
+
+import os
+import unittest
+
+import support  # noqa: F401 (окружение до импорта config)
+from sqlalchemy import create_engine
+
+from database import BotState
+from persistence import DatabasePersistence
+
+KEY = (5, 5)
+USER_ID = 5
+
+
+class TwoWorkersTest(unittest.TestCase):
+
+    def setUp(self):
+        path = os.path.join(support.WORKDIR, f'state_{self._testMethodName}.db')
+        self.engine = create_engine(f'sqlite:///{path}')
+        BotState.__table__.create(self.engine, checkfirst=True)
+        # Большой интервал: отложенная запись не успеет сработать сама
+        self.worker_a = DatabasePersistence(engine=self.engine, flush_interval=30)
+        self.worker_b = DatabasePersistence(engine=self.engine, flush_interval=30)
+
+    def step(self, worker, new_state, **fields):
+        """Один шаг регистрации; возвращает user_data до update_user_data"""
+        state = worker.load_conversation('registration', KEY)
+        user_data = {}
+        worker.refresh_user_data(USER_ID, user_data)
+        user_data.update(fields)
+        worker.update_conversation('registration', KEY, new_state)
+        return state, user_data
+
+    def stored_user_data(self):
+        fresh = DatabasePersistence(engine=self.engine)
+        fresh.load_conversation('registration', KEY)
+        user_data = {}
+        fresh.refresh_user_data(USER_ID, user_data)
+        return user_data
+
+    def test_next_step_on_other_worker_sees_user_data(self):
+        _, data_a = self.step(self.worker_a, 2, weapon_type='Сабля')
+
+        # Следующее сообщение попало на другой воркер до update_user_data первого
+        state, data_b = self.step(self.worker_b, 3, category='Взрослые')
+        self.assertEqual(state, 2)
+        self.assertEqual(data_b['weapon_type'], 'Сабля')
+        self.worker_b.update_user_data(USER_ID, data_b)
+
+        # Запоздавшая запись первого воркера не затирает новые поля
+        self.worker_a.update_user_data(USER_ID, data_a)
+        self.worker_a.flush()
+        self.worker_b.flush()
+        self.assertEqual(self.stored_user_data(), {'weapon_type': 'Сабля', 'category': 'Взрослые'})
+
+    def test_end_of_conversation_clears_state(self):
+        self.step(self.worker_a, 2, weapon_type='Сабля')
+        state, data = self.step(self.worker_b, None)
+        self.assertEqual(state, 2)
+        self.assertIsNone(self.worker_a.load_conversation('registration', KEY))
+
+    def test_user_data_outside_conversation_is_write_behind(self):
+        self.worker_a.refresh_user_data(USER_ID, {})
+        self.worker_a.update_user_data(USER_ID, {'lang': 'ru'})
+        self.assertEqual(self.stored_user_data(), {})
+        self.worker_a.flush()
+        self.assertEqual(self.stored_user_data(), {'lang': 'ru'})
+
+
+if __name__ == '__main__':
+    unittest.main()
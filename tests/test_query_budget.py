@@ -0,0 +1,93 @@
+"""
+Бюджет SQL-запросов списков заявок: число запросов не растет с числом строк
+
+    python -m pytest tests
+    python -m unittest discover tests
+"""
+
+import unittest
+from unittest import mock
+
+import support
+from support import SECRET, add_event, add_registration, database
+from query_counter import QueryBudgetExceeded, query_budget
+
+app_module = support.app_module
+
+# Пользователь, у которого заявки на разные события
+TELEGRAM_ID = 1000
+
+
+class QueryBudgetTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        support.reset_db()
+        with database.session_scope() as session:
+            events = [add_event(session, name=f'Турнир {i}', days=i) for i in range(5)]
+            for i in range(60):
+                add_registration(
+                    session,
+                    telegram_id=TELEGRAM_ID + i % 20,
+                    full_name=f'Участник {i}',
+                    phone=f'+7999000{i:04d}',
+                    status='pending' if i % 3 else 'confirmed',
+                    event_id=events[(i + i // 20) % len(events)].id
+                )
+        cls.client = support.client()
+
+    def get(self, path, **params):
+        response = self.client.get(path, query_string=dict(params, token=SECRET))
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        return response
+
+    def test_registrations_page(self):
+        with query_budget(1, 'GET /api/registrations'):
+            data = self.get('/api/registrations', limit=10).get_json()
+        self.assertEqual(data['count'], 10)
+        self.assertTrue(data['next_cursor'])
+
+    def test_registrations_pages_with_event_name(self):
+        # Название события - в том же запросе (JOIN), а не запрос на строку
+        cursor = self.get('/api/registrations', limit=10).get_json()['next_cursor']
+        for limit in (5, 50):
+            with query_budget(1, f'GET /api/registrations limit={limit}'):
+                data = self.get('/api/registrations', limit=limit, cursor=cursor,
+                                fields='id,full_name,event_name', status='pending').get_json()
+            self.assertTrue(data['registrations'])
+            self.assertTrue(all('event_name' in item for item in data['registrations']))
+
+    def test_events(self):
+        with query_budget(1, 'GET /api/events'):
+            data = self.get('/api/events').get_json()
+        self.assertEqual(len(data['events']), 5)
+
+    def test_simple_admin_page(self):
+        # Счетчики статусов и 50 последних заявок с событиями (joinedload)
+        with query_budget(2, 'GET /admin?simple=1'):
+            response = self.client.get('/admin', query_string={'simple': '1'})
+        self.assertEqual(response.status_code, 200)
+        page = response.get_data(as_text=True)
+        for i in range(5):
+            self.assertIn(f'Турнир {i}', page)
+
+    def test_my_registrations(self):
+        update = mock.MagicMock()
+        update.message.from_user.id = TELEGRAM_ID
+        with query_budget(1, '/myregistrations'):
+            app_module.view_registrations(update, mock.MagicMock())
+
+        text = update.message.reply_text.call_args[0][0]
+        self.assertEqual(text.count('*Заявка #'), 3)
+        # Заявки пользователя относятся к разным событиям
+        self.assertEqual(len({line for line in text.splitlines() if line.startswith('Соревнование:')}), 3)
+
+    def test_budget_exceeded(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            with query_budget(1, 'два запроса'):
+                self.get('/api/events')
+                self.get('/api/events')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+"""
+Поиск заявок /api/registrations/search на SQLite (режим LIKE)
+"""
+
+import unittest
+
+import support
+from support import SECRET, add_registration, database
+
+
+class SearchTest(unittest.TestCase):
+
+    def setUp(self):
+        support.reset_db()
+        self.client = support.client()
+        with database.session_scope() as session:
+            self.plain = add_registration(session, telegram_id=1, phone='+79991230005').id
+            self.formatted = add_registration(session, telegram_id=2, phone='+7 (999) 123-00-05').id
+            add_registration(session, telegram_id=3, phone='+79991230006')
+            self.percent = add_registration(session, telegram_id=4, experience='100% посещаемость').id
+            add_registration(session, telegram_id=5, experience='1000 боев')
+            self.underscore = add_registration(session, telegram_id=6, username='ivan_ov').id
+            add_registration(session, telegram_id=7, username='ivanxov')
+
+    def search(self, q):
+        response = self.client.get('/api/registrations/search',
+                                   query_string={'token': SECRET, 'q': q, 'fields': 'id'})
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        data = response.get_json()
+        self.assertEqual(data['mode'], 'like')
+        return sorted(item['id'] for item in data['registrations'])
+
+    def test_phone_with_spaces(self):
+        self.assertEqual(self.search('999 123 0005'), sorted([self.plain, self.formatted]))
+
+    def test_phone_with_formatting(self):
+        self.assertEqual(self.search('(999) 123-00-05'), sorted([self.plain, self.formatted]))
+
+    def test_like_wildcards_are_literal(self):
+        self.assertEqual(self.search('100%'), [self.percent])
+        self.assertEqual(self.search('n_o'), [self.underscore])
+        self.assertEqual(self.search('%%%'), [])
+        self.assertEqual(self.search('___'), [])
+
+    def test_short_query(self):
+        response = self.client.get('/api/registrations/search', query_string={'token': SECRET, 'q': '99'})
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+"""
+Очередь входящих обновлений Telegram для асинхронной обработки вебхука
+"""
+
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ('drop', 'reject')
+
+
+class UpdateQueue:
+    """Ограниченная очередь обновлений с пулом рабочих потоков.
+
+    Маршрут /webhook только кладет JSON обновления в очередь и сразу отвечает
+    Telegram, а обработка (БД, отправка сообщений) идет в рабочих потоках.
+
+    При переполнении очередь сначала ждет put_timeout секунд (back-pressure),
+    затем применяет политику overflow:
+        'drop'   - обновление отбрасывается, Telegram получает 200;
+        'reject' - put() возвращает False, маршрут отвечает 503 и Telegram
+                   повторит доставку позже.
+    """
+
+    def __init__(self, process_func, maxsize=1000, workers=2, overflow='reject', put_timeout=0.5):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Неизвестная политика переполнения: {overflow}")
+
+        self.process_func = process_func
+        self.maxsize = maxsize
+        self.workers = max(1, workers)
+        self.overflow = overflow
+        self.put_timeout = put_timeout
+
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._threads = []
+        self._running = False
+        self._lock = threading.Lock()
+        self._counters = {
+            'accepted': 0,
+            'processed': 0,
+            'failed': 0,
+            'dropped': 0,
+            'rejected': 0
+        }
+
+    def _incr(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def start(self):
+        """Запуск рабочих потоков"""
+        if self._running:
+            return
+        self._running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'update-queue-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"✅ Очередь обновлений запущена: {self.workers} потоков, размер {self.maxsize}")
+
+    def stop(self, timeout=5):
+        """Остановка рабочих потоков после обработки уже принятых обновлений"""
+        if not self._running:
+            return
+        self._running = False
+        for _ in self._threads:
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        logger.info("🛑 Очередь обновлений остановлена")
+
+    def put(self, payload):
+        """Постановка обновления в очередь.
+
+        Возвращает False, если обновление не принято и Telegram нужно
+        попросить повторить доставку.
+        """
+        try:
+            self._queue.put(payload, timeout=self.put_timeout)
+        except queue.Full:
+            if self.overflow == 'drop':
+                self._incr('dropped')
+                logger.warning(f"⚠️ Очередь обновлений переполнена, обновление {payload.get('update_id')} отброшено")
+                return True
+            self._incr('rejected')
+            logger.warning(f"⚠️ Очередь обновлений переполнена, обновление {payload.get('update_id')} отклонено")
+            return False
+
+        self._incr('accepted')
+        return True
+
+    def _worker(self):
+        while True:
+            payload = self._queue.get()
+            try:
+                if payload is None:
+                    return
+                self.process_func(payload)
+                self._incr('processed')
+            except Exception as e:
+                self._incr('failed')
+                logger.error(f"❌ Ошибка обработки обновления из очереди: {e}")
+            finally:
+                self._queue.task_done()
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        """Состояние очереди для мониторинга"""
+        with self._lock:
+            counters = dict(self._counters)
+        counters.update({
+            'running': self._running,
+            'depth': self.depth,
+            'maxsize': self.maxsize,
+            'workers': self.workers,
+            'overflow': self.overflow
+        })
+        return counters
@@ -1,7 +1,9 @@
 """
 WSGI файл для запуска на Render
 """
-from app import app
+from app import create_app
+
+app = create_app()
 
 if __name__ == "__main__":
     app.run()